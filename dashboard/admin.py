@@ -1,9 +1,20 @@
 from django.contrib import admin
-from .models import UserProfile, Container, AIProviderSettings, SiteBranding, ContainerConfig
+from .models import (
+    AIProviderSettings,
+    Container,
+    ContainerConfig,
+    Conversation,
+    Message,
+    SiteBranding,
+    UserProfile,
+)
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'api_quota')
+    list_display = (
+        'user', 'api_quota', 'quota_allowance', 'quota_period', 'quota_window_start'
+    )
+    list_filter = ('quota_period',)
 
 @admin.register(Container)
 class ContainerAdmin(admin.ModelAdmin):
@@ -14,7 +25,7 @@ class ContainerAdmin(admin.ModelAdmin):
 
 @admin.register(AIProviderSettings)
 class AIProviderSettingsAdmin(admin.ModelAdmin):
-    list_display = ('provider_name', 'default_model', 'is_active')
+    list_display = ('provider_name', 'default_model', 'requests_per_minute', 'is_active')
     list_filter = ('is_active',)
 
 
@@ -28,3 +39,19 @@ class ContainerConfigAdmin(admin.ModelAdmin):
     list_display = ('key', 'name', 'route', 'is_active', 'order')
     list_filter = ('is_active',)
     ordering = ('order',)
+
+
+class MessageInline(admin.TabularInline):
+    model = Message
+    fields = ('role', 'text', 'created_at')
+    readonly_fields = ('role', 'text', 'created_at')
+    extra = 0
+    can_delete = False
+
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ('title', 'user', 'container', 'created_at')
+    list_filter = ('container',)
+    search_fields = ('title',)
+    inlines = [MessageInline]
@@ -1,33 +1,42 @@
 import logging
-from django.core.cache import cache
+from django.conf import settings
 
+from .ai_cache import get_stale_while_revalidate
 from .ai_service import call_gemini, is_configured, genai, time
 
 logger = logging.getLogger(__name__)
 
 
-def generate_greeting(name: str) -> str:
-    """Return a personalized greeting for the given user name.
-
-    Results are cached to avoid excessive API requests.
-    """
-    cache_key = f"ai_greeting:{name}"
-    greeting = cache.get(cache_key)
-    if greeting:
-        return greeting
-
-    # Fallback if API key isn't configured
+def compose_greeting(name: str) -> str:
+    """Ask Gemini for a greeting, falling back to a static one on failure."""
     if not is_configured():
-        greeting = f"Welcome back, {name}!"
-        cache.set(cache_key, greeting, 3600)
-        return greeting
+        return f"Welcome back, {name}!"
 
     prompt = f"Craft a short, warm greeting for a user named {name}."
     try:
-        greeting = call_gemini(prompt)
+        return call_gemini(prompt, site="greeting")
     except Exception as e:
         logger.warning(f"AI greeting generation failed: {e}")
-        greeting = f"Welcome back, {name}!"
+        return f"Welcome back, {name}!"
+
+
+def _schedule_greeting_refresh(name: str) -> None:
+    from .tasks import refresh_greeting_task
 
-    cache.set(cache_key, greeting, 3600)
-    return greeting
+    refresh_greeting_task.delay(name)
+
+
+def generate_greeting(name: str) -> str:
+    """Return a personalized greeting for the given user name.
+
+    Results are cached to avoid excessive API requests; stale greetings are
+    served while a background task refreshes them.
+    """
+    return get_stale_while_revalidate(
+        f"ai_greeting:{name}",
+        lambda: compose_greeting(name),
+        lambda: _schedule_greeting_refresh(name),
+        soft_ttl=settings.AI_GREETING_SOFT_TTL,
+        hard_ttl=settings.AI_GREETING_HARD_TTL,
+        cache_name="greeting",
+    )
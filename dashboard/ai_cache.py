@@ -0,0 +1,277 @@
+"""Caching helpers for AI results shared across web and worker processes.
+
+All state lives in the Django cache, so with ``CACHE_URL`` pointing at Redis
+the coordination below works across gunicorn processes and hosts.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from django.core.cache import cache
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ComputeInProgress(Exception):
+    """Raised by :func:`get_or_compute` when another caller is still computing."""
+
+
+def get_or_compute(
+    key: str,
+    compute: Callable[[], Any],
+    timeout: int,
+    *,
+    lock_timeout: int | None = None,
+    wait_timeout: float | None = None,
+    poll_interval: float = 0.05,
+    compute_on_timeout: bool = True,
+) -> Any:
+    """Return the cached value for ``key``, computing it at most once on a miss.
+
+    The first caller to miss takes a lock and runs ``compute``; other callers
+    wait for the result key to be filled and reuse it.  If the lock holder
+    fails, a waiter takes over.  A waiter that gives up after
+    ``wait_timeout`` seconds computes the value itself, or with
+    ``compute_on_timeout=False`` raises :class:`ComputeInProgress`.  Both
+    timeouts default to the worst-case duration of a default ``call_gemini``,
+    so the lock does not expire and waiters do not give up while the leader
+    is still retrying.
+    """
+
+    if lock_timeout is None or wait_timeout is None:
+        from .ai_service import call_budget
+
+        budget = call_budget()
+        lock_timeout = budget if lock_timeout is None else lock_timeout
+        wait_timeout = budget if wait_timeout is None else wait_timeout
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + wait_timeout
+    delay = poll_interval
+    while True:
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.add(lock_key, 1, lock_timeout):
+            try:
+                value = compute()
+                cache.set(key, value, timeout)
+                return value
+            finally:
+                cache.delete(lock_key)
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+    if not compute_on_timeout:
+        raise ComputeInProgress(f"{key} is still being computed")
+    logger.warning("Timed out waiting for %s; computing without lock", key)
+    value = compute()
+    cache.set(key, value, timeout)
+    return value
+
+
+# How long a background refresh may run before another one can be scheduled.
+REFRESH_LOCK_TIMEOUT = 60
+
+
+def _envelope(value: Any, soft_ttl: int) -> dict:
+    return {"value": value, "fresh_until": time.time() + soft_ttl}
+
+
+def set_with_soft_ttl(key: str, value: Any, soft_ttl: int, hard_ttl: int) -> None:
+    """Store ``value`` as fresh for ``soft_ttl`` and retained for ``hard_ttl``."""
+
+    cache.set(key, _envelope(value, soft_ttl), hard_ttl)
+    cache.delete(f"{key}:refresh")
+
+
+def set_many_with_soft_ttl(entries: dict, soft_ttl: int, hard_ttl: int) -> None:
+    """Store several values written by :func:`set_with_soft_ttl` at once."""
+
+    cache.set_many(
+        {key: _envelope(value, soft_ttl) for key, value in entries.items()}, hard_ttl
+    )
+
+
+def _schedule_refresh(key: str, refresh: Callable[[], Any]) -> None:
+    refresh_key = f"{key}:refresh"
+    if cache.add(refresh_key, 1, REFRESH_LOCK_TIMEOUT):
+        try:
+            refresh()
+        except Exception as e:
+            logger.warning("Could not schedule refresh of %s: %s", key, e)
+            cache.delete(refresh_key)
+
+
+def get_many_values(
+    keys,
+    refresh: Callable[[], Any] | None = None,
+    *,
+    refresh_key: str = "",
+    cache_name: str = "default",
+) -> dict:
+    """Return ``{key: value}`` for every cached entry, fresh or stale.
+
+    When any returned entry is stale, ``refresh`` is called at most once per
+    refresh window, which is tracked under ``refresh_key``.  The lookup is
+    counted in :mod:`dashboard.metrics` under ``cache_name``.
+    """
+
+    keys = list(keys)
+    entries = cache.get_many(keys)
+    now = time.time()
+    stale = any(entry["fresh_until"] <= now for entry in entries.values())
+    if len(entries) < len(keys):
+        metrics.record_cache(cache_name, "miss")
+    else:
+        metrics.record_cache(cache_name, "stale" if stale else "hit")
+    if refresh and stale:
+        _schedule_refresh(refresh_key, refresh)
+    return {key: entry["value"] for key, entry in entries.items()}
+
+
+def get_stale_while_revalidate(
+    key: str,
+    compute: Callable[[], Any],
+    refresh: Callable[[], Any],
+    *,
+    soft_ttl: int,
+    hard_ttl: int,
+    cache_name: str = "default",
+) -> Any:
+    """Return the cached value for ``key``, refreshing it in the background once stale.
+
+    Entries younger than ``soft_ttl`` are returned as-is.  Older entries are
+    still returned immediately, and ``refresh`` is called (at most once per
+    refresh window) to schedule a background recomputation that should store
+    its result with :func:`set_with_soft_ttl`.  Only a miss, i.e. an entry
+    older than ``hard_ttl``, blocks on ``compute``.  Lookups are counted in
+    :mod:`dashboard.metrics` under ``cache_name``.
+    """
+
+    computed = False
+
+    def fill() -> dict:
+        nonlocal computed
+        computed = True
+        return _envelope(compute(), soft_ttl)
+
+    entry = get_or_compute(key, fill, hard_ttl)
+    stale = entry["fresh_until"] <= time.time()
+    if computed:
+        metrics.record_cache(cache_name, "miss")
+    else:
+        metrics.record_cache(cache_name, "stale" if stale else "hit")
+    if stale:
+        _schedule_refresh(key, refresh)
+    return entry["value"]
+
+
+class ResponseCache:
+    """Two-level cache of model responses keyed by a hash of the request.
+
+    An in-process LRU of at most ``local_size`` entries sits in front of the
+    shared Django cache.  Entries keep their own expiry time so a value
+    promoted from the shared cache never outlives its original TTL.  Values
+    larger than ``max_bytes`` are not cached.
+    """
+
+    prefix = "gemini:resp:"
+
+    def __init__(self, local_size: int = 256, max_bytes: int = 65536):
+        self.local_size = local_size
+        self.max_bytes = max_bytes
+        self._local: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"local_hits": 0, "remote_hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, **params: Any) -> str:
+        """Return a content hash of the model, prompt and request parameters."""
+
+        payload = json.dumps(
+            {"model": model_name, "prompt": prompt, "params": params},
+            sort_keys=True,
+            default=repr,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _remember(self, key: str, expires_at: float, value: Any) -> None:
+        with self._lock:
+            self._local[key] = (expires_at, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def get(self, key: str) -> Any:
+        """Return the cached value for ``key`` or ``None``."""
+
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._local[key]
+                entry = None
+            if entry is not None:
+                self._local.move_to_end(key)
+        if entry is not None:
+            self._count("local_hits")
+            metrics.record_cache("response", "hit")
+            return entry[1]
+
+        remote = cache.get(self.prefix + key)
+        if remote is not None and remote["expires_at"] > now:
+            self._remember(key, remote["expires_at"], remote["value"])
+            self._count("remote_hits")
+            metrics.record_cache("response", "hit")
+            return remote["value"]
+        self._count("misses")
+        metrics.record_cache("response", "miss")
+        return None
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        """Store ``value`` under ``key`` for ``ttl`` seconds in both levels."""
+
+        if ttl <= 0 or len(str(value)) > self.max_bytes:
+            return
+        expires_at = time.time() + ttl
+        self._remember(key, expires_at, value)
+        cache.set(self.prefix + key, {"value": value, "expires_at": expires_at}, ttl)
+
+    def clear_local(self) -> None:
+        """Drop the in-process level and reset the counters."""
+
+        with self._lock:
+            self._local.clear()
+            self.stats = dict.fromkeys(self.stats, 0)
+
+
+response_cache = ResponseCache(
+    local_size=int(os.environ.get("GEMINI_RESPONSE_CACHE_LOCAL_SIZE", "256")),
+    max_bytes=int(os.environ.get("GEMINI_RESPONSE_CACHE_MAX_BYTES", "65536")),
+)
+
+
+__all__ = [
+    "ComputeInProgress",
+    "ResponseCache",
+    "get_many_values",
+    "get_or_compute",
+    "get_stale_while_revalidate",
+    "response_cache",
+    "set_many_with_soft_ttl",
+    "set_with_soft_ttl",
+]
@@ -5,28 +5,58 @@ provides helper functions used throughout the dashboard app.  Modules should
 import from here rather than configuring Gemini individually.
 """
 
+import asyncio
+import functools
 import logging
 import os
+import threading
 import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures import wait
+from typing import Callable
 
 import google.generativeai as genai
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from . import metrics, providers
+from .ai_cache import response_cache
+from .circuit_breaker import CircuitOpenError, get_breaker
+from .rate_limit import ACQUIRE_TIMEOUT, RateLimitExceeded, aacquire, acquire
 
 logger = logging.getLogger(__name__)
 
 
 _configured = False
+_transport = "grpc"
 
 
 def configure() -> bool:
     """Configure the Gemini SDK using ``GOOGLE_API_KEY`` if available.
 
-    Returns ``True`` if configuration succeeded, otherwise logs a warning and
-    returns ``False``.
+    ``GEMINI_API_ENDPOINT`` redirects calls to another server, such as the
+    local stand-in from :mod:`dashboard.fake_gemini`, over the REST transport
+    (override with ``GEMINI_TRANSPORT``).  Returns ``True`` if configuration
+    succeeded, otherwise logs a warning and returns ``False``.
     """
 
-    global _configured
+    global _configured, _transport
     api_key = os.environ.get("GOOGLE_API_KEY")
-    if api_key:
+    endpoint = os.environ.get("GEMINI_API_ENDPOINT")
+    if api_key and endpoint:
+        # Alternate endpoints such as ``manage.py fake_gemini`` speak REST.
+        _transport = os.environ.get("GEMINI_TRANSPORT", "rest")
+        genai.configure(
+            api_key=api_key,
+            transport=_transport,
+            client_options={"api_endpoint": endpoint},
+        )
+        _configured = True
+    elif api_key:
+        _transport = "grpc"
         genai.configure(api_key=api_key)
         _configured = True
     else:
@@ -47,20 +77,248 @@ def is_configured() -> bool:
     return bool(os.environ.get("GOOGLE_API_KEY"))
 
 
-def get_model(model_name: str, **kwargs) -> genai.GenerativeModel:
-    """Return a configured ``GenerativeModel`` instance.
+def supports_async() -> bool:
+    """Return ``True`` if the SDK's ``*_async`` methods work with the transport.
 
-    Raises ``RuntimeError`` with a meaningful message if the API key is
-    missing.
+    The SDK only has an async client for gRPC; under REST async callers must
+    run the blocking call in a thread instead.
     """
 
+    return _transport != "rest"
+
+
+# Process-wide registry of ``GenerativeModel`` instances keyed by model name and
+# constructor arguments.  Entries are evicted least-recently-used once the
+# registry grows beyond ``GEMINI_MODEL_REGISTRY_SIZE``.
+MODEL_REGISTRY_SIZE = int(os.environ.get("GEMINI_MODEL_REGISTRY_SIZE", "32"))
+
+_model_registry: "OrderedDict[tuple, genai.GenerativeModel]" = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def _registry_key(model_name: str, kwargs: dict) -> tuple:
+    """Return a hashable registry key for ``model_name`` and its kwargs."""
+
+    return (model_name,) + tuple(
+        (name, repr(value)) for name, value in sorted(kwargs.items())
+    )
+
+
+def clear_model_registry() -> None:
+    """Drop every cached ``GenerativeModel`` instance."""
+
+    with _registry_lock:
+        _model_registry.clear()
+
+
+def ensure_configured() -> None:
+    """Configure the SDK if needed; raise ``RuntimeError`` without an API key."""
+
     if not is_configured():
         raise RuntimeError("Gemini AI not configured: missing GOOGLE_API_KEY")
 
     if not _configured:
         configure()
 
-    return genai.GenerativeModel(model_name, **kwargs)
+
+def get_model(model_name: str, **kwargs) -> genai.GenerativeModel:
+    """Return a configured ``GenerativeModel`` instance.
+
+    Instances are reused across calls with the same model name, system
+    instruction and generation config.  ``cached_content`` names
+    provider-side cached context (see :mod:`dashboard.context_cache`) that
+    replaces the system instruction.  Raises ``RuntimeError`` with a
+    meaningful message if the API key is missing.
+    """
+
+    ensure_configured()
+    key = _registry_key(model_name, kwargs)
+    with _registry_lock:
+        model = _model_registry.get(key)
+        if model is not None:
+            _model_registry.move_to_end(key)
+            return model
+
+    if "cached_content" in kwargs:
+        model = genai.GenerativeModel.from_cached_content(**kwargs)
+    else:
+        model = genai.GenerativeModel(model_name, **kwargs)
+    with _registry_lock:
+        model = _model_registry.setdefault(key, model)
+        _model_registry.move_to_end(key)
+        while len(_model_registry) > MODEL_REGISTRY_SIZE:
+            _model_registry.popitem(last=False)
+    return model
+
+
+# Generation config of the suggestion and bundle calls, which expect JSON.
+JSON_RESPONSE = {"response_mime_type": "application/json"}
+# Model kwargs pre-built by warm_up(): plain calls and JSON responses.
+WARM_MODEL_KWARGS = ({}, {"generation_config": JSON_RESPONSE})
+
+
+def warm_up() -> None:
+    """Reset the model registry and pre-build models after a process fork.
+
+    gRPC channels held by models created in a parent process are not safe to
+    use in a forked child, so the registry is cleared first.  Each model
+    listed in the comma-separated ``GEMINI_WARM_MODELS`` variable is then
+    instantiated with every ``WARM_MODEL_KWARGS`` entry, so the first plain
+    or JSON request in the new worker skips setup.  Chat models depend on
+    each container's system instruction and are built on first use.
+    """
+
+    clear_model_registry()
+    configure()
+    if not is_configured():
+        return
+    names = os.environ.get("GEMINI_WARM_MODELS", "gemini-1.5-flash,gemini-2.5-flash")
+    for name in filter(None, (n.strip() for n in names.split(","))):
+        for kwargs in WARM_MODEL_KWARGS:
+            get_model(name, **kwargs)
+
+
+def _reset_after_fork() -> None:
+    """Give a forked child its own empty registry and lock."""
+
+    global _model_registry, _registry_lock
+    _model_registry = OrderedDict()
+    _registry_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# Default lifetime of cached ``call_gemini`` responses; ``0`` disables caching.
+RESPONSE_CACHE_TTL = int(os.environ.get("GEMINI_RESPONSE_CACHE_TTL", "300"))
+
+
+def call_budget(timeout: int = 10, max_retries: int = 3) -> int:
+    """Return the longest ``call_gemini`` can run with these arguments.
+
+    Each attempt may wait ``ACQUIRE_TIMEOUT`` for a rate-limit slot before
+    its own ``timeout``, and attempts are separated by 1, 2, 4... seconds of
+    backoff.  Callers waiting on another process's call use this as a bound.
+    """
+
+    backoff = 2 ** (max_retries - 1) - 1
+    return max_retries * (timeout + ACQUIRE_TIMEOUT) + backoff
+
+
+def _model_kwargs(
+    system_instruction: str | None, generation_config: dict | None
+) -> dict:
+    kwargs = {}
+    if system_instruction:
+        kwargs["system_instruction"] = system_instruction
+    if generation_config:
+        kwargs["generation_config"] = generation_config
+    return kwargs
+
+
+# Hedging: when enabled, an attempt that has not answered within the
+# ``GEMINI_HEDGE_PERCENTILE`` quantile of the provider's recent latency is
+# duplicated, the first response wins and the other is discarded.  At most
+# ``GEMINI_HEDGE_BUDGET_PER_MINUTE`` hedges are sent fleet-wide per minute.
+HEDGE_ENABLED = os.environ.get("GEMINI_HEDGING", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.environ.get("GEMINI_HEDGE_PERCENTILE", "0.95"))
+HEDGE_BUDGET_PER_MINUTE = int(os.environ.get("GEMINI_HEDGE_BUDGET_PER_MINUTE", "60"))
+
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("GEMINI_HEDGE_WORKERS", "16")),
+    thread_name_prefix="gemini-hedge",
+)
+
+
+def _hedge_delay(provider_name: str) -> float | None:
+    """Return how long to wait before hedging, or ``None`` without history."""
+
+    return providers.router.stats.percentile(provider_name, HEDGE_PERCENTILE)
+
+
+def _take_hedge_budget() -> bool:
+    """Consume one hedge from the shared per-minute budget if any is left."""
+
+    key = f"gemini:hedges:{int(time.time() // 60)}"
+    cache.add(key, 0, 120)
+    return cache.incr(key) <= HEDGE_BUDGET_PER_MINUTE
+
+
+def _timed(provider_name: str, call):
+    """Wrap ``call`` so each invocation's latency and outcome are recorded."""
+
+    def run():
+        with providers.router.stats.track(provider_name):
+            return call()
+
+    return run
+
+
+def _atimed(provider_name: str, make_call):
+    """Async :func:`_timed`; a cancelled call is not recorded."""
+
+    async def run():
+        with providers.router.stats.track(provider_name):
+            return await make_call()
+
+    return run
+
+
+def _run_hedged(call, delay: float, take_slot):
+    """Run ``call`` and, if it is still pending after ``delay``, race a duplicate.
+
+    The duplicate is only sent if the hedge budget and ``take_slot()``, a
+    non-blocking rate-limit acquire, both allow it.
+    """
+
+    primary = _hedge_executor.submit(call)
+    try:
+        return primary.result(timeout=delay)
+    except FuturesTimeoutError:
+        pass
+    if not (_take_hedge_budget() and take_slot()):
+        return primary.result()
+
+    logger.info("Hedging Gemini request after %.2fs", delay)
+    pending = {primary, _hedge_executor.submit(call)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # A running thread cannot be interrupted; its result is dropped.
+                for loser in pending:
+                    loser.cancel()
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def _arun_hedged(make_call, delay: float, take_slot):
+    """Async :func:`_run_hedged`; the losing request is cancelled."""
+
+    tasks = {asyncio.ensure_future(make_call())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return done.pop().result()
+        if not await sync_to_async(lambda: _take_hedge_budget() and take_slot())():
+            return await tasks.pop()
+
+        logger.info("Hedging Gemini request after %.2fs", delay)
+        tasks.add(asyncio.ensure_future(make_call()))
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 def call_gemini(
@@ -69,37 +327,198 @@ def call_gemini(
     *,
     timeout: int = 10,
     max_retries: int = 3,
+    system_instruction: str | None = None,
+    generation_config: dict | None = None,
+    cache_ttl: int | None = None,
+    hedge: bool | None = None,
+    site: str = "other",
+    on_completion: Callable[[providers.Completion], None] | None = None,
+    acquire_timeout: float = ACQUIRE_TIMEOUT,
 ) -> str:
     """Call Gemini with retries and timeout.
 
-    Raises the last exception if all retries fail or if the API key is
-    missing.
+    ``system_instruction`` and ``generation_config`` are forwarded to the
+    model, e.g. ``{"response_mime_type": "application/json"}`` for structured
+    output.  Responses are cached by a hash of the model, prompt and these
+    arguments for ``cache_ttl`` seconds (``GEMINI_RESPONSE_CACHE_TTL`` by
+    default, ``0`` to bypass).  Each attempt is routed by
+    :data:`dashboard.providers.router`, which may serve the request from
+    another active provider when Gemini is slow or failing.  Raises the last
+    exception if all retries fail or if the API key is missing, and
+    :class:`CircuitOpenError` without calling out while every candidate's
+    circuit breaker is open.  ``hedge`` overrides ``GEMINI_HEDGING`` for
+    this call.  ``site`` labels the call in :mod:`dashboard.metrics`.
+    ``on_completion`` is called with the provider's
+    :class:`~dashboard.providers.Completion`, but not for cached responses,
+    e.g. to charge the caller for the tokens used.  ``acquire_timeout``
+    bounds the wait for a rate-limit slot; Celery tasks pass ``0`` and retry
+    later instead of blocking the worker.
+    """
+
+    model_kwargs = _model_kwargs(system_instruction, generation_config)
+    ttl = RESPONSE_CACHE_TTL if cache_ttl is None else cache_ttl
+    cache_key = None
+    if ttl > 0:
+        cache_key = response_cache.make_key(model_name, prompt, **model_kwargs)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    hedging = HEDGE_ENABLED if hedge is None else hedge
+    delay = 1
+    with metrics.track_call(model_name, site) as call:
+        for attempt in range(max_retries):
+            call.attempts += 1
+            try:
+                provider, target = providers.router.choose(model_name)
+                acquire(provider.name, target, timeout=acquire_timeout)
+                generate = _timed(
+                    provider.name,
+                    functools.partial(
+                        provider.generate,
+                        prompt,
+                        target,
+                        timeout=timeout,
+                        system_instruction=system_instruction,
+                        generation_config=generation_config,
+                    ),
+                )
+                hedge_after = _hedge_delay(provider.name) if hedging else None
+                with get_breaker(provider.name, target).protect():
+                    if hedge_after is None:
+                        completion = generate()
+                    else:
+                        take_slot = functools.partial(
+                            acquire, provider.name, target, block=False
+                        )
+                        completion = _run_hedged(generate, hedge_after, take_slot)
+                break
+            except (CircuitOpenError, RateLimitExceeded):
+                raise
+            except Exception as e:
+                logger.warning(
+                    "Gemini call failed (attempt %d/%d): %s",
+                    attempt + 1,
+                    max_retries,
+                    e,
+                )
+                if attempt == max_retries - 1:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+        call.completed(target, completion)
+    if on_completion is not None:
+        on_completion(completion)
+
+    if cache_key is not None:
+        response_cache.set(cache_key, completion.text, ttl)
+    return completion.text
+
+
+# Upper bound on concurrent async Gemini calls per model within one event loop.
+MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8"))
+
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_semaphore(model_name: str) -> asyncio.Semaphore:
+    """Return the concurrency semaphore for ``model_name`` on the running loop."""
+
+    per_loop = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    semaphore = per_loop.get(model_name)
+    if semaphore is None:
+        semaphore = per_loop[model_name] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return semaphore
+
+
+async def acall_gemini(
+    prompt: str,
+    model_name: str = "gemini-1.5-flash",
+    *,
+    timeout: int = 10,
+    max_retries: int = 3,
+    system_instruction: str | None = None,
+    generation_config: dict | None = None,
+    hedge: bool | None = None,
+    site: str = "other",
+    on_completion: Callable[[providers.Completion], None] | None = None,
+) -> str:
+    """Asynchronous counterpart of :func:`call_gemini`, without response caching.
+
+    Backoff uses ``asyncio.sleep`` so no thread is blocked between attempts,
+    and at most ``GEMINI_MAX_CONCURRENCY`` calls per model run at once.
+    Cancelling the calling task cancels the in-flight request or backoff.
+    ``on_completion`` is called as in :func:`call_gemini`.
     """
 
+    hedging = HEDGE_ENABLED if hedge is None else hedge
     delay = 1
-    for attempt in range(max_retries):
-        try:
-            model = get_model(model_name)
-            response = model.generate_content(
-                prompt, request_options={"timeout": timeout}
-            )
-            return response.text.strip()
-        except Exception as e:
-            logger.warning(
-                "Gemini call failed (attempt %d/%d): %s", attempt + 1, max_retries, e
-            )
-            if attempt == max_retries - 1:
+    with metrics.track_call(model_name, site) as call:
+        for attempt in range(max_retries):
+            call.attempts += 1
+            try:
+                provider, target = await sync_to_async(providers.router.choose)(
+                    model_name
+                )
+                await aacquire(provider.name, target)
+                async with _get_semaphore(target):
+                    generate = _atimed(
+                        provider.name,
+                        functools.partial(
+                            provider.agenerate,
+                            prompt,
+                            target,
+                            timeout=timeout,
+                            system_instruction=system_instruction,
+                            generation_config=generation_config,
+                        ),
+                    )
+                    hedge_after = _hedge_delay(provider.name) if hedging else None
+                    async with get_breaker(provider.name, target).aprotect():
+                        if hedge_after is None:
+                            completion = await generate()
+                        else:
+                            take_slot = functools.partial(
+                                acquire, provider.name, target, block=False
+                            )
+                            completion = await _arun_hedged(
+                                generate, hedge_after, take_slot
+                            )
+                break
+            except (CircuitOpenError, RateLimitExceeded):
                 raise
-            time.sleep(delay)
-            delay *= 2
+            except Exception as e:
+                logger.warning(
+                    "Gemini call failed (attempt %d/%d): %s",
+                    attempt + 1,
+                    max_retries,
+                    e,
+                )
+                if attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(delay)
+                delay *= 2
+        call.completed(target, completion)
+    if on_completion is not None:
+        await sync_to_async(on_completion)(completion)
+    return completion.text
 
 
 __all__ = [
+    "CircuitOpenError",
+    "JSON_RESPONSE",
+    "RateLimitExceeded",
+    "acall_gemini",
+    "call_budget",
     "call_gemini",
+    "clear_model_registry",
     "configure",
+    "ensure_configured",
     "get_model",
     "genai",
     "is_configured",
-    "time",
+    "supports_async",
+    "warm_up",
 ]
-
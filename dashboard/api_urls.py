@@ -2,14 +2,25 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .api_views import ContainerViewSet, CurrentUserView, ContainerConfigView, TaskStatusView
+from .api_views import (
+    ContainerConfigView,
+    ContainerViewSet,
+    ConversationViewSet,
+    CurrentUserView,
+    TaskBatchStatusView,
+    TaskStatusView,
+    task_wait_view,
+)
 
 router = DefaultRouter()
 router.register(r'containers', ContainerViewSet, basename='container')
+router.register(r'conversations', ConversationViewSet, basename='conversation')
 
 urlpatterns = [
     path('me/', CurrentUserView.as_view(), name='current-user'),
     path('container-configs/', ContainerConfigView.as_view(), name='container-configs'),
+    path('tasks/status/', TaskBatchStatusView.as_view(), name='task-batch-status'),
     path('tasks/<str:task_id>/', TaskStatusView.as_view(), name='task-status'),
+    path('tasks/<str:task_id>/wait/', task_wait_view, name='task-wait'),
     path('', include(router.urls)),
 ]
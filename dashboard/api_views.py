@@ -1,9 +1,12 @@
+import hashlib
 import json
 
-from django.core.cache import cache
+from django.conf import settings
 from django.db.models import QuerySet
-from rest_framework import status, viewsets
+from django.http import HttpRequest, JsonResponse
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import BasePermission, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
@@ -11,17 +14,41 @@ from rest_framework.views import APIView
 
 import google.generativeai as genai
 
+from .ai_cache import (
+    ComputeInProgress,
+    get_many_values,
+    get_or_compute,
+    get_stale_while_revalidate,
+)
 from .ai_service import call_gemini
-from .models import Container, ContainerConfig
+from .circuit_breaker import CircuitOpenError
+from .providers import router
+from .rate_limit import RateLimitExceeded
+from .task_status import (
+    BATCH_LIMIT,
+    MAX_WAIT,
+    batch_status,
+    task_status,
+    wait_for_task,
+)
+from .conversations import submit_turn
+from .fair_share import QueueFull
+from .models import Container, ContainerConfig, Conversation
 from .serializers import (
     ContainerConfigSerializer,
     ContainerSerializer,
+    ConversationSerializer,
+    MessageSerializer,
     UserSerializer,
 )
-from .tasks import chat_task
+from .tasks import (
+    chat_task,
+    refresh_bundle_task,
+    refresh_suggestion_task,
+    store_bundle,
+)
 from .throttles import UserProfileQuotaThrottle
-from .utils import decrement_api_quota
-from celery.result import AsyncResult
+from .utils import QuotaExceeded, check_api_quota, quota_charger
 
 
 
@@ -64,6 +91,7 @@ class IsContainerOwner(BasePermission):
             "suggest_questions",
             "suggest_personas",
             "generate_function",
+            "suggest_bundle",
             "chat",
         }
         if getattr(view, "action", None) in restricted:
@@ -75,6 +103,21 @@ class ContainerViewSet(viewsets.ModelViewSet):
     serializer_class = ContainerSerializer
     permission_classes = [IsAuthenticated, IsContainerOwner]
 
+    QUESTIONS_INSTRUCTION = (
+        "generate 4 diverse and insightful 'quick questions' a user might ask an AI assistant in this context. Focus on actionable and common queries."
+    )
+    PERSONAS_INSTRUCTION = (
+        "generate 4 creative and distinct 'personas' for an AI assistant. Examples: 'Concise Expert', 'Friendly Guide'."
+    )
+
+    def handle_exception(self, exc: Exception) -> Response:
+        """Report AI provider back-pressure as a 503, exhausted quota or a full queue as a 429."""
+        if isinstance(exc, (QuotaExceeded, QueueFull)):
+            return Response({"error": str(exc)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        if isinstance(exc, (CircuitOpenError, RateLimitExceeded)):
+            return Response({"error": str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return super().handle_exception(exc)
+
     def get_queryset(self) -> QuerySet[Container]:
         """Return containers for which the user is a member."""
         return Container.objects.filter(members=self.request.user)
@@ -84,24 +127,65 @@ class ContainerViewSet(viewsets.ModelViewSet):
         container = serializer.save(owner=self.request.user)
         container.members.add(self.request.user)
 
-    def _call_gemini_suggestion(self, container: Container, action: str, prompt: str) -> dict:
-        """Call Gemini for a suggestion, caching results per container and action."""
-        cache_key = f"gemini:{container.id}:{action}"
-        cached = cache.get(cache_key)
-        if cached is not None:
-            return cached
-        response_text = call_gemini(prompt, model_name="gemini-2.5-flash")
-        data = json.loads(response_text)
-        cache.set(cache_key, data, timeout=300)
-        decrement_api_quota(self.request.user)
-        return data
+    def _function_prompt(self, user_request: str) -> str:
+        """Return the prompt asking Gemini to draft a function configuration."""
+        return f"""
+        Based on the user request for a function: "{user_request}", generate a configuration for it. The function should run inside a chat application.
+        - Define a short, clear 'name'.
+        - Write a concise one-sentence 'description'.
+        - Select a suitable SVG 'icon' from the provided list.
+        - Define 1 to 3 input 'parameters' the user needs to provide (name, type, description). Parameter 'type' must be one of: 'string', 'number', 'textarea'.
+        - Create a detailed 'promptTemplate' to be sent to another AI model. The prompt template must use placeholders like {{parameterName}} for each parameter defined.
+        Return as a single JSON object.
+
+        Available icons:
+        <svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M14 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V8z"></path><polyline points="14 2 14 8 20 8"></polyline><line x1="16" y1="13" x2="8" y2="13"></line><line x1="16" y1="17" x2="8" y2="17"></line><polyline points="10 9 9 9 8 9"></polyline></svg>
+        <svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><rect x="3" y="3" width="7" height="7"></rect><rect x="14" y="3" width="7" height="7"></rect><rect x="14" y="14" width="7" height="7"></rect><rect x="3" y="14" width="7" height="7"></rect></svg>
+        """
+
+    @staticmethod
+    def _suggestion_cache_key(container: Container, action: str, user_request: str = "") -> str:
+        key = f"gemini:{container.id}:{action}"
+        if user_request:
+            key += ":" + hashlib.sha256(user_request.encode()).hexdigest()[:16]
+        return key
+
+    def _call_gemini_suggestion(
+        self, container: Container, action: str, prompt: str, user_request: str = ""
+    ) -> dict:
+        """Call Gemini for a suggestion, caching results per container, action and user request.
+
+        Concurrent misses for the same key are coalesced so only one caller
+        calls Gemini and is charged for the tokens it used.  Stale entries are served while a
+        background task refreshes them.
+        """
+        cache_key = self._suggestion_cache_key(container, action, user_request)
+
+        def compute() -> dict:
+            check_api_quota(self.request.user, prompt)
+            response_text = call_gemini(
+                prompt,
+                model_name="gemini-2.5-flash",
+                site="suggestion",
+                on_completion=quota_charger(self.request.user, prompt),
+            )
+            return json.loads(response_text)
+
+        return get_stale_while_revalidate(
+            cache_key,
+            compute,
+            lambda: refresh_suggestion_task.delay(self.request.user.id, cache_key, prompt),
+            soft_ttl=settings.AI_SUGGESTION_SOFT_TTL,
+            hard_ttl=settings.AI_SUGGESTION_HARD_TTL,
+            cache_name="suggestion",
+        )
 
     @action(detail=True, methods=['post'], throttle_classes=[UserProfileQuotaThrottle])
     def suggest_questions(self, request: Request, pk: int | None = None) -> Response:
         """Return cached or fresh quick question suggestions for the container."""
         container = self.get_object()
         prompt = (
-            f"Based on a container named '{container.name}', generate 4 diverse and insightful 'quick questions' a user might ask an AI assistant in this context. Focus on actionable and common queries. Return as a JSON object with a 'suggestions' key containing an array of strings."
+            f"Based on a container named '{container.name}', {self.QUESTIONS_INSTRUCTION} Return as a JSON object with a 'suggestions' key containing an array of strings."
         )
         data = self._call_gemini_suggestion(container, "suggest_questions", prompt)
         return Response(data)
@@ -111,7 +195,7 @@ class ContainerViewSet(viewsets.ModelViewSet):
         """Return cached or fresh persona suggestions for the container."""
         container = self.get_object()
         prompt = (
-            f"Based on a container named '{container.name}', generate 4 creative and distinct 'personas' for an AI assistant. Examples: 'Concise Expert', 'Friendly Guide'. Return as a JSON object with a 'suggestions' key containing an array of strings."
+            f"Based on a container named '{container.name}', {self.PERSONAS_INSTRUCTION} Return as a JSON object with a 'suggestions' key containing an array of strings."
         )
         data = self._call_gemini_suggestion(container, "suggest_personas", prompt)
         return Response(data)
@@ -123,43 +207,202 @@ class ContainerViewSet(viewsets.ModelViewSet):
         if not user_request:
             return Response({"error": "Prompt is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        prompt = f"""
-        Based on the user request for a function: "{user_request}", generate a configuration for it. The function should run inside a chat application.
-        - Define a short, clear 'name'.
-        - Write a concise one-sentence 'description'.
-        - Select a suitable SVG 'icon' from the provided list.
-        - Define 1 to 3 input 'parameters' the user needs to provide (name, type, description). Parameter 'type' must be one of: 'string', 'number', 'textarea'.
-        - Create a detailed 'promptTemplate' to be sent to another AI model. The prompt template must use placeholders like {{parameterName}} for each parameter defined.
-        Return as a single JSON object.
+        prompt = self._function_prompt(user_request)
+        container = self.get_object()
+        data = self._call_gemini_suggestion(
+            container, "generate_function", prompt, user_request
+        )
+        return Response(data)
 
-        Available icons:
-        <svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M14 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V8z"></path><polyline points="14 2 14 8 20 8"></polyline><line x1="16" y1="13" x2="8" y2="13"></line><line x1="16" y1="17" x2="8" y2="17"></line><polyline points="10 9 9 9 8 9"></polyline></svg>
-        <svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><rect x="3" y="3" width="7" height="7"></rect><rect x="14" y="3" width="7" height="7"></rect><rect x="14" y="14" width="7" height="7"></rect><rect x="3" y="14" width="7" height="7"></rect></svg>
+    @action(detail=True, methods=['post'], throttle_classes=[UserProfileQuotaThrottle])
+    def suggest_bundle(self, request: Request, pk: int | None = None) -> Response:
+        """Return question and persona suggestions, plus an optional function draft, from one Gemini call.
+
+        The individual ``suggest_questions``, ``suggest_personas`` and
+        ``generate_function`` cache entries are filled from the response, and
+        concurrent misses are coalesced into a single call.  Stale entries are
+        served while a background task refreshes the whole bundle.
         """
         container = self.get_object()
-        data = self._call_gemini_suggestion(container, "generate_function", prompt)
-        return Response(data)
+        user_request = request.data.get('prompt', '')
+        keys = {
+            "questions": self._suggestion_cache_key(container, "suggest_questions"),
+            "personas": self._suggestion_cache_key(container, "suggest_personas"),
+        }
+        if user_request:
+            keys["function"] = self._suggestion_cache_key(
+                container, "generate_function", user_request
+            )
+        prompt = (
+            f"Based on a container named '{container.name}', produce a single JSON object with these keys:\n"
+            f"- 'questions': {self.QUESTIONS_INSTRUCTION} An array of strings.\n"
+            f"- 'personas': {self.PERSONAS_INSTRUCTION} An array of strings.\n"
+        )
+        if user_request:
+            prompt += (
+                "- 'function': an object following these instructions:\n"
+                + self._function_prompt(user_request)
+            )
+        bundle_key = self._suggestion_cache_key(container, "suggest_bundle", user_request)
+
+        cached = get_many_values(
+            keys.values(),
+            lambda: refresh_bundle_task.delay(request.user.id, keys, prompt),
+            refresh_key=bundle_key,
+            cache_name="suggestion",
+        )
+        if len(cached) == len(keys):
+            return Response(self._bundle_response(keys, cached))
+
+        # Concurrent misses share one Gemini call and one quota charge.
+        entries = get_or_compute(
+            bundle_key,
+            lambda: store_bundle(keys, prompt, request.user),
+            settings.AI_SUGGESTION_SOFT_TTL,
+        )
+        return Response(self._bundle_response(keys, entries))
+
+    @staticmethod
+    def _bundle_response(keys: dict, entries: dict) -> dict:
+        return {name: entries[key] for name, key in keys.items()}
 
     @action(detail=True, methods=['post'], throttle_classes=[UserProfileQuotaThrottle])
     def chat(self, request: Request, pk: int | None = None) -> Response:
-        """Queue a chat task for a container with the provided message and history."""
+        """Queue a chat task for a message in a stored conversation.
+
+        Pass ``conversation`` to continue one; without it a new conversation
+        is started from the optional client-side ``history``.  The response
+        carries the conversation id for the next message.  A retry with the
+        same ``Idempotency-Key`` header (or ``idempotency_key``) gets the
+        first response back instead of queueing the message again, or a 409
+        while the first request is still being handled.
+        """
         container = self.get_object()
         message = request.data.get('message', '')
-        history_from_client = request.data.get('history', [])
 
         if not message:
             return Response({"error": "Message is required"}, status=status.HTTP_400_BAD_REQUEST)
+        # Fails fast with CircuitOpenError when no provider can serve the model.
+        router.rank(container.selectedModel)
+        try:
+            submission = submit_turn(
+                chat_task,
+                request.user,
+                container,
+                message,
+                request.data.get('conversation'),
+                request.data.get('history', []),
+                client_key=(
+                    request.headers.get('Idempotency-Key')
+                    or request.data.get('idempotency_key')
+                ),
+            )
+        except Conversation.DoesNotExist:
+            return Response({"error": "Conversation not found"}, status=status.HTTP_404_NOT_FOUND)
+        except ComputeInProgress:
+            return Response(
+                {"error": "This message is still being submitted"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(submission, status=status.HTTP_202_ACCEPTED)
+
+
+class MessageCursorPagination(CursorPagination):
+    """Newest messages first, so clients can load older turns on demand."""
+
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
 
-        task = chat_task.delay(request.user.id, container.id, message, history_from_client)
-        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+
+class ConversationViewSet(
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """The user's stored chat conversations, optionally filtered by ``container``."""
+
+    serializer_class = ConversationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self) -> QuerySet[Conversation]:
+        """Return the user's conversations, newest first."""
+        conversations = Conversation.objects.filter(user=self.request.user)
+        container_id = self.request.query_params.get('container')
+        if container_id:
+            conversations = conversations.filter(container_id=container_id)
+        return conversations
+
+    def perform_create(self, serializer: ConversationSerializer) -> None:
+        serializer.save(user=self.request.user)
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request: Request, pk: int | None = None) -> Response:
+        """Return a cursor-paginated page of messages, newest first."""
+        conversation = self.get_object()
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(conversation.messages.all(), request, view=self)
+        return paginator.get_paginated_response(MessageSerializer(page, many=True).data)
 
 
 class TaskStatusView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request: Request, task_id: str) -> Response:
-        """Return the status and result (if ready) of a Celery task."""
-        result = AsyncResult(task_id)
-        if result.successful():
-            return Response({"status": result.status, "result": result.result})
-        return Response({"status": result.status})
+        """Return the status and result (if ready) of a Celery task.
+
+        A task waiting to retry reports ``RETRY`` with its next ``attempt``
+        number and ``next_attempt_at`` (Unix time).
+        """
+        return Response(task_status(task_id))
+
+
+class TaskBatchStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request: Request) -> Response:
+        """Return the status of every task in ``ids`` that changed since ``marker``.
+
+        Send back the returned ``marker`` on the next request; without one,
+        every task is reported.
+        """
+        task_ids = request.data.get('ids')
+        if not isinstance(task_ids, list) or not all(
+            isinstance(task_id, str) for task_id in task_ids
+        ):
+            return Response(
+                {'error': 'ids must be a list of task ids'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        task_ids = list(dict.fromkeys(task_ids))
+        if len(task_ids) > BATCH_LIMIT:
+            return Response(
+                {'error': f'At most {BATCH_LIMIT} task ids per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        statuses, marker = batch_status(task_ids, str(request.data.get('marker') or ''))
+        return Response({'tasks': statuses, 'marker': marker})
+
+
+async def task_wait_view(request: HttpRequest, task_id: str) -> JsonResponse:
+    """Long-poll for a Celery task's status.
+
+    Responds like :class:`TaskStatusView` once the task stores a new state,
+    or after ``?timeout=`` seconds (capped at ``TASK_STATUS_MAX_WAIT``).
+    Plain async view so a waiting client does not hold a worker thread.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': 'Method not allowed.'}, status=405)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided.'}, status=403
+        )
+    try:
+        timeout = float(request.GET.get('timeout', MAX_WAIT))
+    except ValueError:
+        return JsonResponse({'detail': 'timeout must be a number.'}, status=400)
+    return JsonResponse(await wait_for_task(task_id, timeout))
@@ -0,0 +1,158 @@
+"""Token-budgeted compaction of chat history.
+
+Recent turns are sent to the model verbatim while they fit the model's
+history budget; older turns are replaced by a rolling summary.  Summaries are
+cached by a digest of the turns they cover, and the summary of a longer
+prefix is built by extending the cached summary of a shorter one, so every
+turn is summarized once.  The compaction point moves in steps of
+``SUMMARY_STEP`` turns, so a summary is written every few messages rather
+than on each one.
+"""
+
+import hashlib
+import json
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .ai_cache import get_or_compute
+from .ai_service import call_gemini
+from .task_retry import policy_for
+from .utils import estimate_tokens, quota_charger
+
+logger = logging.getLogger(__name__)
+
+# Older turns are summarized in blocks of this many turns.
+SUMMARY_STEP = 6
+# The latest turns always sent verbatim, whatever their size.
+MIN_RECENT_TURNS = 2
+
+SUMMARY_PROMPT = (
+    "Maintain a running summary of a conversation between a user and an AI "
+    "assistant.\n\nSummary so far:\n{summary}\n\nNew messages:\n{transcript}\n\n"
+    "Rewrite the summary to include the new messages. Keep facts, decisions, "
+    "names, numbers and open questions the assistant will need later. Use at "
+    "most {words} words and return only the summary."
+)
+
+
+def _role(item: dict) -> str:
+    return "model" if item.get("role") == "model" else "user"
+
+
+def history_budget(model_name: str) -> int:
+    """Return the history token budget for ``model_name``."""
+
+    return settings.AI_CHAT_HISTORY_TOKENS_BY_MODEL.get(
+        model_name, settings.AI_CHAT_HISTORY_TOKENS
+    )
+
+
+def split_history(model_name: str, history: list) -> tuple[list, list]:
+    """Split client ``history`` into ``(older, recent)`` turns.
+
+    ``recent`` fits the model's budget together with a summary of ``older``,
+    except that the last ``MIN_RECENT_TURNS`` are always recent.  ``older``
+    is a whole number of ``SUMMARY_STEP`` blocks.
+    """
+
+    tokens = [estimate_tokens(item.get("text", "")) for item in history]
+    budget = history_budget(model_name)
+    if sum(tokens) <= budget:
+        return [], list(history)
+
+    budget -= settings.AI_CHAT_SUMMARY_TOKENS
+    cut, total = len(history), 0
+    while cut > 0 and total + tokens[cut - 1] <= budget:
+        cut -= 1
+        total += tokens[cut]
+    cut = math.ceil(cut / SUMMARY_STEP) * SUMMARY_STEP
+    limit = max(len(history) - MIN_RECENT_TURNS, 0)
+    if cut > limit:
+        cut = limit // SUMMARY_STEP * SUMMARY_STEP
+    return list(history[:cut]), list(history[cut:])
+
+
+def _prefix_keys(turns: list) -> list[str]:
+    """Return the cache key of every ``SUMMARY_STEP``-aligned prefix of ``turns``."""
+
+    digest = hashlib.sha256()
+    keys = []
+    for i, item in enumerate(turns, 1):
+        digest.update(json.dumps([_role(item), item.get("text", "")]).encode())
+        if i % SUMMARY_STEP == 0:
+            keys.append(f"chat_summary:{digest.copy().hexdigest()}")
+    return keys
+
+
+def _summarize(previous: str, turns: list, user=None) -> str:
+    transcript = "\n".join(
+        f"{'Assistant' if _role(item) == 'model' else 'User'}: {item.get('text', '')}"
+        for item in turns
+    )
+    prompt = SUMMARY_PROMPT.format(
+        summary=previous or "(none yet)",
+        transcript=transcript,
+        words=settings.AI_CHAT_SUMMARY_TOKENS * 3 // 4,
+    )
+    return call_gemini(
+        prompt,
+        model_name=settings.AI_CHAT_SUMMARY_MODEL,
+        generation_config={"max_output_tokens": settings.AI_CHAT_SUMMARY_TOKENS},
+        cache_ttl=0,
+        site="history_summary",
+        # Runs inside chat_task: transient errors retry the task through
+        # Celery instead of sleeping or blocking in the worker.
+        max_retries=1,
+        acquire_timeout=0,
+        on_completion=quota_charger(user, prompt) if user is not None else None,
+    )
+
+
+def summarize(turns: list, user=None) -> str:
+    """Return a summary of ``turns``, a whole number of ``SUMMARY_STEP`` blocks.
+
+    Extends the longest cached summary of a prefix of ``turns``; concurrent
+    requests for the same turns share one model call.  ``user`` is charged
+    for the tokens used.
+    """
+
+    keys = _prefix_keys(turns)
+
+    def compute() -> str:
+        cached = cache.get_many(keys[:-1])
+        for blocks in range(len(keys) - 1, 0, -1):
+            previous = cached.get(keys[blocks - 1])
+            if previous is not None:
+                return _summarize(previous, turns[blocks * SUMMARY_STEP :], user)
+        return _summarize("", turns, user)
+
+    return get_or_compute(keys[-1], compute, settings.AI_CHAT_SUMMARY_TTL)
+
+
+def compact_history(model_name: str, history: list, user=None) -> tuple[str, list]:
+    """Return ``(summary, recent)`` for sending ``history`` to ``model_name``.
+
+    ``summary`` is empty when the whole history fits the budget.  Transient
+    provider errors are raised so the chat task can retry; on any other
+    failure the older turns are dropped and the chat goes ahead with the
+    recent ones.
+    """
+
+    older, recent = split_history(model_name, history)
+    if not older:
+        return "", recent
+    try:
+        return summarize(older, user), recent
+    except Exception as e:
+        if policy_for(e) is not None:
+            raise
+        logger.warning(
+            "Could not summarize chat history, dropping %d turns: %s", len(older), e
+        )
+        return "", recent
+
+
+__all__ = ["compact_history", "history_budget", "split_history", "summarize"]
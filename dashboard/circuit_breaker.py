@@ -0,0 +1,158 @@
+"""Circuit breaker for AI provider calls, shared through the Django cache.
+
+State lives in the cache configured by ``CACHE_URL`` so every web and worker
+process sees the same circuit: once failures trip it, all of them fail fast
+until a single probe request succeeds.
+"""
+
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+FAILURE_RATE = float(os.environ.get("AI_BREAKER_FAILURE_RATE", "0.5"))
+MIN_REQUESTS = int(os.environ.get("AI_BREAKER_MIN_REQUESTS", "10"))
+WINDOW_SECONDS = int(os.environ.get("AI_BREAKER_WINDOW_SECONDS", "60"))
+OPEN_SECONDS = int(os.environ.get("AI_BREAKER_OPEN_SECONDS", "30"))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker with closed, open and half-open states.
+
+    Calls are counted in fixed windows of ``window`` seconds.  When at least
+    ``min_requests`` calls in the current window fail at ``failure_rate`` or
+    more, the circuit opens for ``open_seconds``.  After that one probe call
+    is let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_rate: float = FAILURE_RATE,
+        min_requests: int = MIN_REQUESTS,
+        window: int = WINDOW_SECONDS,
+        open_seconds: int = OPEN_SECONDS,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self._prefix = f"circuit:{name}"
+
+    def _window_keys(self) -> tuple[str, str]:
+        bucket = int(time.time() // self.window)
+        return f"{self._prefix}:{bucket}:calls", f"{self._prefix}:{bucket}:failures"
+
+    def _incr(self, key: str) -> int:
+        cache.add(key, 0, self.window * 2)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, self.window * 2)
+            return 1
+
+    @property
+    def state(self) -> str:
+        """Return ``"closed"``, ``"open"`` or ``"half-open"``."""
+
+        opened_until = cache.get(f"{self._prefix}:open_until")
+        if opened_until is None:
+            return "closed"
+        return "open" if time.time() < opened_until else "half-open"
+
+    def _open(self) -> None:
+        logger.warning("Circuit %s opened for %ds", self.name, self.open_seconds)
+        # Keep the marker past the open period so the half-open state is visible.
+        cache.set(
+            f"{self._prefix}:open_until",
+            time.time() + self.open_seconds,
+            self.open_seconds + self.window,
+        )
+
+    def _close(self) -> None:
+        logger.info("Circuit %s closed", self.name)
+        calls_key, failures_key = self._window_keys()
+        cache.delete_many([f"{self._prefix}:open_until", calls_key, failures_key])
+
+    def _acquire(self) -> bool:
+        """Return whether this call is the half-open probe; raise if not allowed."""
+
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half-open" and cache.add(
+            f"{self._prefix}:probe", 1, self.open_seconds
+        ):
+            return True
+        raise CircuitOpenError(
+            f"{self.name} is unavailable (circuit open); try again shortly"
+        )
+
+    def record(self, success: bool, probe: bool = False) -> None:
+        """Record a call outcome and update the circuit state."""
+
+        if probe:
+            cache.delete(f"{self._prefix}:probe")
+            if success:
+                self._close()
+            else:
+                self._open()
+            return
+        calls_key, failures_key = self._window_keys()
+        calls = self._incr(calls_key)
+        if success:
+            return
+        failures = self._incr(failures_key)
+        if calls >= self.min_requests and failures / calls >= self.failure_rate:
+            self._open()
+
+    @contextmanager
+    def protect(self):
+        """Run the wrapped call if the circuit allows it and record the outcome."""
+
+        probe = self._acquire()
+        try:
+            yield
+        except Exception:
+            self.record(False, probe)
+            raise
+        self.record(True, probe)
+
+    @asynccontextmanager
+    async def aprotect(self):
+        """Async :meth:`protect`; cache round trips run off the event loop."""
+
+        probe = await sync_to_async(self._acquire)()
+        try:
+            yield
+        except Exception:
+            await sync_to_async(self.record)(False, probe)
+            raise
+        await sync_to_async(self.record)(True, probe)
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(provider: str, model_name: str) -> CircuitBreaker:
+    """Return the shared breaker for ``model_name`` on ``provider``."""
+
+    name = f"{provider}:{model_name}"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+__all__ = ["CircuitBreaker", "CircuitOpenError", "get_breaker"]
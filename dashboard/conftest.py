@@ -0,0 +1,28 @@
+import pytest
+
+from dashboard import ai_service, metrics, providers, rate_limit
+from dashboard.ai_cache import response_cache
+
+
+@pytest.fixture(autouse=True)
+def enable_db_access(db):
+    """AI calls read provider limits from the database, so allow it everywhere."""
+
+
+@pytest.fixture(autouse=True)
+def clear_model_registry():
+    ai_service.clear_model_registry()
+    yield
+    ai_service.clear_model_registry()
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    from django.core.cache import cache
+
+    response_cache.clear_local()
+    rate_limit.clear_limits_cache()
+    providers.router.reset()
+    providers.stats.clear()
+    metrics.registry.reset()
+    cache.clear()
@@ -0,0 +1,98 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .ai_cache import ComputeInProgress
+from .conversations import submit_turn
+from .fair_share import QueueFull
+from .models import Container, Conversation
+from .tasks import chat_task
+from .utils import QuotaExceeded
+
+
+class ContainerChatConsumer(AsyncJsonWebsocketConsumer):
+    """Stream container chat replies to the client token by token.
+
+    Each message received from the client queues a ``chat_task`` that sends
+    reply chunks back to this consumer's channel through the channel layer.
+    """
+
+    async def connect(self) -> None:
+        """Accept the connection only for the authenticated container owner."""
+        self.container_id = self.scope["url_route"]["kwargs"]["container_id"]
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated or not await self._is_owner(user):
+            await self.close(code=4403)
+            return
+        await self.accept()
+
+    @database_sync_to_async
+    def _is_owner(self, user) -> bool:
+        return Container.objects.filter(pk=self.container_id, owner=user).exists()
+
+    @database_sync_to_async
+    def _submit_turn(self, user, message: str, content: dict) -> dict:
+        container = Container.objects.get(pk=self.container_id)
+        return submit_turn(
+            chat_task,
+            user,
+            container,
+            message,
+            content.get("conversation"),
+            content.get("history", []),
+            client_key=content.get("idempotency_key"),
+            stream_channel=self.channel_name,
+        )
+
+    async def receive_json(self, content: dict, **kwargs) -> None:
+        """Store the received message and queue a streaming chat task for it.
+
+        ``conversation`` continues a stored conversation; without it a new
+        one is started and its id is sent back with the ``queued`` event.
+        """
+        message = content.get("message", "")
+        if not message:
+            await self.send_json({"type": "error", "error": "Message is required"})
+            return
+        user = self.scope["user"]
+        try:
+            submission = await self._submit_turn(user, message, content)
+        except (QuotaExceeded, QueueFull) as e:
+            await self.send_json({"type": "error", "error": str(e)})
+            return
+        except ComputeInProgress:
+            await self.send_json(
+                {"type": "error", "error": "This message is still being submitted"}
+            )
+            return
+        except Conversation.DoesNotExist:
+            await self.send_json({"type": "error", "error": "Conversation not found"})
+            return
+        await self.send_json({"type": "queued", **submission})
+
+    async def chat_chunk(self, event: dict) -> None:
+        """Forward a reply chunk from the worker to the client."""
+        await self.send_json(
+            {"type": "chunk", "task_id": event["task_id"], "text": event["text"]}
+        )
+
+    async def chat_done(self, event: dict) -> None:
+        """Forward the completed reply to the client."""
+        await self.send_json(
+            {"type": "done", "task_id": event["task_id"], "reply": event["reply"]}
+        )
+
+    async def chat_error(self, event: dict) -> None:
+        """Forward a worker-side failure to the client."""
+        await self.send_json(
+            {"type": "error", "task_id": event["task_id"], "error": event["error"]}
+        )
+
+    async def chat_retrying(self, event: dict) -> None:
+        """Tell the client the worker will retry the reply at ``next_attempt_at``."""
+        await self.send_json(
+            {
+                "type": "retrying",
+                "task_id": event["task_id"],
+                "next_attempt_at": event["next_attempt_at"],
+            }
+        )
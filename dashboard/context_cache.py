@@ -0,0 +1,102 @@
+"""Gemini context caching for the stable prefix of container chats.
+
+A container's system instruction (name, persona and description) is the same
+for every message, so once it is large enough to pay off it is uploaded once
+as provider-side cached content and chats reference it by name instead of
+resending it.  Handles are tracked in the Django cache, shared by all
+workers, under a digest of the model and prefix: editing a ``Container``
+changes the digest, so the next chat creates a fresh handle and the old one
+expires at the provider.  Handles still in use are extended shortly before
+they expire.  Prefixes below ``GEMINI_CONTEXT_CACHE_MIN_TOKENS`` are sent
+inline as before.
+"""
+
+import datetime
+import hashlib
+import logging
+import os
+import time
+
+from django.core.cache import cache
+
+from . import ai_service
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("GEMINI_CONTEXT_CACHE", "true").lower() == "true"
+# Gemini rejects cached content below a model-specific minimum size, and small
+# prefixes cost more to store than they save.
+MIN_TOKENS = int(os.environ.get("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+TTL = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# Handles are extended once they are this close to expiring.
+REFRESH_MARGIN = 300
+
+
+def _key(model_name: str, system_instruction: str) -> str:
+    digest = hashlib.sha256(f"{model_name}\0{system_instruction}".encode())
+    return f"context_cache:{digest.hexdigest()[:32]}"
+
+
+def _create(model_name: str, system_instruction: str) -> str | None:
+    ai_service.ensure_configured()
+    try:
+        content = ai_service.genai.caching.CachedContent.create(
+            model=model_name,
+            display_name=f"prefix-{model_name}"[:128],
+            system_instruction=system_instruction,
+            ttl=datetime.timedelta(seconds=TTL),
+        )
+    except Exception as e:
+        # Unsupported models and endpoints are not retried until TTL passes.
+        logger.warning("Could not create cached context for %s: %s", model_name, e)
+        return None
+    return content.name
+
+
+def _extend(name: str) -> bool:
+    ai_service.ensure_configured()
+    try:
+        ai_service.genai.caching.CachedContent.get(name).update(
+            ttl=datetime.timedelta(seconds=TTL)
+        )
+    except Exception as e:
+        logger.info("Could not extend cached context %s: %s", name, e)
+        return False
+    return True
+
+
+def cached_content(model_name: str, system_instruction: str) -> str | None:
+    """Return the cached content name to use for ``system_instruction``.
+
+    Returns ``None`` when the prefix should be sent inline: caching is
+    disabled, the prefix is too small, or creating the cache failed.
+    """
+
+    # Imported here: utils loads the models, and ai_service (which imports
+    # this module) is imported by gunicorn's post_fork before apps are ready.
+    from .utils import estimate_tokens
+
+    if not ENABLED or estimate_tokens(system_instruction) < MIN_TOKENS:
+        return None
+    key = _key(model_name, system_instruction)
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and entry["expires"] - REFRESH_MARGIN > now:
+        return entry["name"]
+    current = entry["name"] if entry is not None and entry["expires"] > now else None
+
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, 60):
+        # Another worker is creating or extending the handle.
+        return current
+    try:
+        name = current if current and _extend(current) else None
+        if name is None:
+            name = _create(model_name, system_instruction)
+        cache.set(key, {"name": name, "expires": now + TTL}, TTL)
+        return name
+    finally:
+        cache.delete(lock_key)
+
+
+__all__ = ["cached_content"]
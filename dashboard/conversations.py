@@ -0,0 +1,196 @@
+"""Server-side chat history.
+
+Chat requests name a :class:`~dashboard.models.Conversation` instead of
+re-sending the whole history; turns are appended as
+:class:`~dashboard.models.Message` rows and read back in order by the chat
+task.  Submissions are idempotent for ``AI_CHAT_IDEMPOTENCY_TTL`` seconds,
+so retries and double-clicks reuse the first chat task.  A streamed reply
+goes to the channel of the latest submission, so a client that reconnects
+and resends gets the rest of the reply on its new connection.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import fair_share
+from .ai_cache import get_or_compute
+from .chat_history import split_history
+from .models import Conversation, Message
+from .utils import check_api_quota, history_texts
+
+# How long a duplicate submission waits for the first one to be queued.
+SUBMIT_WAIT_TIMEOUT = 10
+# A chat task's stream channel is kept while the task may still be waiting
+# or running.
+STREAM_CHANNEL_TTL = fair_share.JOB_TTL + fair_share.IN_FLIGHT_TIMEOUT
+
+
+def _conversation_pk(conversation_id):
+    try:
+        return int(conversation_id)
+    except (TypeError, ValueError):
+        raise Conversation.DoesNotExist(f"No conversation {conversation_id!r}")
+
+
+def open_conversation(user, container, conversation_id=None, title="", seed=()):
+    """Return the user's conversation ``conversation_id`` in ``container``.
+
+    Without an id a new conversation is started, holding the ``seed`` turns
+    (``{"role", "text"}`` dicts) from a client that kept history locally.
+    Raises :class:`Conversation.DoesNotExist` for an invalid id or one the user
+    does not own.
+    """
+    if conversation_id:
+        return Conversation.objects.get(
+            pk=_conversation_pk(conversation_id), user=user, container=container
+        )
+    conversation = Conversation.objects.create(
+        user=user, container=container, title=title[:200]
+    )
+    Message.objects.bulk_create(
+        Message(
+            conversation=conversation,
+            role="model" if item.get("role") == "model" else "user",
+            text=item.get("text", ""),
+        )
+        for item in seed
+    )
+    return conversation
+
+
+def append_message(conversation_id, role, text):
+    """Append a turn to the conversation and return the new :class:`Message`."""
+    return Message.objects.create(conversation_id=conversation_id, role=role, text=text)
+
+
+def load_history(conversation_id, before_id=None):
+    """Return the conversation's turns as ``{"role", "text"}`` dicts, oldest first.
+
+    With ``before_id`` only turns written before that message are returned.
+    """
+    messages = Message.objects.filter(conversation_id=conversation_id)
+    if before_id is not None:
+        messages = messages.filter(id__lt=before_id)
+    return list(messages.order_by("created_at", "id").values("role", "text"))
+
+
+def start_turn(user, container, message, conversation_id=None, history=()):
+    """Check the user's quota and store ``message`` as the next user turn.
+
+    Continues conversation ``conversation_id``, or starts one from the
+    client-side ``history``.  Returns ``(conversation, message)``; raises
+    :class:`~dashboard.utils.QuotaExceeded` before writing anything if the
+    request is likely to exceed the user's quota.
+    """
+    if conversation_id:
+        conversation = open_conversation(user, container, conversation_id)
+        history = load_history(conversation.id)
+    _, recent = split_history(container.selectedModel, history)
+    check_api_quota(user, message, *history_texts(recent))
+    if not conversation_id:
+        conversation = open_conversation(user, container, title=message, seed=history)
+    return conversation, append_message(conversation.id, "user", message)
+
+
+def _stream_channel_key(task_id):
+    return f"chat:stream:{task_id}"
+
+
+def current_stream_channel(task_id, default=None):
+    """Return the channel chat task ``task_id`` should stream its reply to."""
+    return cache.get(_stream_channel_key(task_id)) or default
+
+
+def _submission_key(user, container, message, conversation_id, history, client_key):
+    if client_key:
+        parts = [container.id, "key", str(client_key)]
+    else:
+        # The latest reply tells a repeat of a message sent after it apart
+        # from a retry of one still waiting for its answer.
+        last_reply = (
+            Message.objects.filter(conversation_id=conversation_id, role="model")
+            .order_by("-id")
+            .values_list("id", flat=True)
+            .first()
+            if conversation_id
+            else None
+        )
+        parts = [container.id, str(conversation_id), last_reply, message, history]
+    digest = hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+    return f"chat:submit:{user.pk}:{digest}"
+
+
+def submit_turn(
+    task,
+    user,
+    container,
+    message,
+    conversation_id=None,
+    history=(),
+    client_key=None,
+    task_kwargs=None,
+    stream_channel=None,
+):
+    """Store ``message`` as the next user turn and queue ``task`` to answer it.
+
+    The task is queued through :func:`~dashboard.fair_share.submit`.  Returns
+    ``{"task_id", "conversation"}``.  A repeat of the submission within
+    ``AI_CHAT_IDEMPOTENCY_TTL`` seconds (the same ``client_key``, or without
+    one the same message, conversation and history) returns the first
+    result and stores and queues nothing, but moves the reply stream to its
+    own ``stream_channel``.  A repeat arriving while the first is still
+    being queued raises :class:`~dashboard.ai_cache.ComputeInProgress`
+    after ``SUBMIT_WAIT_TIMEOUT`` seconds.  Raises like :func:`start_turn`,
+    or :class:`~dashboard.fair_share.QueueFull` (storing nothing) when the
+    user has too many messages waiting.
+    """
+    computed = []
+    if conversation_id:
+        conversation_id = _conversation_pk(conversation_id)
+    if stream_channel:
+        task_kwargs = {**(task_kwargs or {}), "stream_channel": stream_channel}
+
+    def compute():
+        conversation, user_message = start_turn(
+            user, container, message, conversation_id, history
+        )
+        try:
+            task_id = fair_share.submit(
+                task,
+                user,
+                container.id,
+                (user.pk, container.id, message, []),
+                {
+                    **(task_kwargs or {}),
+                    "conversation_id": conversation.id,
+                    "message_id": user_message.id,
+                },
+            )
+        except fair_share.QueueFull:
+            (user_message if conversation_id else conversation).delete()
+            raise
+        computed.append(task_id)
+        return {"task_id": task_id, "conversation": conversation.id}
+
+    key = _submission_key(
+        user, container, message, conversation_id, list(history), client_key
+    )
+    submission = get_or_compute(
+        key,
+        compute,
+        settings.AI_CHAT_IDEMPOTENCY_TTL,
+        lock_timeout=30,
+        wait_timeout=SUBMIT_WAIT_TIMEOUT,
+        compute_on_timeout=False,
+    )
+    if stream_channel and not computed:
+        # A resend, possibly from a new connection: stream there from now on.
+        cache.set(
+            _stream_channel_key(submission["task_id"]),
+            stream_channel,
+            STREAM_CHANNEL_TTL,
+        )
+    return submission
@@ -0,0 +1,242 @@
+"""Fair-share dispatch of chat tasks across users and containers.
+
+Chat submissions are not sent to Celery directly.  Each one waits in its
+user's sub-queue for its container and is handed to Celery by weighted
+round-robin over users (and round-robin over each user's containers), with
+caps on the tasks in flight in total, per user and per container.  A user
+or container with nothing queued goes to the front of the rotation, so an
+occasional message is sent with the next free slot.  A user scripting the
+chat action therefore fills only their own sub-queues while everyone else's
+messages keep being dispatched as slots free up.
+
+The dispatcher state lives in the Django cache under a lock, shared by all
+web and worker processes.  A task leaves the in-flight set when it finishes
+(:class:`FairShareTask`), or after ``IN_FLIGHT_TIMEOUT`` if its worker died.
+Users get ``AI_CHAT_FAIR_SHARE_WEIGHTS[username]`` dispatches per turn
+(default 1) and may have at most ``AI_CHAT_MAX_QUEUED_PER_USER`` tasks
+waiting.  A task still queued after ``JOB_TTL`` is dropped and its result
+stored as a failure.
+"""
+
+import time
+import uuid
+
+from celery import Task, current_app, states
+from django.conf import settings
+from django.core.cache import cache
+
+from .locks import cache_lock
+
+STATE_KEY = "chat:fair:state"
+LOCK_KEY = "chat:fair:lock"
+# Queued jobs older than this are dropped.
+JOB_TTL = 3600
+# A task counted as in flight for longer than this is assumed lost.
+IN_FLIGHT_TIMEOUT = 900
+# How long the state lock may be held, and waited for.
+LOCK_TIMEOUT = 10
+
+
+class QueueFull(Exception):
+    """Raised when a user already has ``AI_CHAT_MAX_QUEUED_PER_USER`` tasks waiting."""
+
+
+class JobExpired(Exception):
+    """Stored as the result of a task dropped after waiting ``JOB_TTL``."""
+
+
+def _job_key(task_id: str) -> str:
+    return f"chat:fair:job:{task_id}"
+
+
+def _load() -> dict:
+    return cache.get(STATE_KEY) or {"ring": [], "users": {}, "in_flight": {}}
+
+
+def submit(task: Task, user, container_id: int, args, kwargs=None) -> str:
+    """Queue ``task`` for ``user`` in ``container_id`` and return its task id.
+
+    The task is sent to Celery, with that id, once its turn comes; until
+    then its status reads ``PENDING``.  Raises :class:`QueueFull` if the
+    user already has ``AI_CHAT_MAX_QUEUED_PER_USER`` tasks waiting.
+    """
+
+    task_id = str(uuid.uuid4())
+    weight = settings.AI_CHAT_FAIR_SHARE_WEIGHTS.get(user.get_username(), 1)
+    with cache_lock(LOCK_KEY, LOCK_TIMEOUT):
+        state = _load()
+        queue = state["users"].setdefault(
+            user.pk, {"weight": weight, "credit": 0, "containers": {}}
+        )
+        queued = sum(len(jobs) for jobs in queue["containers"].values())
+        if queued >= settings.AI_CHAT_MAX_QUEUED_PER_USER:
+            raise QueueFull(
+                f"Too many chat messages waiting: at most "
+                f"{settings.AI_CHAT_MAX_QUEUED_PER_USER} may be queued"
+            )
+        cache.set(
+            _job_key(task_id),
+            {"task": task.name, "args": args, "kwargs": kwargs or {}},
+            JOB_TTL,
+        )
+        queue["weight"] = max(weight, 1)
+        if container_id in queue["containers"]:
+            queue["containers"][container_id].append(task_id)
+        else:
+            queue["containers"] = {container_id: [task_id], **queue["containers"]}
+        if user.pk not in state["ring"]:
+            state["ring"].insert(0, user.pk)
+        cache.set(STATE_KEY, state, None)
+    dispatch()
+    return task_id
+
+
+def _pick(state: dict) -> list[str]:
+    """Move the task ids to send next from the sub-queues to ``in_flight``."""
+
+    now = time.time()
+    in_flight = {
+        task_id: entry
+        for task_id, entry in state["in_flight"].items()
+        if now - entry[2] < IN_FLIGHT_TIMEOUT
+    }
+    per_user, per_container = {}, {}
+    for user_id, container_id, _ in in_flight.values():
+        per_user[user_id] = per_user.get(user_id, 0) + 1
+        per_container[container_id] = per_container.get(container_id, 0) + 1
+
+    picked = []
+    progress = True
+    while progress and len(in_flight) < settings.AI_CHAT_MAX_IN_FLIGHT:
+        progress = False
+        for user_id in list(state["ring"]):
+            queue = state["users"][user_id]
+            if queue["credit"] <= 0:
+                queue["credit"] = queue["weight"]
+            served = False
+            while queue["credit"] > 0 and (
+                per_user.get(user_id, 0) < settings.AI_CHAT_MAX_IN_FLIGHT_PER_USER
+            ):
+                if len(in_flight) >= settings.AI_CHAT_MAX_IN_FLIGHT:
+                    # Out of slots mid-turn: this user goes first next time.
+                    state["in_flight"] = in_flight
+                    return picked
+                container_id = next(
+                    (
+                        container_id
+                        for container_id in queue["containers"]
+                        if per_container.get(container_id, 0)
+                        < settings.AI_CHAT_MAX_IN_FLIGHT_PER_CONTAINER
+                    ),
+                    None,
+                )
+                if container_id is None:
+                    break
+                # Rotate the user's containers by re-inserting this one last.
+                jobs = queue["containers"].pop(container_id)
+                task_id = jobs.pop(0)
+                if jobs:
+                    queue["containers"][container_id] = jobs
+                in_flight[task_id] = (user_id, container_id, now)
+                per_user[user_id] = per_user.get(user_id, 0) + 1
+                per_container[container_id] = per_container.get(container_id, 0) + 1
+                picked.append(task_id)
+                queue["credit"] -= 1
+                progress = served = True
+            queue["credit"] = 0
+            if not queue["containers"]:
+                state["ring"].remove(user_id)
+                del state["users"][user_id]
+            elif served:
+                # Turn over: the user moves to the back of the ring.
+                state["ring"].remove(user_id)
+                state["ring"].append(user_id)
+    state["in_flight"] = in_flight
+    return picked
+
+
+def _free(task_ids: list[str]) -> bool:
+    """Remove ``task_ids`` from ``in_flight``; return whether any was there."""
+
+    with cache_lock(LOCK_KEY, LOCK_TIMEOUT):
+        state = _load()
+        freed = [state["in_flight"].pop(task_id, None) for task_id in task_ids]
+        if not any(freed):
+            return False
+        cache.set(STATE_KEY, state, None)
+    return True
+
+
+def _drop(task_ids: list[str]) -> None:
+    """Store a failure for tasks whose queued job expired before dispatch."""
+
+    for task_id in task_ids:
+        current_app.backend.mark_as_failure(
+            task_id, JobExpired(f"Chat task {task_id} waited too long to be sent")
+        )
+
+
+def dispatch() -> int:
+    """Send every queued task that has a free slot to Celery; return how many.
+
+    Tasks whose job expired while queued are dropped and their slots given
+    to the next ones, until no queued task has a free slot.
+    """
+
+    sent = 0
+    while True:
+        with cache_lock(LOCK_KEY, LOCK_TIMEOUT):
+            state = _load()
+            picked = _pick(state)
+            cache.set(STATE_KEY, state, None)
+        if not picked:
+            return sent
+        jobs = cache.get_many([_job_key(task_id) for task_id in picked])
+        expired = []
+        for task_id in picked:
+            job = jobs.get(_job_key(task_id))
+            if job is None:
+                expired.append(task_id)
+                continue
+            try:
+                current_app.tasks[job["task"]].apply_async(
+                    job["args"], job["kwargs"], task_id=task_id
+                )
+            except Exception:
+                _free([task_id])
+                raise
+            cache.delete(_job_key(task_id))
+            sent += 1
+        if not expired:
+            return sent
+        _free(expired)
+        _drop(expired)
+
+
+def release(task_id: str) -> None:
+    """Free ``task_id``'s slot and dispatch the next queued task."""
+
+    if _free([task_id]):
+        dispatch()
+
+
+class FairShareTask(Task):
+    """Base class for tasks submitted through :func:`submit`.
+
+    Releases the task's slot once it finishes; a retry keeps the slot.
+    """
+
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        if status in states.READY_STATES:
+            release(task_id)
+        super().after_return(status, retval, task_id, args, kwargs, einfo)
+
+
+__all__ = [
+    "FairShareTask",
+    "JobExpired",
+    "QueueFull",
+    "dispatch",
+    "release",
+    "submit",
+]
@@ -0,0 +1,251 @@
+"""Local stand-in for the Gemini REST API, for load testing without quota.
+
+Point the portal at it with ``GEMINI_API_ENDPOINT=http://127.0.0.1:8081`` and
+start it with ``python manage.py fake_gemini``.  It answers
+``generateContent`` and ``streamGenerateContent`` with templated text (or a
+canned JSON body when JSON output is requested), sampling latency from a
+log-normal distribution and failing a configurable share of requests.
+
+In record mode requests are forwarded to the real API and each
+request/response pair is appended to a JSONL cassette; in replay mode
+recorded responses are served for matching requests.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM = "https://generativelanguage.googleapis.com"
+ROUTE = re.compile(
+    r"^/(?P<version>v1\w*)/models/(?P<model>[^:/]+)"
+    r":(?P<method>generateContent|streamGenerateContent)"
+)
+DEFAULT_JSON_RESPONSE = json.dumps(
+    {"suggestions": ["First idea", "Second idea", "Third idea", "Fourth idea"]}
+)
+
+
+class FakeGeminiSettings:
+    """Behaviour knobs for :class:`FakeGeminiServer`."""
+
+    def __init__(
+        self,
+        *,
+        template: str = "Fake reply from {model} to: {prompt}",
+        json_response: str = DEFAULT_JSON_RESPONSE,
+        latency_ms: float = 800,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        chunks: int = 4,
+        chunk_delay_ms: float = 80,
+        replay: str | None = None,
+        record: str | None = None,
+        upstream: str = UPSTREAM,
+        seed: int | None = None,
+    ):
+        self.template = template
+        self.json_response = json_response
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.chunks = max(chunks, 1)
+        self.chunk_delay_ms = chunk_delay_ms
+        self.replay = replay
+        self.record = record
+        self.upstream = upstream.rstrip("/")
+        self.random = random.Random(seed)
+
+
+def cassette_key(path: str, body: dict) -> str:
+    """Return the cassette key for a request path (without query) and body."""
+
+    payload = json.dumps({"path": path, "body": body}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def load_cassette(path: str) -> dict:
+    """Return ``{key: entry}`` for every interaction recorded in ``path``."""
+
+    entries = {}
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry["key"]] = entry
+    return entries
+
+
+def _last_user_text(body: dict) -> str:
+    for content in reversed(body.get("contents", [])):
+        texts = [part.get("text", "") for part in content.get("parts", [])]
+        if content.get("role", "user") == "user" and any(texts):
+            return "".join(texts)
+    return ""
+
+
+def _response(text: str, prompt: str) -> dict:
+    prompt_tokens = max(len(prompt) // 4, 1)
+    reply_tokens = max(len(text) // 4, 1)
+    return {
+        "candidates": [
+            {
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }
+        ],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": reply_tokens,
+            "totalTokenCount": prompt_tokens + reply_tokens,
+        },
+    }
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    """Threaded HTTP server speaking the subset of the Gemini REST API we use."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], settings: FakeGeminiSettings):
+        super().__init__(address, _Handler)
+        self.settings = settings
+        self.cassette = load_cassette(settings.replay) if settings.replay else {}
+        self._record_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def save(self, entry: dict) -> None:
+        with self._record_lock, open(self.settings.record, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(entry) + "\n")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeGeminiServer
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("fake_gemini: " + format, *args)
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, chunks: list, delay: float) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"[")
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(delay)
+                self.wfile.write(b",\r\n")
+            self.wfile.write(json.dumps(chunk).encode())
+            self.wfile.flush()
+        self.wfile.write(b"]")
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        match = ROUTE.match(path)
+        if not match:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        stream = match["method"] == "streamGenerateContent"
+        settings = self.server.settings
+
+        if settings.record:
+            self._proxy(path, body, stream)
+            return
+
+        entry = self.server.cassette.get(cassette_key(path, body))
+        if entry is not None:
+            if stream and entry["status"] == 200:
+                self._stream(entry["response"], settings.chunk_delay_ms / 1000)
+            else:
+                self._send_json(entry["status"], entry["response"])
+            return
+
+        rng = settings.random
+        median = settings.latency_ms / 1000
+        if median:
+            time.sleep(median * math.exp(rng.gauss(0, settings.latency_sigma)))
+        if rng.random() < settings.error_rate:
+            status = settings.error_status
+            error = {"code": status, "message": "Injected failure"}
+            self._send_json(status, {"error": error})
+            return
+
+        prompt = _last_user_text(body)
+        mime_type = body.get("generationConfig", {}).get("responseMimeType")
+        if mime_type == "application/json":
+            text = settings.json_response
+        else:
+            text = settings.template.format(model=match["model"], prompt=prompt)
+        if not stream:
+            self._send_json(200, _response(text, prompt))
+            return
+        size = math.ceil(len(text) / settings.chunks) or 1
+        pieces = [text[i : i + size] for i in range(0, len(text), size)] or [""]
+        chunks = [_response(piece, prompt) for piece in pieces]
+        self._stream(chunks, settings.chunk_delay_ms / 1000)
+
+    def _proxy(self, path: str, body: dict, stream: bool) -> None:
+        settings = self.server.settings
+        upstream = requests.post(
+            f"{settings.upstream}{self.path}",
+            json=body,
+            headers={"x-goog-api-key": self.headers.get("x-goog-api-key", "")},
+            timeout=120,
+        )
+        payload = upstream.json()
+        self.server.save(
+            {
+                "key": cassette_key(path, body),
+                "path": path,
+                "request": body,
+                "status": upstream.status_code,
+                "response": payload,
+            }
+        )
+        if stream and upstream.ok:
+            self._stream(payload, 0)
+        else:
+            self._send_json(upstream.status_code, payload)
+
+
+def make_server(
+    settings: FakeGeminiSettings, host: str = "127.0.0.1", port: int = 8081
+) -> FakeGeminiServer:
+    """Return a bound server; call ``serve_forever()`` to start answering."""
+
+    return FakeGeminiServer((host, port), settings)
+
+
+__all__ = [
+    "FakeGeminiServer",
+    "FakeGeminiSettings",
+    "cassette_key",
+    "load_cassette",
+    "make_server",
+]
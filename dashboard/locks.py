@@ -0,0 +1,38 @@
+"""Locks in the Django cache, shared by all web and worker processes."""
+
+import contextlib
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+class LockTimeout(Exception):
+    """Raised when a lock is still held by someone else at the deadline."""
+
+
+@contextlib.contextmanager
+def cache_lock(key: str, timeout: float, wait: float | None = None):
+    """Hold the lock ``key`` for the ``with`` block.
+
+    The lock expires after ``timeout`` seconds in case its holder dies.
+    Waits up to ``wait`` seconds (default ``timeout``) for it, then raises
+    :class:`LockTimeout`; ``wait=0`` tries once.  On exit the lock is only
+    deleted if it is still ours, so a holder that overran ``timeout`` does
+    not release the next holder's lock.
+    """
+
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + (timeout if wait is None else wait)
+    while not cache.add(key, token, timeout):
+        if time.monotonic() >= deadline:
+            raise LockTimeout(f"Lock {key!r} is busy")
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+__all__ = ["LockTimeout", "cache_lock"]
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.fake_gemini import (
+    DEFAULT_JSON_RESPONSE, UPSTREAM, FakeGeminiSettings, make_server,
+)
+
+
+class Command(BaseCommand):
+    help = ('Runs a local stand-in for the Gemini API for load testing '
+            '(see dashboard.fake_gemini).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--template', default=FakeGeminiSettings().template,
+                            help='Reply text; may use {model} and {prompt}.')
+        parser.add_argument('--json-response', default=DEFAULT_JSON_RESPONSE,
+                            help='Reply body when JSON output is requested.')
+        parser.add_argument('--latency-ms', type=float, default=800,
+                            help='Median response latency.')
+        parser.add_argument('--latency-sigma', type=float, default=0.5,
+                            help='Log-normal spread of response latency.')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Share of requests that fail, between 0 and 1.')
+        parser.add_argument('--error-status', type=int, default=503)
+        parser.add_argument('--chunks', type=int, default=4,
+                            help='Number of chunks per streamed reply.')
+        parser.add_argument('--chunk-delay-ms', type=float, default=80)
+        parser.add_argument('--seed', type=int, default=None)
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('--record', metavar='CASSETTE',
+                          help='Proxy to the real API and append interactions '
+                               'to CASSETTE.')
+        mode.add_argument('--replay', metavar='CASSETTE',
+                          help='Serve recorded interactions from CASSETTE.')
+        parser.add_argument('--upstream', default=UPSTREAM)
+
+    def handle(self, *args, **options):
+        settings = FakeGeminiSettings(
+            template=options['template'],
+            json_response=options['json_response'],
+            latency_ms=options['latency_ms'],
+            latency_sigma=options['latency_sigma'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            chunks=options['chunks'],
+            chunk_delay_ms=options['chunk_delay_ms'],
+            replay=options['replay'],
+            record=options['record'],
+            upstream=options['upstream'],
+            seed=options['seed'],
+        )
+        server = make_server(settings, options['host'], options['port'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Fake Gemini listening on {server.url}; '
+            f'set GEMINI_API_ENDPOINT={server.url}'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,252 @@
+"""Prometheus metrics for AI calls, aggregated through the Django cache.
+
+Each process buffers observations in memory and a background thread adds them
+to shared counters in the cache every ``AI_METRICS_FLUSH_SECONDS``.  With
+``CACHE_URL`` pointing at Redis the ``/metrics/`` endpoint of any web process
+reports the totals of every gunicorn and Celery process.  Counters are only ever
+incremented, which keeps them monotonic across process restarts.
+"""
+
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+from .circuit_breaker import CircuitOpenError
+from .rate_limit import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = float(os.environ.get("AI_METRICS_FLUSH_SECONDS", "10"))
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+METRICS = {
+    "ai_call_duration_seconds": (
+        "histogram",
+        "Wall time of AI calls, including retries and rate-limit waits.",
+    ),
+    "ai_call_attempts_total": ("counter", "Provider attempts made by AI calls."),
+    "ai_tokens_total": ("counter", "Tokens reported by the provider per call."),
+    "ai_cache_requests_total": ("counter", "AI result cache lookups by result."),
+}
+
+INDEX_KEY = "metrics:series"
+
+
+def _outcome(exc: BaseException | None) -> str:
+    if exc is None:
+        return "ok"
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(exc, RateLimitExceeded):
+        return "rate_limited"
+    return "error"
+
+
+def _series_key(series: tuple) -> str:
+    return "metrics:" + hashlib.sha1(repr(series).encode()).hexdigest()[:20]
+
+
+def _labels(labels: tuple, le: str | None = None) -> str:
+    pairs = list(labels) + ([("le", le)] if le is not None else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """Buffer metric increments in-process and flush them to the cache.
+
+    A series is ``(metric, suffix, labels, le)``; values are integers so
+    they can be added with ``cache.incr``.  Histogram sums are kept in
+    milliseconds.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_SECONDS):
+        self.flush_interval = flush_interval
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop buffered values and forget which series are registered."""
+
+        self._lock = threading.Lock()
+        self._pending: dict[tuple, int] = defaultdict(int)
+        self._known: set[tuple] = set()
+        self._flusher: threading.Thread | None = None
+
+    def _add(self, series: tuple, value: int) -> None:
+        with self._lock:
+            self._pending[series] += value
+            if self._flusher is None:
+                # Flushing in the background keeps cache I/O out of callers,
+                # including coroutines on an event loop.
+                self._flusher = threading.Thread(
+                    target=self._flush_forever, name="ai-metrics", daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_forever(self) -> None:
+        # Event.wait rather than time.sleep so patched sleeps don't affect it.
+        tick = threading.Event()
+        while not tick.wait(self.flush_interval):
+            self.flush()
+
+    def inc(self, metric: str, labels: dict, value: int = 1) -> None:
+        if value:
+            self._add((metric, "", tuple(sorted(labels.items())), None), int(value))
+
+    def observe(self, metric: str, labels: dict, seconds: float) -> None:
+        labels = tuple(sorted(labels.items()))
+        le = next((str(b) for b in LATENCY_BUCKETS if seconds <= b), "+Inf")
+        self._add((metric, "_bucket", labels, le), 1)
+        self._add((metric, "_count", labels, None), 1)
+        self._add((metric, "_sum", labels, None), round(seconds * 1000))
+
+    def _register(self, series: list) -> None:
+        lock_key = f"{INDEX_KEY}:lock"
+        deadline = time.monotonic() + 1
+        while not cache.add(lock_key, 1, 5):
+            if time.monotonic() >= deadline:
+                # Values are still flushed; registration is retried next time.
+                return
+            time.sleep(0.01)
+        try:
+            index = set(cache.get(INDEX_KEY) or ())
+            index.update(series)
+            cache.set(INDEX_KEY, index, None)
+        finally:
+            cache.delete(lock_key)
+        self._known.update(series)
+
+    def flush(self) -> None:
+        """Add buffered values to the shared counters."""
+
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        if not pending:
+            return
+        try:
+            new = [series for series in pending if series not in self._known]
+            if new:
+                self._register(new)
+            for series, value in pending.items():
+                key = _series_key(series)
+                cache.add(key, 0, None)
+                try:
+                    cache.incr(key, value)
+                except ValueError:
+                    cache.set(key, value, None)
+        except Exception as e:
+            logger.warning("Could not flush AI metrics: %s", e)
+
+    def render(self) -> str:
+        """Return every series in the Prometheus text exposition format."""
+
+        self.flush()
+        index = sorted(cache.get(INDEX_KEY) or (), key=repr)
+        values = cache.get_many([_series_key(series) for series in index])
+        by_metric = defaultdict(list)
+        for series in index:
+            by_metric[series[0]].append((series, values.get(_series_key(series), 0)))
+
+        lines = []
+        for metric, (kind, help_text) in METRICS.items():
+            samples = by_metric.get(metric)
+            if not samples:
+                continue
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            if kind == "histogram":
+                lines += self._render_histogram(metric, samples)
+            else:
+                for (_, _, labels, _), value in samples:
+                    lines.append(f"{metric}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(metric: str, samples: list) -> list[str]:
+        groups = defaultdict(
+            lambda: {"buckets": defaultdict(int), "sum": 0, "count": 0}
+        )
+        for (_, suffix, labels, le), value in samples:
+            group = groups[labels]
+            if suffix == "_bucket":
+                group["buckets"][le] += value
+            else:
+                group[suffix[1:]] += value
+        lines = []
+        for labels, group in sorted(groups.items()):
+            cumulative = 0
+            for le in [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]:
+                cumulative += group["buckets"][le]
+                lines.append(f"{metric}_bucket{_labels(labels, le)} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {group['sum'] / 1000}")
+            lines.append(f"{metric}_count{_labels(labels)} {group['count']}")
+        return lines
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry.reset)
+
+
+class CallRecord:
+    """What :func:`track_call` reports about one logical AI call."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.served_by = None
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+
+    def completed(self, model_name: str, completion) -> None:
+        """Note the model that answered and the tokens it reported."""
+
+        self.served_by = model_name
+        self.prompt_tokens = completion.prompt_tokens
+        self.response_tokens = completion.response_tokens
+
+
+@contextmanager
+def track_call(model_name: str, site: str):
+    """Record duration, attempts and tokens of the AI call in the block.
+
+    ``site`` names the caller (``"suggestion"``, ``"chat"``...).  The block
+    updates the yielded :class:`CallRecord`; the outcome is derived from the
+    exception it raises, if any.
+    """
+
+    record = CallRecord()
+    started = time.monotonic()
+    error = None
+    try:
+        yield record
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        labels = {"model": model_name, "site": site, "outcome": _outcome(error)}
+        registry.observe("ai_call_duration_seconds", labels, time.monotonic() - started)
+        registry.inc("ai_call_attempts_total", labels, record.attempts)
+        token_labels = {"model": record.served_by or model_name, "site": site}
+        for kind, tokens in (
+            ("prompt", record.prompt_tokens),
+            ("response", record.response_tokens),
+        ):
+            registry.inc("ai_tokens_total", {**token_labels, "kind": kind}, tokens)
+
+
+def record_cache(cache_name: str, result: str) -> None:
+    """Count a lookup in ``cache_name`` as ``"hit"``, ``"stale"`` or ``"miss"``."""
+
+    registry.inc("ai_cache_requests_total", {"cache": cache_name, "result": result})
+
+
+__all__ = ["CallRecord", "MetricsRegistry", "record_cache", "registry", "track_call"]
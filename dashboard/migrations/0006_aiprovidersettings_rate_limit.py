@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dashboard", "0005_alter_container_icon"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aiprovidersettings",
+            name="burst",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="aiprovidersettings",
+            name="requests_per_minute",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
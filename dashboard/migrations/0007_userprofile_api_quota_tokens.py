@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import F
+
+# Quotas used to count requests; convert them assuming ~1000 tokens per request.
+TOKENS_PER_REQUEST = 1000
+
+
+def requests_to_tokens(apps, schema_editor):
+    UserProfile = apps.get_model("dashboard", "UserProfile")
+    UserProfile.objects.update(api_quota=F("api_quota") * TOKENS_PER_REQUEST)
+
+
+def tokens_to_requests(apps, schema_editor):
+    UserProfile = apps.get_model("dashboard", "UserProfile")
+    UserProfile.objects.update(api_quota=F("api_quota") / TOKENS_PER_REQUEST)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dashboard", "0006_aiprovidersettings_rate_limit"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="userprofile",
+            name="api_quota",
+            field=models.PositiveBigIntegerField(default=1000000),
+        ),
+        migrations.RunPython(requests_to_tokens, tokens_to_requests),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_conversation_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='quota_allowance',
+            field=models.PositiveBigIntegerField(default=1000000),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='quota_period',
+            field=models.CharField(choices=[('day', 'Daily'), ('month', 'Monthly')], default='month', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='quota_window_start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -46,9 +46,17 @@ def sanitize_svg(value: str) -> str:
     )
 
 class UserProfile(models.Model):
+    QUOTA_PERIODS = [('day', 'Daily'), ('month', 'Monthly')]
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     preferences = models.JSONField(default=dict)
-    api_quota = models.PositiveIntegerField(default=1000)
+    # Remaining AI budget in tokens, charged from provider-reported usage.
+    api_quota = models.PositiveBigIntegerField(default=1_000_000)
+    # api_quota is reset to quota_allowance the first time it is read in a new
+    # quota window; quota_window_start is the start of the window it covers.
+    quota_allowance = models.PositiveBigIntegerField(default=1_000_000)
+    quota_period = models.CharField(max_length=8, choices=QUOTA_PERIODS, default='month')
+    quota_window_start = models.DateTimeField(null=True, blank=True)
     # Changed to TextField to support long base64 data URLs for avatars
     avatar_url = models.TextField(blank=True, null=True)
 
@@ -93,6 +101,9 @@ class AIProviderSettings(models.Model):
     api_endpoint = models.URLField(blank=True)
     default_model = models.CharField(max_length=100)
     is_active = models.BooleanField(default=True)
+    # Outbound rate limit applied per model; leave blank for no limit.
+    requests_per_minute = models.PositiveIntegerField(blank=True, null=True)
+    burst = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return self.provider_name
@@ -134,3 +145,43 @@ class ContainerConfig(models.Model):
         if self.icon:
             self.icon = sanitize_svg(self.icon)
         super().save(*args, **kwargs)
+
+class Conversation(models.Model):
+    container = models.ForeignKey(Container, related_name='conversations', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='conversations', on_delete=models.CASCADE)
+    title = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'container', '-created_at'])]
+        verbose_name = "Conversation"
+        verbose_name_plural = "Conversations"
+
+    def __str__(self):
+        return self.title or f"Conversation {self.pk}"
+
+
+class Message(models.Model):
+    """One chat turn.  Messages are append-only: saving an existing one fails."""
+
+    ROLE_CHOICES = [('user', 'User'), ('model', 'Model')]
+
+    conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE)
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [models.Index(fields=['conversation', 'created_at'])]
+        verbose_name = "Message"
+        verbose_name_plural = "Messages"
+
+    def __str__(self):
+        return f"{self.role}: {self.text[:50]}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Messages are append-only and cannot be changed.")
+        super().save(*args, **kwargs)
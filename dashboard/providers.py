@@ -0,0 +1,406 @@
+"""AI provider abstraction and latency-aware routing.
+
+Every outbound model call goes through a provider object.  ``GeminiProvider``
+wraps the Google SDK via :mod:`dashboard.ai_service`; other rows in
+``AIProviderSettings`` with an ``api_endpoint`` are served by
+``OpenAICompatibleProvider`` over the ``/chat/completions`` HTTP API.  The
+router ranks active providers by recent latency and error rate so traffic
+shifts away from a degraded provider automatically.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Iterator
+
+import requests
+
+from . import ai_service, context_cache
+from .circuit_breaker import CircuitOpenError, get_breaker
+
+logger = logging.getLogger(__name__)
+
+# How long providers read from ``AIProviderSettings`` are reused in-process.
+PROVIDERS_CACHE_SECONDS = 60
+# Error rate is weighted this many times more heavily than latency in ranking.
+ERROR_PENALTY = 4.0
+# A provider that serves the requested model natively has its score scaled by
+# this factor so traffic only moves to another model on a clear difference.
+PREFERENCE = 0.5
+# Below this many recent successful calls a provider's own latency is not
+# trusted; see ``ProviderRouter.rank``.
+MIN_SAMPLES = 20
+
+
+class Completion:
+    """Reply text and the token usage the provider reported for it."""
+
+    def __init__(self, text: str, prompt_tokens: int = 0, response_tokens: int = 0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+
+
+class ReplyStream:
+    """Iterate reply text chunks; ``completion`` is set once exhausted.
+
+    ``started`` tells whether any chunk has been produced yet.
+    """
+
+    def __init__(self, chunks, usage):
+        self._chunks = chunks
+        self._usage = usage
+        self.started = False
+        self.completion: Completion | None = None
+
+    def __iter__(self) -> Iterator[str]:
+        parts = []
+        for text in self._chunks:
+            parts.append(text)
+            self.started = True
+            yield text
+        self.completion = Completion("".join(parts), *self._usage())
+
+
+def _gemini_usage(response) -> tuple[int, int]:
+    """Return ``(prompt, response)`` token counts from ``usage_metadata``.
+
+    Missing or non-numeric counts (e.g. for blocked prompts) count as zero.
+    """
+
+    usage = getattr(response, "usage_metadata", None)
+    counts = (
+        getattr(usage, "prompt_token_count", 0),
+        getattr(usage, "candidates_token_count", 0),
+    )
+    return tuple(count if isinstance(count, int) else 0 for count in counts)
+
+
+class GeminiProvider:
+    """Google Gemini through the ``google.generativeai`` SDK."""
+
+    name = "google"
+
+    def __init__(self, default_model: str = "gemini-2.5-flash"):
+        self.default_model = default_model
+
+    def serves(self, model_name: str) -> bool:
+        return model_name.startswith("gemini")
+
+    def generate(
+        self,
+        prompt: str,
+        model_name: str,
+        *,
+        timeout: int = 10,
+        system_instruction: str | None = None,
+        generation_config: dict | None = None,
+    ) -> Completion:
+        kwargs = ai_service._model_kwargs(system_instruction, generation_config)
+        model = ai_service.get_model(model_name, **kwargs)
+        response = model.generate_content(prompt, request_options={"timeout": timeout})
+        return Completion(response.text.strip(), *_gemini_usage(response))
+
+    async def agenerate(
+        self,
+        prompt: str,
+        model_name: str,
+        *,
+        timeout: int = 10,
+        system_instruction: str | None = None,
+        generation_config: dict | None = None,
+    ) -> Completion:
+        if not ai_service.supports_async():
+            return await asyncio.to_thread(
+                self.generate,
+                prompt,
+                model_name,
+                timeout=timeout,
+                system_instruction=system_instruction,
+                generation_config=generation_config,
+            )
+        kwargs = ai_service._model_kwargs(system_instruction, generation_config)
+        model = ai_service.get_model(model_name, **kwargs)
+        response = await model.generate_content_async(
+            prompt, request_options={"timeout": timeout}
+        )
+        return Completion(response.text.strip(), *_gemini_usage(response))
+
+    @staticmethod
+    def _chat_model(model_name: str, system_instruction: str):
+        """Return a model for chats, using cached context for a large prefix."""
+
+        name = context_cache.cached_content(model_name, system_instruction)
+        if name is not None:
+            return ai_service.get_model(model_name, cached_content=name)
+        return ai_service.get_model(model_name, system_instruction=system_instruction)
+
+    def stream_chat(
+        self, model_name: str, system_instruction: str, history: list, message: str
+    ) -> ReplyStream:
+        """Stream the reply to ``message`` following ``history``.
+
+        ``history`` uses the SDK shape: ``{"role": "user"|"model", "parts": [text]}``.
+        """
+        model = self._chat_model(model_name, system_instruction)
+        response = model.start_chat(history=history).send_message(message, stream=True)
+        return ReplyStream(
+            (chunk.text for chunk in response), lambda: _gemini_usage(response)
+        )
+
+    def chat(
+        self, model_name: str, system_instruction: str, history: list, message: str
+    ) -> Completion:
+        model = self._chat_model(model_name, system_instruction)
+        response = model.start_chat(history=history).send_message(message)
+        return Completion(response.text, *_gemini_usage(response))
+
+
+class OpenAICompatibleProvider:
+    """Any provider exposing an OpenAI-style ``/chat/completions`` endpoint."""
+
+    def __init__(self, name: str, api_key: str, endpoint: str, default_model: str):
+        self.name = name
+        self.api_key = api_key
+        self.endpoint = endpoint.rstrip("/")
+        self.default_model = default_model
+
+    def serves(self, model_name: str) -> bool:
+        return model_name == self.default_model
+
+    def _complete(
+        self, model_name: str, messages: list, timeout: int, json_output: bool = False
+    ) -> Completion:
+        body = {"model": model_name, "messages": messages}
+        if json_output:
+            body["response_format"] = {"type": "json_object"}
+        response = requests.post(
+            f"{self.endpoint}/chat/completions",
+            json=body,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        payload = response.json()
+        usage = payload.get("usage") or {}
+        return Completion(
+            payload["choices"][0]["message"]["content"].strip(),
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0),
+        )
+
+    def generate(
+        self,
+        prompt: str,
+        model_name: str,
+        *,
+        timeout: int = 10,
+        system_instruction: str | None = None,
+        generation_config: dict | None = None,
+    ) -> Completion:
+        messages = [{"role": "user", "content": prompt}]
+        if system_instruction:
+            messages.insert(0, {"role": "system", "content": system_instruction})
+        json_output = (generation_config or {}).get(
+            "response_mime_type"
+        ) == "application/json"
+        return self._complete(model_name, messages, timeout, json_output)
+
+    async def agenerate(self, prompt: str, model_name: str, **kwargs) -> Completion:
+        return await asyncio.to_thread(self.generate, prompt, model_name, **kwargs)
+
+    def chat(
+        self,
+        model_name: str,
+        system_instruction: str,
+        history: list,
+        message: str,
+        timeout: int = 60,
+    ) -> Completion:
+        messages = [{"role": "system", "content": system_instruction}]
+        for item in history:
+            role = "assistant" if item["role"] == "model" else "user"
+            messages.append({"role": role, "content": "".join(item["parts"])})
+        messages.append({"role": "user", "content": message})
+        return self._complete(model_name, messages, timeout)
+
+    def stream_chat(
+        self, model_name: str, system_instruction: str, history: list, message: str
+    ) -> ReplyStream:
+        completion = self.chat(model_name, system_instruction, history, message)
+        return ReplyStream(
+            iter([completion.text]),
+            lambda: (completion.prompt_tokens, completion.response_tokens),
+        )
+
+
+class LatencyStats:
+    """Rolling per-provider latency and outcome samples for this process."""
+
+    def __init__(self, size: int = 200):
+        self._samples: dict[str, deque] = defaultdict(lambda: deque(maxlen=size))
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._samples[provider].append((seconds, ok))
+
+    @contextmanager
+    def track(self, provider: str):
+        """Time the wrapped call and record whether it raised.
+
+        Cancellation is not an outcome of the provider and is not recorded.
+        """
+
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(provider, time.monotonic() - started, False)
+            raise
+        self.record(provider, time.monotonic() - started, True)
+
+    def percentile(self, provider: str, q: float) -> float | None:
+        """Return the ``q`` quantile (0-1) of successful call latency."""
+
+        with self._lock:
+            latencies = sorted(s for s, ok in self._samples[provider] if ok)
+        if not latencies:
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    def successes(self, provider: str) -> int:
+        with self._lock:
+            return sum(1 for _, ok in self._samples[provider] if ok)
+
+    def error_rate(self, provider: str) -> float:
+        with self._lock:
+            samples = list(self._samples[provider])
+        if not samples:
+            return 0.0
+        return sum(1 for _, ok in samples if not ok) / len(samples)
+
+    def snapshot(self) -> dict:
+        """Return p50/p95 latency and error rate for every provider seen."""
+
+        with self._lock:
+            names = list(self._samples)
+        return {
+            name: {
+                "p50": self.percentile(name, 0.5),
+                "p95": self.percentile(name, 0.95),
+                "error_rate": self.error_rate(name),
+            }
+            for name in names
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+stats = LatencyStats()
+
+
+class ProviderRouter:
+    """Pick the provider and model to serve each request."""
+
+    def __init__(self, stats: LatencyStats):
+        self.stats = stats
+        self._providers: list | None = None
+        self._expires = 0.0
+
+    def providers(self) -> list:
+        """Return active providers, reloading ``AIProviderSettings`` periodically."""
+
+        now = time.monotonic()
+        if self._providers is not None and self._expires > now:
+            return self._providers
+
+        from .models import AIProviderSettings
+
+        google = GeminiProvider()
+        providers = [google]
+        for row in AIProviderSettings.objects.filter(is_active=True):
+            if row.provider_name == GeminiProvider.name:
+                google.default_model = row.default_model or google.default_model
+            elif row.api_endpoint:
+                providers.append(
+                    OpenAICompatibleProvider(
+                        row.provider_name,
+                        row.api_key,
+                        row.api_endpoint,
+                        row.default_model,
+                    )
+                )
+        self._providers = providers
+        self._expires = now + PROVIDERS_CACHE_SECONDS
+        return providers
+
+    def reset(self) -> None:
+        self._providers = None
+
+    def _latency(self, provider) -> float | None:
+        """Return the provider's p95 latency, or ``None`` without enough samples."""
+
+        if self.stats.successes(provider.name) < MIN_SAMPLES:
+            return None
+        return self.stats.percentile(provider.name, 0.95)
+
+    def rank(self, model_name: str) -> list[tuple]:
+        """Return ``(provider, model)`` candidates, best first.
+
+        Providers whose circuit is open for the model they would serve are
+        left out.  Raises :class:`CircuitOpenError` when none remain.  A
+        provider with too few samples is assumed to be as fast as the best
+        measured one, so it neither wins nor loses on latency and the
+        native-model preference decides until it has a track record.
+        """
+
+        candidates = []
+        for provider in self.providers():
+            native = provider.serves(model_name)
+            target = model_name if native else provider.default_model
+            if get_breaker(provider.name, target).state == "open":
+                continue
+            candidates.append((provider, target, self._latency(provider)))
+        if not candidates:
+            raise CircuitOpenError(
+                f"No AI provider available for {model_name} (all circuits open)"
+            )
+
+        neutral = min((p95 for _, _, p95 in candidates if p95 is not None), default=0.0)
+        ranked = []
+        for provider, target, p95 in candidates:
+            error_rate = self.stats.error_rate(provider.name)
+            p95 = neutral if p95 is None else p95
+            score = p95 * (1 + ERROR_PENALTY * error_rate) + error_rate
+            native = provider.serves(model_name)
+            if native:
+                score *= PREFERENCE
+            ranked.append((score, not native, provider, target))
+        ranked.sort(key=lambda c: (c[0], c[1]))
+        return [(provider, target) for _, _, provider, target in ranked]
+
+    def choose(self, model_name: str) -> tuple:
+        """Return the best ``(provider, model)`` for ``model_name``."""
+
+        return self.rank(model_name)[0]
+
+
+router = ProviderRouter(stats)
+
+
+__all__ = [
+    "Completion",
+    "GeminiProvider",
+    "LatencyStats",
+    "OpenAICompatibleProvider",
+    "ProviderRouter",
+    "ReplyStream",
+    "router",
+    "stats",
+]
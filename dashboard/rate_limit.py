@@ -0,0 +1,142 @@
+"""Fleet-wide outbound rate limiting for AI provider calls.
+
+Each provider/model pair gets a token bucket, implemented as GCRA (generic
+cell rate algorithm) over the shared Django cache so every web and worker
+process draws from the same budget.  Limits come from ``AIProviderSettings``.
+"""
+
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# How long provider limits read from the database are reused in-process.
+LIMITS_CACHE_SECONDS = 60
+# Default longest wait for a request slot before ``RateLimitExceeded``.
+ACQUIRE_TIMEOUT = 30
+
+_limits: dict[str, tuple[float, tuple[int, int] | None]] = {}
+
+
+class RateLimitExceeded(RuntimeError):
+    """Raised when a rate limit slot could not be acquired in time.
+
+    ``retry_after`` is the number of seconds until a slot frees up, if known.
+    """
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def get_limits(provider: str) -> tuple[int, int] | None:
+    """Return ``(requests_per_minute, burst)`` for ``provider`` or ``None``."""
+
+    now = time.monotonic()
+    cached = _limits.get(provider)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    from .models import AIProviderSettings
+
+    row = (
+        AIProviderSettings.objects.filter(provider_name=provider, is_active=True)
+        .values_list("requests_per_minute", "burst")
+        .first()
+    )
+    limits = (row[0], max(row[1], 1)) if row and row[0] else None
+    _limits[provider] = (now + LIMITS_CACHE_SECONDS, limits)
+    return limits
+
+
+def clear_limits_cache() -> None:
+    """Forget provider limits read from the database."""
+
+    _limits.clear()
+
+
+def _try_acquire(key: str, rate_per_minute: int, burst: int) -> float:
+    """Take a slot from the bucket; return ``0`` on success or seconds to wait."""
+
+    interval = 60.0 / rate_per_minute
+    lock_key = f"{key}:lock"
+    while not cache.add(lock_key, 1, 5):
+        time.sleep(0.005)
+    try:
+        now = time.time()
+        tat = max(cache.get(key) or now, now)
+        new_tat = tat + interval
+        wait = new_tat - now - burst * interval
+        if wait > 0:
+            return wait
+        cache.set(key, new_tat, int(new_tat - now) + 1)
+        return 0
+    finally:
+        cache.delete(lock_key)
+
+
+def _reserve(provider: str, model_name: str) -> float:
+    """Try to take a slot; return ``0`` on success or the seconds to wait."""
+
+    limits = get_limits(provider)
+    if limits is None:
+        return 0
+    return _try_acquire(f"ratelimit:{provider}:{model_name}", *limits)
+
+
+def acquire(
+    provider: str,
+    model_name: str,
+    *,
+    block: bool = True,
+    timeout: float = ACQUIRE_TIMEOUT,
+) -> bool:
+    """Take one request slot for ``model_name`` on ``provider``.
+
+    With ``block=False`` return ``False`` immediately when the bucket is
+    empty.  Otherwise wait for a slot, raising :class:`RateLimitExceeded`
+    if none frees up within ``timeout`` seconds.
+    """
+
+    deadline = time.monotonic() + timeout
+    while True:
+        wait = _reserve(provider, model_name)
+        if not wait:
+            return True
+        if not block:
+            return False
+        if time.monotonic() + wait > deadline:
+            raise RateLimitExceeded(
+                f"Rate limit for {provider}:{model_name} exceeded", retry_after=wait
+            )
+        time.sleep(wait)
+
+
+async def aacquire(
+    provider: str, model_name: str, *, timeout: float = ACQUIRE_TIMEOUT
+) -> None:
+    """Asynchronous, non-blocking counterpart of ``acquire(block=True)``."""
+
+    deadline = time.monotonic() + timeout
+    while True:
+        wait = await sync_to_async(_reserve)(provider, model_name)
+        if not wait:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimitExceeded(
+                f"Rate limit for {provider}:{model_name} exceeded", retry_after=wait
+            )
+        await asyncio.sleep(wait)
+
+
+__all__ = [
+    "RateLimitExceeded",
+    "aacquire",
+    "acquire",
+    "clear_limits_cache",
+    "get_limits",
+]
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import ContainerChatConsumer
+
+websocket_urlpatterns = [
+    path("ws/containers/<int:container_id>/chat/", ContainerChatConsumer.as_asgi()),
+]
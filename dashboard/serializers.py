@@ -2,7 +2,7 @@
 
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Container, UserProfile, ContainerConfig
+from .models import Container, UserProfile, ContainerConfig, Conversation, Message
 
 class UserSerializer(serializers.ModelSerializer):
     full_name = serializers.CharField(source='get_full_name', read_only=True)
@@ -156,3 +156,22 @@ class ContainerConfigSerializer(serializers.ModelSerializer):
             'is_active',
             'order',
         ]
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Conversation
+        fields = ['id', 'container', 'title', 'created_at']
+        read_only_fields = ['created_at']
+
+    def validate_container(self, value):
+        # Same rule as the chat action, which only the owner may use.
+        if value.owner_id != self.context['request'].user.pk:
+            raise serializers.ValidationError("Only the container owner can chat in it.")
+        return value
+
+
+class MessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ['id', 'role', 'text', 'created_at']
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserProfile
+from .utils import forget_api_quota
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def reload_api_quota(sender, instance, **kwargs):
+    """Reload the cached quota counter after a profile is edited or removed."""
+    forget_api_quota(instance.user_id)
@@ -0,0 +1,50 @@
+"""Celery queues for AI workloads.
+
+Interactive chat, suggestions and background jobs (refreshes, quota flushes)
+run on separate queues, so a burst of long chats cannot hold up quick
+suggestions.  ``settings.AI_TASK_QUEUES`` configures each queue: the time
+limits and ``acks_late`` apply to the queue's tasks, and ``concurrency`` and
+``prefetch_multiplier`` apply to a worker started for that queue alone
+(``celery -A portal worker -Q chat``).
+"""
+
+from django.conf import settings
+
+CHAT = "chat"
+SUGGESTIONS = "suggestions"
+BACKGROUND = "background"
+
+
+def task_options(queue: str) -> dict:
+    """Return ``shared_task`` options routing a task to ``queue``."""
+
+    config = settings.AI_TASK_QUEUES[queue]
+    return {
+        "queue": queue,
+        "soft_time_limit": config["soft_time_limit"],
+        "time_limit": config["time_limit"],
+        "acks_late": config["acks_late"],
+    }
+
+
+def configure_worker(conf, queues) -> str | None:
+    """Apply a queue's worker settings to ``conf`` if the worker serves only it.
+
+    ``queues`` is the worker's ``-Q`` option.  Returns the configured queue,
+    or ``None`` when the worker consumes several queues or an unknown one
+    and keeps the global Celery settings.
+    """
+
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    names = {name.strip() for name in queues or () if name.strip()}
+    if len(names) != 1 or not names <= settings.AI_TASK_QUEUES.keys():
+        return None
+    (queue,) = names
+    config = settings.AI_TASK_QUEUES[queue]
+    conf.worker_concurrency = config["concurrency"]
+    conf.worker_prefetch_multiplier = config["prefetch_multiplier"]
+    return queue
+
+
+__all__ = ["BACKGROUND", "CHAT", "SUGGESTIONS", "configure_worker", "task_options"]
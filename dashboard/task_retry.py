@@ -0,0 +1,129 @@
+"""Celery retry scheduling for tasks that call AI providers.
+
+Rather than sleeping between attempts inside the worker, a task that hits a
+transient provider error re-enqueues itself with a ``countdown`` chosen by
+the policy for that error class (jittered exponential backoff) and
+frees its worker slot meanwhile.  Retries draw from a fleet-wide per-minute
+budget so a provider brownout does not turn into a retry storm.  The time of
+the next attempt is kept in the cache for the task status API.
+"""
+
+import os
+import random
+import time
+
+import requests
+from django.core.cache import cache
+from google.api_core import exceptions as google_exceptions
+
+from .circuit_breaker import OPEN_SECONDS, CircuitOpenError
+from .rate_limit import RateLimitExceeded
+
+RETRY_BUDGET_PER_MINUTE = int(os.environ.get("AI_TASK_RETRY_BUDGET_PER_MINUTE", "120"))
+
+TRANSIENT_ERRORS = (
+    TimeoutError,
+    ConnectionError,
+    requests.ConnectionError,
+    requests.Timeout,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+)
+
+
+class RetryPolicy:
+    """Retry up to ``max_retries`` times, backing off from ``base`` to ``cap``."""
+
+    def __init__(self, max_retries: int, base: float, cap: float):
+        self.max_retries = max_retries
+        self.base = base
+        self.cap = cap
+
+    def countdown(self, retries: int, exc: Exception) -> float:
+        """Return the delay before retry number ``retries + 1``.
+
+        Never shorter than the error's ``retry_after`` hint, if any.
+        """
+
+        backoff = random.uniform(self.base, min(self.cap, self.base * 2**retries))
+        return max(backoff, getattr(exc, "retry_after", None) or 0)
+
+
+RATE_LIMITED = RetryPolicy(max_retries=5, base=1, cap=60)
+# The breaker stays open for OPEN_SECONDS; retrying sooner would fail fast again.
+CIRCUIT_OPEN = RetryPolicy(max_retries=3, base=OPEN_SECONDS, cap=4 * OPEN_SECONDS)
+TRANSIENT = RetryPolicy(max_retries=4, base=2, cap=60)
+
+
+def policy_for(exc: Exception) -> RetryPolicy | None:
+    """Return the retry policy for ``exc``, or ``None`` if it is not transient."""
+
+    if isinstance(exc, RateLimitExceeded):
+        return RATE_LIMITED
+    if isinstance(exc, CircuitOpenError):
+        return CIRCUIT_OPEN
+    if isinstance(exc, TRANSIENT_ERRORS):
+        return TRANSIENT
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        if status == 429 or status >= 500:
+            return TRANSIENT
+    return None
+
+
+def _take_retry_budget() -> bool:
+    """Consume one retry from the shared per-minute budget if any is left."""
+
+    key = f"tasks:retries:{int(time.time() // 60)}"
+    cache.add(key, 0, 120)
+    return cache.incr(key) <= RETRY_BUDGET_PER_MINUTE
+
+
+def retry_status_key(task_id: str) -> str:
+    """Return the cache key holding :func:`retry_status` for ``task_id``."""
+
+    return f"tasks:retry:{task_id}"
+
+
+def retry_countdown(task, exc: Exception) -> float | None:
+    """Decide whether ``task`` should retry after ``exc``.
+
+    Returns the countdown for ``task.retry`` and records the next attempt
+    for :func:`retry_status`, or ``None`` when the error is not transient,
+    the policy's retries are used up or the retry budget is spent.
+    """
+
+    policy = policy_for(exc)
+    retries = task.request.retries
+    if policy is None or retries >= policy.max_retries or not _take_retry_budget():
+        return None
+    countdown = policy.countdown(retries, exc)
+    cache.set(
+        retry_status_key(task.request.id),
+        {
+            "attempt": retries + 2,
+            "next_attempt_at": time.time() + countdown,
+            "error": str(exc),
+        },
+        int(countdown) + 3600,
+    )
+    return countdown
+
+
+def retry_status(task_id: str) -> dict | None:
+    """Return ``attempt``, ``next_attempt_at`` and ``error`` for a retrying task."""
+
+    return cache.get(retry_status_key(task_id))
+
+
+__all__ = [
+    "RetryPolicy",
+    "policy_for",
+    "retry_countdown",
+    "retry_status",
+    "retry_status_key",
+]
@@ -0,0 +1,147 @@
+"""Celery task status for the API, with long-polling.
+
+Instead of polling ``/api/tasks/<id>/`` every second, clients can call
+``/api/tasks/<id>/wait/``, which subscribes to the result backend's pub/sub
+channel for the task and returns as soon as the task stores a new state,
+or when ``TASK_STATUS_MAX_WAIT`` seconds pass.  Celery's Redis backend
+publishes every state it stores on a channel named after the result key.
+
+Pages watching several tasks use :func:`batch_status`, which reads all of
+their result keys with one ``MGET`` and reports only the tasks that changed
+since the client's last ``marker``.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import time
+
+import redis.asyncio as redis
+from asgiref.sync import sync_to_async
+from celery import current_app, states
+from celery.result import AsyncResult
+from django.conf import settings
+from django.core.cache import cache
+
+from .task_retry import retry_status, retry_status_key
+
+MAX_WAIT = float(os.environ.get("TASK_STATUS_MAX_WAIT", "25"))
+# Most task ids accepted by one batch status request.
+BATCH_LIMIT = 100
+
+
+def task_status(task_id: str) -> dict:
+    """Return the status and result (if ready) of a Celery task.
+
+    A task waiting to retry reports ``RETRY`` with its next ``attempt``
+    number and ``next_attempt_at`` (Unix time).
+    """
+
+    result = AsyncResult(task_id)
+    if result.successful():
+        return {"status": result.status, "result": result.result}
+    if result.status == states.RETRY:
+        retry = retry_status(task_id) or {}
+        return {
+            "status": result.status,
+            "attempt": retry.get("attempt"),
+            "next_attempt_at": retry.get("next_attempt_at"),
+        }
+    return {"status": result.status}
+
+
+async def wait_for_task(task_id: str, timeout: float = MAX_WAIT) -> dict:
+    """Return :func:`task_status` once the task stores a new state.
+
+    Returns at once for a finished task, otherwise after the next state
+    change or ``timeout`` seconds, whichever comes first.
+    """
+
+    timeout = min(max(timeout, 0), MAX_WAIT)
+    read_status = sync_to_async(task_status, thread_sensitive=False)
+    client = redis.from_url(settings.CELERY_RESULT_BACKEND)
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(AsyncResult(task_id).backend.get_key_for_task(task_id))
+        # Read after subscribing so a state stored in between is not missed.
+        status = await read_status(task_id)
+        if status["status"] in states.READY_STATES:
+            return status
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                return await read_status(task_id)
+        return status
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
+
+
+def _fingerprint(meta: dict) -> str:
+    digest = hashlib.sha256(f"{meta['status']}\0{meta.get('date_done')}".encode())
+    return digest.hexdigest()[:12]
+
+
+def encode_marker(seen: dict) -> str:
+    """Return an opaque marker for the task fingerprints in ``seen``."""
+
+    return base64.urlsafe_b64encode(json.dumps(seen).encode()).decode()
+
+
+def decode_marker(marker: str) -> dict:
+    """Return the fingerprints in ``marker``; an invalid marker counts as empty."""
+
+    try:
+        seen = json.loads(base64.urlsafe_b64decode(marker.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return {}
+    return seen if isinstance(seen, dict) else {}
+
+
+def batch_status(task_ids: list[str], marker: str = "") -> tuple[dict, str]:
+    """Return ``(statuses, marker)`` for the tasks in ``task_ids``.
+
+    All result keys are read in one ``MGET``.  ``statuses`` maps each task
+    whose state changed since ``marker`` to its :func:`task_status` payload;
+    the returned marker covers every task in ``task_ids``.
+    """
+
+    backend = current_app.backend
+    values = backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+    metas = {
+        task_id: backend.decode_result(value) if value else {"status": states.PENDING}
+        for task_id, value in zip(task_ids, values)
+    }
+    seen = decode_marker(marker)
+    fingerprints = {task_id: _fingerprint(meta) for task_id, meta in metas.items()}
+    changed = [
+        task_id for task_id in task_ids if seen.get(task_id) != fingerprints[task_id]
+    ]
+    retries = cache.get_many(
+        [
+            retry_status_key(task_id)
+            for task_id in changed
+            if metas[task_id]["status"] == states.RETRY
+        ]
+    )
+
+    statuses = {}
+    for task_id in changed:
+        meta = metas[task_id]
+        status = {"status": meta["status"]}
+        if meta["status"] == states.SUCCESS:
+            status["result"] = meta.get("result")
+        elif meta["status"] == states.RETRY:
+            retry = retries.get(retry_status_key(task_id)) or {}
+            status["attempt"] = retry.get("attempt")
+            status["next_attempt_at"] = retry.get("next_attempt_at")
+        statuses[task_id] = status
+    return statuses, encode_marker(fingerprints)
+
+
+__all__ = ["MAX_WAIT", "batch_status", "task_status", "wait_for_task"]
@@ -1,42 +1,264 @@
 import json
+import time
+from asgiref.sync import async_to_sync
 from celery import shared_task
-import google.generativeai as genai
+from channels.layers import get_channel_layer
 from django.contrib.auth import get_user_model
 
-from .ai_service import get_model
-from .utils import decrement_api_quota
+from django.conf import settings
+
+from .ai import compose_greeting
+from .ai_cache import set_many_with_soft_ttl, set_with_soft_ttl
+from .ai_service import JSON_RESPONSE, call_gemini
+from .chat_history import compact_history
+from .circuit_breaker import get_breaker
+from . import fair_share
+from .conversations import append_message, current_stream_channel, load_history
+from .fair_share import FairShareTask
+from .metrics import track_call
+from .providers import router
+from .rate_limit import acquire
+from .task_queues import BACKGROUND, CHAT, SUGGESTIONS, task_options
+from .task_retry import retry_countdown
+from .utils import (
+    charge_api_quota,
+    check_api_quota,
+    flush_api_quota,
+    history_texts,
+    quota_charger,
+    usage_tokens,
+)
 from .models import Container
 
 
-@shared_task
-def gemini_suggestion_task(user_id, prompt):
+@shared_task(bind=True, **task_options(SUGGESTIONS))
+def gemini_suggestion_task(self, user_id, prompt):
+    user = get_user_model().objects.get(pk=user_id)
+    check_api_quota(user, prompt)
+    try:
+        response_text = call_gemini(
+            prompt,
+            model_name='gemini-2.5-flash',
+            max_retries=1,
+            generation_config=JSON_RESPONSE,
+            site="suggestion_task",
+            on_completion=quota_charger(user, prompt),
+            acquire_timeout=0,
+        )
+    except Exception as e:
+        countdown = retry_countdown(self, e)
+        if countdown is None:
+            raise
+        raise self.retry(exc=e, countdown=countdown, max_retries=None)
+    return json.loads(response_text)
+
+
+@shared_task(bind=True, **task_options(BACKGROUND))
+def refresh_suggestion_task(self, user_id, cache_key, prompt):
+    """Recompute a stale container suggestion and store it as fresh."""
     user = get_user_model().objects.get(pk=user_id)
-    model = get_model('gemini-2.5-flash')
-    response = model.generate_content(
-        prompt,
-        generation_config=genai.types.GenerationConfig(
-            response_mime_type="application/json"
-        ),
+    check_api_quota(user, prompt)
+    try:
+        response_text = call_gemini(
+            prompt,
+            model_name="gemini-2.5-flash",
+            site="suggestion_refresh",
+            on_completion=quota_charger(user, prompt),
+            max_retries=1,
+            acquire_timeout=0,
+            # A cached response could be the stale text being refreshed.
+            cache_ttl=0,
+        )
+    except Exception as e:
+        countdown = retry_countdown(self, e)
+        if countdown is None:
+            raise
+        raise self.retry(exc=e, countdown=countdown, max_retries=None)
+    data = json.loads(response_text)
+    set_with_soft_ttl(
+        cache_key, data, settings.AI_SUGGESTION_SOFT_TTL, settings.AI_SUGGESTION_HARD_TTL
+    )
+
+
+def store_bundle(keys, prompt, user, **call_options):
+    """Fill the suggestion caches named in ``keys`` from one Gemini call.
+
+    ``keys`` maps ``questions``, ``personas`` and optionally ``function`` to
+    cache keys; returns the stored ``{cache_key: value}`` entries.  ``user``
+    is charged for the tokens used.  ``call_options`` are passed on to
+    :func:`~dashboard.ai_service.call_gemini`.
+    """
+    check_api_quota(user, prompt)
+    data = json.loads(
+        call_gemini(
+            prompt,
+            model_name="gemini-2.5-flash",
+            generation_config=JSON_RESPONSE,
+            site="bundle",
+            on_completion=quota_charger(user, prompt),
+            **call_options,
+        )
     )
-    decrement_api_quota(user)
-    return json.loads(response.text)
-
-
-@shared_task
-def chat_task(user_id, container_id, message, history_from_client):
-    container = Container.objects.get(pk=container_id)
-    sdk_history = []
-    for item in history_from_client:
-        role = 'model' if item.get('role') == 'model' else 'user'
-        sdk_history.append({'role': role, 'parts': [item.get('text', '')]})
-    model = get_model(
-        container.selectedModel,
-        system_instruction=(
-            f"You are an assistant for the {container.name} container. Your persona is {container.selectedPersona}."
-        ),
+    entries = {
+        keys["questions"]: {"suggestions": data.get("questions", [])},
+        keys["personas"]: {"suggestions": data.get("personas", [])},
+    }
+    if "function" in keys:
+        entries[keys["function"]] = data.get("function", {})
+    set_many_with_soft_ttl(
+        entries, settings.AI_SUGGESTION_SOFT_TTL, settings.AI_SUGGESTION_HARD_TTL
     )
-    chat = model.start_chat(history=sdk_history)
-    response = chat.send_message(message)
+    return entries
+
+
+@shared_task(bind=True, **task_options(BACKGROUND))
+def refresh_bundle_task(self, user_id, keys, prompt):
+    """Recompute stale bundled suggestions and store them as fresh."""
     user = get_user_model().objects.get(pk=user_id)
-    decrement_api_quota(user)
-    return {"reply": response.text}
+    try:
+        # A cached response could be the stale text being refreshed.
+        store_bundle(keys, prompt, user, max_retries=1, acquire_timeout=0, cache_ttl=0)
+    except Exception as e:
+        countdown = retry_countdown(self, e)
+        if countdown is None:
+            raise
+        raise self.retry(exc=e, countdown=countdown, max_retries=None)
+
+
+@shared_task(**task_options(BACKGROUND))
+def flush_api_quota_task():
+    """Save cached quota charges to ``UserProfile``; run by celery beat."""
+    return len(flush_api_quota())
+
+
+@shared_task(**task_options(BACKGROUND))
+def dispatch_chat_tasks_task():
+    """Dispatch queued chats whose slots were freed by lost tasks; run by beat."""
+    return fair_share.dispatch()
+
+
+@shared_task(**task_options(BACKGROUND))
+def refresh_greeting_task(name):
+    """Recompute a stale hub greeting and store it as fresh."""
+    set_with_soft_ttl(
+        f"ai_greeting:{name}",
+        compose_greeting(name),
+        settings.AI_GREETING_SOFT_TTL,
+        settings.AI_GREETING_HARD_TTL,
+    )
+
+
+def _send_event(channel_name, event):
+    async_to_sync(get_channel_layer().send)(channel_name, event)
+
+
+def _send_chat_event(channel_name, event):
+    """Send a chat task event to the channel its latest submission came from.
+
+    ``channel_name`` is used unless a resend moved the stream elsewhere.
+    """
+    _send_event(current_stream_channel(event["task_id"], channel_name), event)
+
+
+def _stream_reply(chunks, channel_name, task_id):
+    """Send reply ``chunks`` to ``channel_name`` as they arrive and return the text."""
+    parts = []
+    for text in chunks:
+        parts.append(text)
+        _send_chat_event(channel_name, {"type": "chat.chunk", "task_id": task_id, "text": text})
+    reply = "".join(parts)
+    _send_chat_event(channel_name, {"type": "chat.done", "task_id": task_id, "reply": reply})
+    return reply
+
+
+def container_system_instruction(container):
+    """Return the chat system instruction for ``container``.
+
+    It only depends on the container, so large ones are served from
+    provider-side cached context (see :mod:`dashboard.context_cache`).
+    """
+    instruction = (
+        f"You are an assistant for the {container.name} container. Your persona is {container.selectedPersona}."
+    )
+    if container.description:
+        instruction += f"\n\nReference material:\n{container.description}"
+    return instruction
+
+
+@shared_task(bind=True, base=FairShareTask, **task_options(CHAT))
+def chat_task(
+    self,
+    user_id,
+    container_id,
+    message,
+    history_from_client,
+    stream_channel=None,
+    conversation_id=None,
+    message_id=None,
+):
+    """Reply to ``message`` in a container chat.
+
+    With ``conversation_id`` the history is read from the stored conversation
+    (turns before ``message_id``) and the reply is appended to it; otherwise
+    ``history_from_client`` is used.  Transient provider errors re-enqueue
+    the task with backoff (see :mod:`dashboard.task_retry`).
+    """
+    stream = None
+    try:
+        container = Container.objects.get(pk=container_id)
+        user = get_user_model().objects.get(pk=user_id)
+        if conversation_id is not None:
+            history_from_client = load_history(conversation_id, message_id)
+        # Older turns beyond the model's history budget arrive as a summary.
+        summary, recent = compact_history(container.selectedModel, history_from_client, user)
+        if summary:
+            # Kept out of the system instruction, which is cached per container.
+            recent = [
+                {'role': 'user', 'text': f"Summary of our earlier conversation:\n{summary}"},
+                {'role': 'model', 'text': "Understood."},
+            ] + recent
+        sdk_history = []
+        for item in recent:
+            role = 'model' if item.get('role') == 'model' else 'user'
+            sdk_history.append({'role': role, 'parts': [item.get('text', '')]})
+        system_instruction = container_system_instruction(container)
+        with track_call(container.selectedModel, "chat") as call:
+            call.attempts = 1
+            provider, model_name = router.choose(container.selectedModel)
+            acquire(provider.name, model_name, timeout=0)
+            with router.stats.track(provider.name), get_breaker(provider.name, model_name).protect():
+                if stream_channel:
+                    stream = provider.stream_chat(model_name, system_instruction, sdk_history, message)
+                    _stream_reply(stream, stream_channel, self.request.id)
+                    completion = stream.completion
+                else:
+                    completion = provider.chat(model_name, system_instruction, sdk_history, message)
+            call.completed(model_name, completion)
+        reply = completion.text
+    except Exception as e:
+        # A reply that has started streaming cannot be retried without the
+        # client seeing it twice.
+        countdown = None if stream and stream.started else retry_countdown(self, e)
+        # Routing, rate-limit and circuit failures must reach the client too,
+        # not only errors raised mid-stream.
+        if stream_channel and countdown is not None:
+            _send_chat_event(
+                stream_channel,
+                {
+                    "type": "chat.retrying",
+                    "task_id": self.request.id,
+                    "next_attempt_at": time.time() + countdown,
+                },
+            )
+        elif stream_channel:
+            _send_chat_event(
+                stream_channel, {"type": "chat.error", "task_id": self.request.id, "error": str(e)}
+            )
+        if countdown is None:
+            raise
+        raise self.retry(exc=e, countdown=countdown, max_retries=None)
+    prompt_texts = (system_instruction, message, *history_texts(recent))
+    charge_api_quota(user, usage_tokens(completion, *prompt_texts))
+    if conversation_id is not None:
+        append_message(conversation_id, 'model', reply)
+    return {"reply": reply}
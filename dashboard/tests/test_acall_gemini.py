@@ -0,0 +1,64 @@
+import asyncio
+import os
+from unittest import mock
+
+import pytest
+
+from dashboard import ai_service
+
+
+def test_acall_gemini_retries_with_async_backoff(monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    model_instance = mock.Mock()
+    model_instance.generate_content_async = mock.AsyncMock(
+        side_effect=[TimeoutError("boom"), mock.Mock(text=" hi ")]
+    )
+    monkeypatch.setattr(
+        ai_service.genai, "GenerativeModel", lambda *a, **k: model_instance
+    )
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr("dashboard.ai_service.asyncio.sleep", fake_sleep)
+    monkeypatch.setattr(
+        "dashboard.ai_service.time.sleep",
+        mock.Mock(side_effect=AssertionError("blocked")),
+    )
+
+    assert asyncio.run(ai_service.acall_gemini("hello")) == "hi"
+    assert sleeps == [1]
+
+
+def test_acall_gemini_limits_concurrency_and_propagates_cancel(monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    monkeypatch.setattr(ai_service, "MAX_CONCURRENCY", 1)
+    active = []
+    peak = []
+
+    async def slow_generate(*args, **kwargs):
+        active.append(1)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.pop()
+        return mock.Mock(text="ok")
+
+    model_instance = mock.Mock(generate_content_async=slow_generate)
+    monkeypatch.setattr(
+        ai_service.genai, "GenerativeModel", lambda *a, **k: model_instance
+    )
+
+    async def run():
+        results = await asyncio.gather(
+            *(ai_service.acall_gemini("p") for _ in range(3))
+        )
+        task = asyncio.ensure_future(ai_service.acall_gemini("p"))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return results
+
+    assert asyncio.run(run()) == ["ok", "ok", "ok"]
+    assert max(peak) == 1
@@ -1,5 +1,4 @@
 import os
-from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
 
 from django.urls import reverse
@@ -53,16 +52,15 @@ class TestGeminiActions(APITestCase):
         self.assertIn('error', resp.data)
         mock_call.assert_not_called()
 
-    @patch('dashboard.tasks.genai.GenerativeModel')
-    @patch('dashboard.tasks.chat_task.delay')
+    @patch('dashboard.ai_service.genai.GenerativeModel')
+    @patch('dashboard.tasks.chat_task.apply_async')
     def test_chat_success_and_error(self, mock_delay, mock_model):
-        mock_delay.return_value = SimpleNamespace(id='t4')
         self.client.login(username='owner', password='pass')
         url = reverse('container-chat', args=[self.container.id])
         resp = self.client.post(url, {'message': 'hi', 'history': []}, format='json')
         self.assertEqual(resp.status_code, 202)
-        self.assertEqual(resp.data['task_id'], 't4')
         mock_delay.assert_called_once()
+        self.assertEqual(resp.data['task_id'], mock_delay.call_args.kwargs['task_id'])
 
         mock_delay.reset_mock()
         resp = self.client.post(url, {}, format='json')
@@ -6,6 +6,7 @@ from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 
 from dashboard.models import Container, UserProfile
+from dashboard.utils import flush_api_quota
 from django.core.cache import cache
 
 
@@ -18,15 +19,17 @@ class TestAPIQuota(APITestCase):
         self.url = reverse('container-suggest-questions', args=[self.container.id])
 
     @patch('dashboard.api_views.genai.GenerativeModel')
-    def test_quota_decrements_on_success(self, mock_model):
+    def test_quota_charges_reported_tokens(self, mock_model):
         os.environ['GOOGLE_API_KEY'] = 'dummy'
         instance = mock_model.return_value
-        instance.generate_content.return_value = Mock(text='{}')
-        UserProfile.objects.create(user=self.user, api_quota=2)
+        usage = Mock(prompt_token_count=30, candidates_token_count=2)
+        instance.generate_content.return_value = Mock(text='{}', usage_metadata=usage)
+        UserProfile.objects.create(user=self.user, api_quota=10_000)
         self.client.login(username="u", password="pass")
         self.client.post(self.url)
+        flush_api_quota()
         profile = UserProfile.objects.get(user=self.user)
-        assert profile.api_quota == 1
+        assert profile.api_quota == 9_968
 
     @patch('dashboard.api_views.genai.GenerativeModel')
     def test_quota_enforced_when_exhausted(self, mock_model):
@@ -38,3 +41,26 @@ class TestAPIQuota(APITestCase):
         response = self.client.post(self.url)
         assert response.status_code == 429
         assert instance.generate_content.call_count == 0
+
+    @patch('dashboard.api_views.genai.GenerativeModel')
+    def test_request_rejected_when_estimate_exceeds_budget(self, mock_model):
+        os.environ['GOOGLE_API_KEY'] = 'dummy'
+        instance = mock_model.return_value
+        UserProfile.objects.create(user=self.user, api_quota=100)
+        self.client.login(username="u", password="pass")
+        response = self.client.post(self.url)
+        assert response.status_code == 429
+        assert instance.generate_content.call_count == 0
+        assert UserProfile.objects.get(user=self.user).api_quota == 100
+
+    @patch('dashboard.tasks.chat_task.apply_async')
+    def test_chat_estimate_includes_history(self, mock_delay):
+        UserProfile.objects.create(user=self.user, api_quota=2_000)
+        self.client.login(username="u", password="pass")
+        url = reverse('container-chat', args=[self.container.id])
+        history = [{'role': 'user', 'text': 'x' * 8_000}]
+        response = self.client.post(
+            url, {'message': 'hi', 'history': history}, format='json'
+        )
+        assert response.status_code == 429
+        mock_delay.assert_not_called()
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import User
+
+from dashboard import chat_history
+from dashboard.chat_history import SUMMARY_STEP, compact_history, split_history
+from dashboard.models import Container
+from dashboard.tasks import chat_task
+
+
+def turns(count, size=40):
+    return [
+        {"role": "user" if i % 2 == 0 else "model", "text": f"{i:03d}" + "x" * size}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def budget(settings):
+    settings.AI_CHAT_HISTORY_TOKENS = 100
+    settings.AI_CHAT_SUMMARY_TOKENS = 20
+    return settings
+
+
+def test_short_history_is_kept_verbatim(budget):
+    history = turns(4)
+    assert split_history("gemini-2.5-flash", history) == ([], history)
+
+
+def test_long_history_is_split_on_summary_blocks(budget):
+    history = turns(20)
+    older, recent = split_history("gemini-2.5-flash", history)
+    assert older + recent == history
+    assert len(older) % SUMMARY_STEP == 0
+    assert sum(len(item["text"]) for item in recent) / 4 <= 80
+
+
+def test_per_model_budget(budget):
+    budget.AI_CHAT_HISTORY_TOKENS_BY_MODEL = {"gemini-2.5-pro": 10_000}
+    history = turns(20)
+    assert split_history("gemini-2.5-pro", history) == ([], history)
+
+
+@mock.patch("dashboard.chat_history.call_gemini")
+def test_summary_is_extended_incrementally(mock_call, budget):
+    mock_call.side_effect = ["first summary", "second summary"]
+    history = turns(2 * SUMMARY_STEP)
+
+    assert chat_history.summarize(history[:SUMMARY_STEP]) == "first summary"
+    assert chat_history.summarize(history[:SUMMARY_STEP]) == "first summary"
+    assert chat_history.summarize(history) == "second summary"
+
+    assert mock_call.call_count == 2
+    prompt = mock_call.call_args.args[0]
+    assert "first summary" in prompt
+    assert "000x" not in prompt
+    assert f"{SUMMARY_STEP:03d}x" in prompt
+
+
+@mock.patch("dashboard.chat_history.call_gemini", side_effect=ValueError("blocked"))
+def test_failed_summary_drops_older_turns(mock_call, budget):
+    summary, recent = compact_history("gemini-2.5-flash", turns(20))
+    assert summary == ""
+    assert recent == split_history("gemini-2.5-flash", turns(20))[1]
+
+
+@mock.patch("dashboard.chat_history.call_gemini", side_effect=TimeoutError("slow"))
+def test_transient_summary_error_is_raised_without_blocking(mock_call, budget):
+    with pytest.raises(TimeoutError):
+        compact_history("gemini-2.5-flash", turns(20))
+    kwargs = mock_call.call_args.kwargs
+    assert kwargs["max_retries"] == 1
+    assert kwargs["acquire_timeout"] == 0
+
+
+@mock.patch("dashboard.chat_history.call_gemini", return_value="they said hi")
+@mock.patch("dashboard.ai_service.genai.GenerativeModel")
+def test_chat_task_sends_summary_and_recent_turns(mock_model, mock_call, budget):
+    user = User.objects.create_user(username="u", password="p")
+    container = Container.objects.create(name="C", owner=user)
+    chat = mock_model.return_value.start_chat.return_value
+    chat.send_message.return_value = SimpleNamespace(text="ok")
+    history = turns(20)
+
+    chat_task.apply(args=(user.id, container.id, "hi", history)).get()
+
+    _, recent = split_history(container.selectedModel, history)
+    sent = mock_model.return_value.start_chat.call_args.kwargs["history"]
+    assert [item["parts"][0] for item in sent] == [
+        "Summary of our earlier conversation:\nthey said hi",
+        "Understood.",
+    ] + [item["text"] for item in recent]
@@ -0,0 +1,124 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from dashboard.consumers import ContainerChatConsumer
+from dashboard.models import Container, UserProfile
+from dashboard.tasks import chat_task
+from dashboard.utils import flush_api_quota
+
+
+class TestChatStreaming(TestCase):
+    def setUp(self):
+        os.environ['GOOGLE_API_KEY'] = 'dummy'
+        self.user = User.objects.create_user(username='u', password='p')
+        self.container = Container.objects.create(name='C', owner=self.user)
+        UserProfile.objects.create(user=self.user, api_quota=1000)
+
+    @patch('dashboard.tasks.get_channel_layer')
+    @patch('dashboard.ai_service.genai.GenerativeModel')
+    def test_chat_task_streams_chunks_to_channel(self, mock_model, mock_layer):
+        chat = mock_model.return_value.start_chat.return_value
+        response = MagicMock()
+        response.__iter__.return_value = iter(
+            [SimpleNamespace(text='Hel'), SimpleNamespace(text='lo')]
+        )
+        response.usage_metadata = SimpleNamespace(
+            prompt_token_count=20, candidates_token_count=3
+        )
+        chat.send_message.return_value = response
+        layer = mock_layer.return_value
+        layer.send = AsyncMock()
+
+        result = chat_task.apply(
+            args=(self.user.id, self.container.id, 'hi', []),
+            kwargs={'stream_channel': 'chan'},
+            task_id='t1',
+        ).get()
+
+        self.assertEqual(result, {'reply': 'Hello'})
+        chat.send_message.assert_called_once_with('hi', stream=True)
+        events = [call.args for call in layer.send.await_args_list]
+        self.assertEqual(
+            events,
+            [
+                ('chan', {'type': 'chat.chunk', 'task_id': 't1', 'text': 'Hel'}),
+                ('chan', {'type': 'chat.chunk', 'task_id': 't1', 'text': 'lo'}),
+                ('chan', {'type': 'chat.done', 'task_id': 't1', 'reply': 'Hello'}),
+            ],
+        )
+        flush_api_quota()
+        self.assertEqual(UserProfile.objects.get(user=self.user).api_quota, 977)
+
+    @patch('dashboard.tasks.get_channel_layer')
+    @patch('dashboard.tasks.router.choose', side_effect=ValueError('open'))
+    def test_chat_task_reports_failures_before_streaming(self, mock_choose, mock_layer):
+        layer = mock_layer.return_value
+        layer.send = AsyncMock()
+
+        result = chat_task.apply(
+            args=(self.user.id, self.container.id, 'hi', []),
+            kwargs={'stream_channel': 'chan'},
+            task_id='t1',
+        )
+
+        self.assertTrue(result.failed())
+        layer.send.assert_awaited_once_with(
+            'chan', {'type': 'chat.error', 'task_id': 't1', 'error': 'open'}
+        )
+        self.assertEqual(UserProfile.objects.get(user=self.user).api_quota, 1000)
+
+    def test_consumer_forwards_chunks_to_client(self):
+        consumer = ContainerChatConsumer()
+        consumer.send_json = AsyncMock()
+        async_to_sync(consumer.chat_chunk)(
+            {'type': 'chat.chunk', 'task_id': 't1', 'text': 'Hel'}
+        )
+        consumer.send_json.assert_awaited_once_with(
+            {'type': 'chunk', 'task_id': 't1', 'text': 'Hel'}
+        )
+
+    def consumer(self, channel_name):
+        consumer = ContainerChatConsumer()
+        consumer.scope = {
+            'user': self.user,
+            'url_route': {'kwargs': {'container_id': self.container.id}},
+        }
+        consumer.container_id = self.container.id
+        consumer.channel_name = channel_name
+        consumer.send_json = AsyncMock()
+        return consumer
+
+    @patch('dashboard.tasks.get_channel_layer')
+    @patch('dashboard.ai_service.genai.GenerativeModel')
+    @patch('dashboard.tasks.chat_task.apply_async')
+    def test_resend_after_reconnect_streams_to_new_connection(
+        self, mock_apply, mock_model, mock_layer
+    ):
+        content = {'message': 'hi', 'idempotency_key': 'k1'}
+        old, new = self.consumer('old-chan'), self.consumer('new-chan')
+        async_to_sync(old.receive_json)(content)
+        # The client reconnects and resends the same message.
+        async_to_sync(new.receive_json)(content)
+        queued = old.send_json.await_args.args[0]
+        self.assertEqual(queued['type'], 'queued')
+        self.assertEqual(new.send_json.await_args.args[0], queued)
+        mock_apply.assert_called_once()
+
+        chat = mock_model.return_value.start_chat.return_value
+        response = MagicMock()
+        response.__iter__.return_value = iter([SimpleNamespace(text='Hi')])
+        response.usage_metadata = None
+        chat.send_message.return_value = response
+        layer = mock_layer.return_value
+        layer.send = AsyncMock()
+        args, kwargs = mock_apply.call_args.args
+        self.assertEqual(kwargs['stream_channel'], 'old-chan')
+        chat_task.apply(args, kwargs, task_id=mock_apply.call_args.kwargs['task_id'])
+
+        channels = {call.args[0] for call in layer.send.await_args_list}
+        self.assertEqual(channels, {'new-chan'})
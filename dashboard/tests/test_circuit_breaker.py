@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+import time
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+
+from dashboard import ai, ai_service
+from dashboard.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def _fail(breaker):
+    with pytest.raises(ValueError):
+        with breaker.protect():
+            raise ValueError("boom")
+
+
+def test_breaker_opens_on_failure_rate_and_probes():
+    cache.clear()
+    breaker = CircuitBreaker("t", min_requests=2, failure_rate=0.5, open_seconds=0.05)
+    _fail(breaker)
+    assert breaker.state == "closed"
+    _fail(breaker)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        with breaker.protect():
+            pass
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    with breaker.protect():
+        # A concurrent caller is rejected while the probe is in flight.
+        with pytest.raises(CircuitOpenError):
+            with CircuitBreaker("t").protect():
+                pass
+    assert breaker.state == "closed"
+
+
+def test_aprotect_keeps_cache_calls_off_the_event_loop(monkeypatch):
+    cache.clear()
+    breaker = CircuitBreaker("t", min_requests=1, failure_rate=0.5)
+    loop_threads = []
+    acquire = breaker._acquire
+
+    def tracking_acquire():
+        loop_threads.append(threading.current_thread())
+        return acquire()
+
+    monkeypatch.setattr(breaker, "_acquire", tracking_acquire)
+
+    async def fail():
+        loop_threads.append(threading.current_thread())
+        async with breaker.aprotect():
+            raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(fail())
+    loop_thread, acquire_thread = loop_threads
+    assert acquire_thread is not loop_thread
+    assert breaker.state == "open"
+
+
+def test_open_circuit_short_circuits_call_gemini_and_greeting(monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    cache.clear()
+    CircuitBreaker("google:gemini-1.5-flash")._open()
+    factory = mock.Mock()
+    monkeypatch.setattr(ai_service.genai, "GenerativeModel", factory)
+    monkeypatch.setattr(
+        "dashboard.ai_service.time.sleep",
+        mock.Mock(side_effect=AssertionError("retried")),
+    )
+
+    with pytest.raises(CircuitOpenError):
+        ai_service.call_gemini("hello")
+    assert ai.compose_greeting("Ann") == "Welcome back, Ann!"
+    factory.return_value.generate_content.assert_not_called()
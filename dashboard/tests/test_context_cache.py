@@ -0,0 +1,65 @@
+import time
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+
+from dashboard import context_cache
+from dashboard.providers import GeminiProvider
+
+LARGE = "x" * (4 * context_cache.MIN_TOKENS)
+
+
+@pytest.fixture
+def cached_content(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "dummy")
+    api = mock.Mock()
+    api.create.return_value = mock.Mock()
+    api.create.return_value.name = "cachedContents/abc"
+    monkeypatch.setattr(context_cache.ai_service.genai.caching, "CachedContent", api)
+    return api
+
+
+def test_small_prefix_is_sent_inline(cached_content):
+    assert context_cache.cached_content("gemini-2.5-flash", "short") is None
+    cached_content.create.assert_not_called()
+
+
+def test_handle_is_created_once_and_extended_before_expiry(cached_content):
+    for _ in range(2):
+        name = context_cache.cached_content("gemini-2.5-flash", LARGE)
+        assert name == "cachedContents/abc"
+    cached_content.create.assert_called_once()
+    assert cached_content.create.call_args.kwargs["system_instruction"] == LARGE
+
+    key = context_cache._key("gemini-2.5-flash", LARGE)
+    cache.set(key, {"name": name, "expires": time.time() + 10})
+    assert context_cache.cached_content("gemini-2.5-flash", LARGE) == name
+    cached_content.get.return_value.update.assert_called_once()
+    cached_content.create.assert_called_once()
+
+
+def test_changed_prefix_gets_a_new_handle(cached_content):
+    context_cache.cached_content("gemini-2.5-flash", LARGE)
+    context_cache.cached_content("gemini-2.5-flash", LARGE + " edited")
+    assert cached_content.create.call_count == 2
+
+
+def test_failed_creation_is_not_retried_every_call(cached_content):
+    cached_content.create.side_effect = RuntimeError("unsupported")
+    for _ in range(2):
+        assert context_cache.cached_content("gemini-2.5-flash", LARGE) is None
+    cached_content.create.assert_called_once()
+
+
+@mock.patch("dashboard.ai_service.genai.GenerativeModel")
+def test_chat_uses_cached_context(mock_model, cached_content):
+    model = mock_model.from_cached_content.return_value
+    model.start_chat.return_value.send_message.return_value = mock.Mock(text="hi")
+
+    GeminiProvider().chat("gemini-2.5-flash", LARGE, [], "hello")
+
+    mock_model.from_cached_content.assert_called_once_with(
+        cached_content="cachedContents/abc"
+    )
+    mock_model.assert_not_called()
@@ -0,0 +1,184 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from dashboard import conversations
+from dashboard.models import Container, Conversation, Message
+from dashboard.tasks import chat_task
+
+
+class TestConversations(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='u', password='p')
+        self.container = Container.objects.create(name='C', owner=self.user)
+        self.container.members.add(self.user)
+        self.client.login(username='u', password='p')
+        self.chat_url = reverse('container-chat', args=[self.container.id])
+
+    @patch('dashboard.tasks.chat_task.apply_async')
+    def test_chat_stores_turns_and_sends_only_ids(self, mock_delay):
+        history = [{'role': 'user', 'text': 'a'}, {'role': 'model', 'text': 'b'}]
+        resp = self.client.post(
+            self.chat_url, {'message': 'hi', 'history': history}, format='json'
+        )
+        self.assertEqual(resp.status_code, 202)
+        conversation = Conversation.objects.get(pk=resp.data['conversation'])
+        self.assertEqual(
+            list(conversation.messages.values_list('role', 'text')),
+            [('user', 'a'), ('model', 'b'), ('user', 'hi')],
+        )
+
+        resp = self.client.post(
+            self.chat_url,
+            {'message': 'again', 'conversation': conversation.id},
+            format='json',
+        )
+        self.assertEqual(resp.data['conversation'], conversation.id)
+        args, kwargs = mock_delay.call_args.args
+        self.assertEqual(args[2:], ('again', []))
+        self.assertEqual(kwargs['conversation_id'], conversation.id)
+        self.assertEqual(conversation.messages.last().id, kwargs['message_id'])
+
+    @patch('dashboard.tasks.chat_task.apply_async')
+    def test_other_users_conversation_is_not_found(self, mock_delay):
+        other = User.objects.create_user(username='o', password='p')
+        conversation = Conversation.objects.create(container=self.container, user=other)
+        resp = self.client.post(
+            self.chat_url, {'message': 'hi', 'conversation': conversation.id}, format='json'
+        )
+        self.assertEqual(resp.status_code, 404)
+        mock_delay.assert_not_called()
+        resp = self.client.get(reverse('conversation-list'))
+        self.assertEqual(resp.data, [])
+
+    def test_only_the_owner_can_start_a_conversation(self):
+        member = User.objects.create_user(username='m', password='p')
+        self.container.members.add(member)
+        self.client.login(username='m', password='p')
+        resp = self.client.post(
+            reverse('conversation-list'), {'container': self.container.id}, format='json'
+        )
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post(self.chat_url, {'message': 'hi'}, format='json')
+        self.assertEqual(resp.status_code, 403)
+
+    @patch('dashboard.tasks.chat_task.apply_async')
+    def test_invalid_conversation_id_is_not_found(self, mock_delay):
+        resp = self.client.post(
+            self.chat_url, {'message': 'hi', 'conversation': 'abc'}, format='json'
+        )
+        self.assertEqual(resp.status_code, 404)
+        mock_delay.assert_not_called()
+
+    @patch('dashboard.tasks.chat_task.apply_async')
+    def test_repeated_submission_reuses_first_task(self, mock_delay):
+        payload = {'message': 'hi', 'history': [{'role': 'user', 'text': 'a'}]}
+        first = self.client.post(self.chat_url, payload, format='json')
+        again = self.client.post(self.chat_url, payload, format='json')
+        self.assertEqual(again.status_code, 202)
+        self.assertEqual(again.data, first.data)
+        mock_delay.assert_called_once()
+        self.assertEqual(Conversation.objects.count(), 1)
+
+        conversation = first.data['conversation']
+        follow_up = {'message': 'ok', 'conversation': conversation}
+        first = self.client.post(self.chat_url, follow_up, format='json')
+        again = self.client.post(self.chat_url, follow_up, format='json')
+        self.assertEqual(again.data, first.data)
+        self.assertEqual(mock_delay.call_count, 2)
+
+        # After the reply, sending the same text again is a new message.
+        Message.objects.create(conversation_id=conversation, role='model', text='r')
+        third = self.client.post(self.chat_url, follow_up, format='json')
+        self.assertNotEqual(third.data['task_id'], first.data['task_id'])
+        self.assertEqual(
+            list(Message.objects.filter(role='user').values_list('text', flat=True)),
+            ['a', 'hi', 'ok', 'ok'],
+        )
+
+    @patch('dashboard.tasks.chat_task.apply_async')
+    def test_idempotency_key_header(self, mock_delay):
+        first = self.client.post(
+            self.chat_url, {'message': 'hi'}, format='json', HTTP_IDEMPOTENCY_KEY='k1'
+        )
+        retry = self.client.post(
+            self.chat_url, {'message': 'hi!'}, format='json', HTTP_IDEMPOTENCY_KEY='k1'
+        )
+        other = self.client.post(
+            self.chat_url, {'message': 'hi'}, format='json', HTTP_IDEMPOTENCY_KEY='k2'
+        )
+        self.assertEqual(retry.data, first.data)
+        self.assertNotEqual(other.data['task_id'], first.data['task_id'])
+        self.assertEqual(mock_delay.call_count, 2)
+
+    @patch('dashboard.tasks.chat_task.apply_async')
+    def test_duplicate_of_a_submission_in_progress_is_refused(self, mock_delay):
+        key = conversations._submission_key(
+            self.user, self.container, 'hi', None, [], 'k1'
+        )
+        # The first request is still storing and queueing the message.
+        cache.add(f'{key}:lock', 1, 30)
+        with patch.object(conversations, 'SUBMIT_WAIT_TIMEOUT', 0):
+            resp = self.client.post(
+                self.chat_url, {'message': 'hi'}, format='json', HTTP_IDEMPOTENCY_KEY='k1'
+            )
+        self.assertEqual(resp.status_code, 409)
+        self.assertFalse(Message.objects.exists())
+        mock_delay.assert_not_called()
+
+    @patch('dashboard.tasks.chat_task.apply_async')
+    def test_full_queue_is_refused_without_storing_the_message(self, mock_delay):
+        with self.settings(AI_CHAT_MAX_IN_FLIGHT=0, AI_CHAT_MAX_QUEUED_PER_USER=1):
+            first = self.client.post(self.chat_url, {'message': 'hi'}, format='json')
+            conversation = first.data['conversation']
+            resp = self.client.post(
+                self.chat_url,
+                {'message': 'more', 'conversation': conversation},
+                format='json',
+            )
+            self.assertEqual(resp.status_code, 429)
+            resp = self.client.post(self.chat_url, {'message': 'new'}, format='json')
+            self.assertEqual(resp.status_code, 429)
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(list(Message.objects.values_list('text', flat=True)), ['hi'])
+        mock_delay.assert_not_called()
+
+    @patch('dashboard.ai_service.genai.GenerativeModel')
+    def test_chat_task_reads_history_and_appends_reply(self, mock_model):
+        chat = mock_model.return_value.start_chat.return_value
+        chat.send_message.return_value = SimpleNamespace(text='reply')
+        conversation = Conversation.objects.create(container=self.container, user=self.user)
+        Message.objects.create(conversation=conversation, role='user', text='first')
+        Message.objects.create(conversation=conversation, role='model', text='answer')
+        current = Message.objects.create(conversation=conversation, role='user', text='next')
+
+        chat_task.apply(
+            args=(self.user.id, self.container.id, 'next', []),
+            kwargs={'conversation_id': conversation.id, 'message_id': current.id},
+        ).get()
+
+        sent = mock_model.return_value.start_chat.call_args.kwargs['history']
+        self.assertEqual([item['parts'] for item in sent], [['first'], ['answer']])
+        self.assertEqual(conversation.messages.last().text, 'reply')
+
+    def test_messages_are_cursor_paginated_newest_first(self):
+        conversation = Conversation.objects.create(container=self.container, user=self.user)
+        for i in range(5):
+            Message.objects.create(conversation=conversation, role='user', text=str(i))
+        url = reverse('conversation-messages', args=[conversation.id])
+
+        resp = self.client.get(url, {'page_size': 2})
+        self.assertEqual([m['text'] for m in resp.data['results']], ['4', '3'])
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual([m['text'] for m in resp.data['results']], ['2', '1'])
+
+    def test_messages_are_append_only(self):
+        conversation = Conversation.objects.create(container=self.container, user=self.user)
+        message = Message.objects.create(conversation=conversation, role='user', text='x')
+        message.text = 'y'
+        with self.assertRaises(ValueError):
+            message.save()
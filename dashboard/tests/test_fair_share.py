@@ -0,0 +1,148 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from celery import current_app, states
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from dashboard import fair_share
+from dashboard.fair_share import QueueFull, dispatch, release, submit
+from dashboard.locks import LockTimeout
+from dashboard.tasks import chat_task
+
+
+def user(pk, username=None):
+    return SimpleNamespace(pk=pk, get_username=lambda: username or f'user{pk}')
+
+
+@override_settings(
+    AI_CHAT_MAX_IN_FLIGHT=2,
+    AI_CHAT_MAX_IN_FLIGHT_PER_USER=2,
+    AI_CHAT_MAX_IN_FLIGHT_PER_CONTAINER=2,
+    AI_CHAT_MAX_QUEUED_PER_USER=20,
+    AI_CHAT_FAIR_SHARE_WEIGHTS={},
+)
+class TestFairShare(TestCase):
+    def setUp(self):
+        patcher = patch('dashboard.tasks.chat_task.apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent(self):
+        return [c.args[0][0] for c in self.apply_async.call_args_list]
+
+    def finish(self, index):
+        release(self.apply_async.call_args_list[index].kwargs['task_id'])
+
+    def test_heavy_user_does_not_starve_others(self):
+        heavy, light = user(1), user(2)
+        for i in range(10):
+            submit(chat_task, heavy, 10, (f'heavy{i}',))
+        submit(chat_task, light, 20, ('light',))
+        self.assertEqual(self.sent(), ['heavy0', 'heavy1'])
+
+        # The freed slot goes to the light user, not the heavy user's backlog.
+        self.finish(0)
+        self.assertEqual(self.sent()[-1], 'light')
+        self.finish(1)
+        self.assertEqual(self.sent()[-1], 'heavy2')
+
+    def test_per_user_and_container_caps(self):
+        with self.settings(
+            AI_CHAT_MAX_IN_FLIGHT=10, AI_CHAT_MAX_IN_FLIGHT_PER_CONTAINER=1
+        ):
+            for i in range(3):
+                submit(chat_task, user(1), 10, (f'a{i}',))
+            submit(chat_task, user(2), 10, ('b0',))
+            submit(chat_task, user(3), 30, ('c0',))
+            self.assertEqual(self.sent(), ['a0', 'c0'])
+            self.finish(0)
+            self.assertEqual(self.sent()[-1], 'b0')
+
+    def test_weights_give_more_turns(self):
+        with self.settings(
+            AI_CHAT_MAX_IN_FLIGHT=0,
+            AI_CHAT_MAX_IN_FLIGHT_PER_USER=5,
+            AI_CHAT_FAIR_SHARE_WEIGHTS={'vip': 2},
+        ):
+            for i in range(4):
+                submit(chat_task, user(1, 'vip'), 10, (f'v{i}',))
+                submit(chat_task, user(2), 20, (f'n{i}',))
+            with self.settings(AI_CHAT_MAX_IN_FLIGHT=1):
+                dispatch()
+                for i in range(5):
+                    self.finish(i)
+        self.assertEqual(self.sent(), ['n0', 'v0', 'v1', 'n1', 'v2', 'v3'])
+
+    def test_containers_of_a_user_take_turns(self):
+        with self.settings(AI_CHAT_MAX_IN_FLIGHT=1, AI_CHAT_MAX_IN_FLIGHT_PER_USER=5):
+            for i in range(2):
+                submit(chat_task, user(1), 10, (f'x{i}',))
+            submit(chat_task, user(1), 20, ('y0',))
+            self.finish(0)
+            self.finish(1)
+        self.assertEqual(self.sent(), ['x0', 'y0', 'x1'])
+
+    def test_lost_tasks_free_their_slot(self):
+        for i in range(3):
+            submit(chat_task, user(1), 10, (f'a{i}',))
+        self.assertEqual(len(self.sent()), 2)
+        with patch.object(fair_share, 'IN_FLIGHT_TIMEOUT', -1):
+            self.assertEqual(dispatch(), 1)
+        self.assertEqual(self.sent()[-1], 'a2')
+
+    def test_finished_task_releases_its_slot(self):
+        self.apply_async.side_effect = lambda args, kwargs, task_id: chat_task.apply(
+            args, kwargs, task_id=task_id
+        )
+        with patch('dashboard.tasks.Container.objects.get', side_effect=ValueError):
+            for i in range(3):
+                submit(chat_task, user(1), 10, (1, 10, f'm{i}', []))
+        self.assertEqual(self.apply_async.call_count, 3)
+
+    def test_retry_keeps_its_slot(self):
+        with self.settings(AI_CHAT_MAX_IN_FLIGHT=1):
+            first = submit(chat_task, user(1), 10, ('a0',))
+            submit(chat_task, user(1), 10, ('a1',))
+            chat_task.after_return(states.RETRY, None, first, (), {}, None)
+            self.assertEqual(self.sent(), ['a0'])
+            chat_task.after_return(states.SUCCESS, None, first, (), {}, None)
+        self.assertEqual(self.sent(), ['a0', 'a1'])
+
+    def test_expired_jobs_are_dropped_in_one_pass(self):
+        with self.settings(AI_CHAT_MAX_IN_FLIGHT=0, AI_CHAT_MAX_QUEUED_PER_USER=5_000):
+            expired = [submit(chat_task, user(1), 10, (f'old{i}',)) for i in range(2_000)]
+            submit(chat_task, user(1), 10, ('new',))
+        cache.delete_many([f'chat:fair:job:{task_id}' for task_id in expired])
+        with patch.object(current_app.backend, 'mark_as_failure') as mark_as_failure:
+            with self.settings(AI_CHAT_MAX_IN_FLIGHT=1):
+                self.assertEqual(dispatch(), 1)
+        self.assertEqual(self.sent(), ['new'])
+        self.assertEqual(
+            [c.args[0] for c in mark_as_failure.call_args_list], expired
+        )
+        self.assertIsInstance(mark_as_failure.call_args.args[1], fair_share.JobExpired)
+
+    def test_queued_tasks_per_user_are_capped(self):
+        with self.settings(AI_CHAT_MAX_IN_FLIGHT=0, AI_CHAT_MAX_QUEUED_PER_USER=2):
+            submit(chat_task, user(1), 10, ('a0',))
+            submit(chat_task, user(1), 20, ('a1',))
+            with self.assertRaises(QueueFull):
+                submit(chat_task, user(1), 10, ('a2',))
+            submit(chat_task, user(2), 10, ('b0',))
+            with self.settings(AI_CHAT_MAX_IN_FLIGHT=2):
+                dispatch()
+            self.assertEqual(self.sent(), ['b0', 'a1'])
+            # A sent task no longer counts as queued.
+            submit(chat_task, user(1), 10, ('a3',))
+
+    def test_state_lock_has_a_deadline_and_an_owner(self):
+        cache.set(fair_share.LOCK_KEY, 'someone else', 60)
+        with patch.object(fair_share, 'LOCK_TIMEOUT', 0.05):
+            with self.assertRaises(LockTimeout):
+                submit(chat_task, user(1), 10, ('a0',))
+        self.assertEqual(cache.get(fair_share.LOCK_KEY), 'someone else')
+        cache.delete(fair_share.LOCK_KEY)
+        submit(chat_task, user(1), 10, ('a1',))
+        self.assertEqual(self.sent(), ['a1'])
+        self.assertIsNone(cache.get(fair_share.LOCK_KEY))
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+import pytest
+
+from dashboard import ai_service
+from dashboard.fake_gemini import FakeGeminiSettings, load_cassette, make_server
+
+
+def _start(settings):
+    server = make_server(settings, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def point_sdk_at(monkeypatch):
+    servers = []
+
+    def point(settings):
+        server = _start(settings)
+        servers.append(server)
+        monkeypatch.setenv("GOOGLE_API_KEY", "dummy")
+        monkeypatch.setenv("GEMINI_API_ENDPOINT", server.url)
+        ai_service.configure()
+        return server
+
+    yield point
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    monkeypatch.delenv("GEMINI_API_ENDPOINT")
+    ai_service.configure()
+
+
+def test_sdk_talks_to_fake_server(point_sdk_at):
+    point_sdk_at(FakeGeminiSettings(latency_ms=0, chunks=3, chunk_delay_ms=0))
+    model = ai_service.get_model("gemini-2.5-flash")
+
+    reply = model.generate_content("hello")
+    assert reply.text == "Fake reply from gemini-2.5-flash to: hello"
+    assert reply.usage_metadata.prompt_token_count == 1
+
+    chunks = [chunk.text for chunk in model.generate_content("hello", stream=True)]
+    assert len(chunks) == 3
+    assert "".join(chunks) == "Fake reply from gemini-2.5-flash to: hello"
+
+
+def test_error_injection(point_sdk_at):
+    # A non-retryable status; the SDK retries 503s with backoff for minutes.
+    point_sdk_at(FakeGeminiSettings(latency_ms=0, error_rate=1.0, error_status=400))
+    with pytest.raises(Exception, match="Injected failure"):
+        ai_service.get_model("gemini-2.5-flash").generate_content("hello")
+
+
+def test_acall_gemini_under_rest_transport(point_sdk_at):
+    point_sdk_at(FakeGeminiSettings(latency_ms=0))
+    assert not ai_service.supports_async()
+
+    reply = asyncio.run(ai_service.acall_gemini("hello", "gemini-2.5-flash"))
+    assert reply == "Fake reply from gemini-2.5-flash to: hello"
+
+
+def test_record_then_replay(point_sdk_at, tmp_path):
+    cassette = str(tmp_path / "cassette.jsonl")
+    upstream = _start(FakeGeminiSettings(latency_ms=0, template="recorded {prompt}"))
+    try:
+        point_sdk_at(FakeGeminiSettings(record=cassette, upstream=upstream.url))
+        model = ai_service.get_model("gemini-2.5-flash")
+        assert model.generate_content("hi").text == "recorded hi"
+    finally:
+        upstream.shutdown()
+        upstream.server_close()
+    assert len(load_cassette(cassette)) == 1
+
+    ai_service.clear_model_registry()
+    point_sdk_at(FakeGeminiSettings(replay=cassette, latency_ms=0))
+    model = ai_service.get_model("gemini-2.5-flash")
+    assert model.generate_content("hi").text == "recorded hi"
+    assert model.generate_content("other").text.startswith("Fake reply")
@@ -1,6 +1,6 @@
 import os
 from types import SimpleNamespace
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 
 from django.contrib.auth.models import User
 from django.test import TestCase
@@ -32,4 +32,15 @@ class TestGeminiSuggestionCaching(TestCase):
         second = self.viewset._call_gemini_suggestion(self.container, 'test', prompt)
         self.assertEqual(first, {"suggestions": ["a", "b"]})
         self.assertEqual(first, second)
-        mock_call.assert_called_once_with(prompt, model_name='gemini-2.5-flash')
+        mock_call.assert_called_once_with(
+            prompt, model_name='gemini-2.5-flash', site='suggestion', on_completion=ANY
+        )
+
+    @patch('dashboard.api_views.call_gemini')
+    def test_generate_function_cache_is_keyed_by_user_request(self, mock_call):
+        mock_call.side_effect = ['{"name": "one"}', '{"name": "two"}']
+        first = self.viewset._call_gemini_suggestion(self.container, 'generate_function', 'p1', 'a')
+        second = self.viewset._call_gemini_suggestion(self.container, 'generate_function', 'p2', 'b')
+        self.assertEqual(first, {"name": "one"})
+        self.assertEqual(second, {"name": "two"})
+        self.assertEqual(mock_call.call_count, 2)
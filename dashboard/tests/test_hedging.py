@@ -0,0 +1,93 @@
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+
+from dashboard import ai_service
+from dashboard.providers import Completion, GeminiProvider, router
+
+
+@pytest.fixture
+def fast_history():
+    for _ in range(20):
+        router.stats.record("google", 0.02, True)
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def _slow_then_fast():
+    calls = []
+
+    def generate(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return Completion("slow")
+        return Completion("fast")
+
+    return generate, calls
+
+
+def test_slow_attempt_is_hedged(fast_history, monkeypatch):
+    generate, calls = _slow_then_fast()
+    monkeypatch.setattr(GeminiProvider, "generate", mock.Mock(side_effect=generate))
+
+    started = time.monotonic()
+    assert ai_service.call_gemini("p", cache_ttl=0, hedge=True) == "fast"
+    assert time.monotonic() - started < 0.4
+    assert len(calls) == 2
+    # Both attempts are recorded, the loser once it finishes in its thread.
+    _wait_until(lambda: router.stats.successes("google") == 22)
+    assert router.stats.percentile("google", 1.0) >= 0.5
+
+
+def test_hedge_needs_a_free_rate_limit_slot(fast_history, monkeypatch):
+    generate, calls = _slow_then_fast()
+    monkeypatch.setattr(GeminiProvider, "generate", mock.Mock(side_effect=generate))
+    acquire = mock.Mock(side_effect=lambda *args, block=True, **kwargs: block)
+    monkeypatch.setattr(ai_service, "acquire", acquire)
+
+    assert ai_service.call_gemini("p", cache_ttl=0, hedge=True) == "slow"
+    assert len(calls) == 1
+    assert acquire.call_args.kwargs == {"block": False}
+
+
+def test_hedges_stop_when_budget_is_spent(fast_history, monkeypatch):
+    monkeypatch.setattr(ai_service, "HEDGE_BUDGET_PER_MINUTE", 0)
+    generate, calls = _slow_then_fast()
+    monkeypatch.setattr(GeminiProvider, "generate", mock.Mock(side_effect=generate))
+
+    assert ai_service.call_gemini("p", cache_ttl=0, hedge=True) == "slow"
+    assert len(calls) == 1
+
+
+def test_async_hedge_cancels_loser(fast_history, monkeypatch):
+    cancelled = []
+    calls = []
+
+    async def agenerate(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return Completion("slow")
+        return Completion("fast")
+
+    monkeypatch.setattr(GeminiProvider, "agenerate", agenerate)
+
+    async def run():
+        result = await ai_service.acall_gemini("p", hedge=True)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "fast"
+    assert cancelled == [1]
@@ -0,0 +1,72 @@
+import os
+from unittest import mock
+
+import pytest
+from django.urls import reverse
+
+from dashboard import ai_service, metrics
+from dashboard.ai_cache import get_stale_while_revalidate
+from dashboard.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    model_instance = mock.Mock()
+    usage = mock.Mock(prompt_token_count=12, candidates_token_count=5)
+    model_instance.generate_content.side_effect = [
+        TimeoutError("boom"),
+        mock.Mock(text="hi", usage_metadata=usage),
+    ]
+    monkeypatch.setattr(
+        ai_service.genai, "GenerativeModel", lambda *a, **k: model_instance
+    )
+    monkeypatch.setattr("dashboard.ai_service.time.sleep", lambda s: None)
+    return model_instance
+
+
+def test_call_gemini_records_latency_attempts_and_tokens(gemini):
+    ai_service.call_gemini("hello", "gemini-2.5-flash", site="greeting")
+    ai_service.call_gemini("hello", "gemini-2.5-flash", site="greeting")
+
+    text = metrics.registry.render()
+    labels = 'model="gemini-2.5-flash",outcome="ok",site="greeting"'
+    assert f"ai_call_duration_seconds_count{{{labels}}} 1" in text
+    assert f'ai_call_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f"ai_call_attempts_total{{{labels}}} 2" in text
+    assert (
+        'ai_tokens_total{kind="prompt",model="gemini-2.5-flash",site="greeting"} 12'
+        in text
+    )
+    assert 'ai_cache_requests_total{cache="response",result="miss"} 1' in text
+    assert 'ai_cache_requests_total{cache="response",result="hit"} 1' in text
+
+
+def test_processes_add_up_through_the_cache():
+    web, worker = MetricsRegistry(), MetricsRegistry()
+    web.inc("ai_cache_requests_total", {"cache": "greeting", "result": "hit"})
+    worker.inc("ai_cache_requests_total", {"cache": "greeting", "result": "hit"}, 2)
+    worker.flush()
+
+    assert 'ai_cache_requests_total{cache="greeting",result="hit"} 3' in web.render()
+
+
+def test_stale_while_revalidate_counts_hits_and_misses():
+    for _ in range(2):
+        get_stale_while_revalidate(
+            "k", lambda: "v", lambda: None, soft_ttl=60, hard_ttl=60, cache_name="g"
+        )
+    text = metrics.registry.render()
+    assert 'ai_cache_requests_total{cache="g",result="miss"} 1' in text
+    assert 'ai_cache_requests_total{cache="g",result="hit"} 1' in text
+
+
+def test_metrics_endpoint_is_local_only(client, settings):
+    metrics.registry.inc("ai_cache_requests_total", {"cache": "c", "result": "hit"})
+    response = client.get(reverse("metrics"))
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert b"# TYPE ai_cache_requests_total counter" in response.content
+
+    settings.METRICS_ALLOWED_IPS = ["10.0.0.1"]
+    assert client.get(reverse("metrics")).status_code == 403
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+from unittest import mock
+
+from django.conf import settings
+
+from dashboard import ai_service
+
+
+def test_get_model_reuses_instances(monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    factory = mock.Mock(side_effect=lambda *a, **k: mock.Mock())
+    monkeypatch.setattr(ai_service.genai, "GenerativeModel", factory)
+
+    first = ai_service.get_model("m", system_instruction="be nice")
+    second = ai_service.get_model("m", system_instruction="be nice")
+    other = ai_service.get_model("m", system_instruction="be terse")
+
+    assert first is second
+    assert other is not first
+    assert factory.call_count == 2
+
+
+def test_get_model_evicts_least_recently_used(monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    monkeypatch.setattr(
+        ai_service.genai, "GenerativeModel", lambda *a, **k: mock.Mock()
+    )
+    monkeypatch.setattr(ai_service, "MODEL_REGISTRY_SIZE", 2)
+
+    a = ai_service.get_model("a")
+    ai_service.get_model("b")
+    ai_service.get_model("a")
+    ai_service.get_model("c")
+
+    assert ai_service.get_model("a") is a
+    assert len(ai_service._model_registry) == 2
+    assert ("b",) not in ai_service._model_registry
+
+
+def test_warm_up_builds_the_configs_in_use(monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    factory = mock.Mock(side_effect=lambda *a, **k: mock.Mock())
+    monkeypatch.setattr(ai_service.genai, "GenerativeModel", factory)
+    monkeypatch.setenv("GEMINI_WARM_MODELS", "m")
+
+    ai_service.warm_up()
+    ai_service.get_model("m")
+    ai_service.get_model(
+        "m", generation_config={"response_mime_type": "application/json"}
+    )
+
+    assert factory.call_count == len(ai_service.WARM_MODEL_KWARGS) == 2
+
+
+def test_ai_service_imports_before_apps_are_loaded():
+    # gunicorn's post_fork imports ai_service before django.setup() runs.
+    code = "import dashboard.ai_service as s; s.warm_up()"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": "portal.settings"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,83 @@
+import os
+from unittest import mock
+
+import pytest
+
+from dashboard import ai_service
+from dashboard.circuit_breaker import CircuitBreaker, CircuitOpenError
+from dashboard.models import AIProviderSettings
+from dashboard.providers import (
+    MIN_SAMPLES,
+    GeminiProvider,
+    LatencyStats,
+    ProviderRouter,
+)
+
+
+@pytest.fixture
+def router():
+    AIProviderSettings.objects.create(
+        provider_name="groq",
+        api_key="k",
+        api_endpoint="https://groq.example/v1",
+        default_model="llama-3",
+    )
+    return ProviderRouter(LatencyStats())
+
+
+def _names(ranked):
+    return [(provider.name, model) for provider, model in ranked]
+
+
+def test_native_provider_preferred_until_it_degrades(router):
+    assert _names(router.rank("gemini-2.5-flash")) == [
+        ("google", "gemini-2.5-flash"),
+        ("groq", "llama-3"),
+    ]
+    for _ in range(MIN_SAMPLES):
+        router.stats.record("google", 2.0, True)
+        router.stats.record("google", 2.0, False)
+        router.stats.record("groq", 0.3, True)
+    assert router.choose("gemini-2.5-flash")[0].name == "groq"
+
+
+def test_unmeasured_provider_does_not_beat_healthy_native(router):
+    for _ in range(MIN_SAMPLES):
+        router.stats.record("google", 1.0, True)
+    assert router.choose("gemini-2.5-flash")[0].name == "google"
+    # A few fast calls are not yet enough to move traffic.
+    for _ in range(MIN_SAMPLES - 1):
+        router.stats.record("groq", 0.1, True)
+    assert router.choose("gemini-2.5-flash")[0].name == "google"
+
+
+def test_open_circuits_are_skipped(router):
+    CircuitBreaker("google:gemini-2.5-flash")._open()
+    assert _names(router.rank("gemini-2.5-flash")) == [("groq", "llama-3")]
+    CircuitBreaker("groq:llama-3")._open()
+    with pytest.raises(CircuitOpenError):
+        router.rank("gemini-2.5-flash")
+
+
+def test_latency_stats_percentiles():
+    stats = LatencyStats()
+    for seconds in range(1, 101):
+        stats.record("p", seconds / 100, True)
+    stats.record("p", 9.0, False)
+    assert stats.percentile("p", 0.5) == pytest.approx(0.51)
+    assert stats.percentile("p", 0.95) == pytest.approx(0.96)
+    assert stats.error_rate("p") == pytest.approx(1 / 101)
+
+
+def test_call_gemini_falls_back_to_other_provider(router, monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    monkeypatch.setattr(ai_service.providers, "router", router)
+    monkeypatch.setattr("dashboard.ai_service.time.sleep", lambda s: None)
+    monkeypatch.setattr(
+        GeminiProvider, "generate", mock.Mock(side_effect=TimeoutError("slow"))
+    )
+    response = mock.Mock()
+    response.json.return_value = {"choices": [{"message": {"content": " hi "}}]}
+    with mock.patch("dashboard.providers.requests.post", return_value=response) as post:
+        assert ai_service.call_gemini("hello", cache_ttl=0) == "hi"
+    assert post.call_args.kwargs["json"]["model"] == "llama-3"
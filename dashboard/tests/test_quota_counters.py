@@ -0,0 +1,160 @@
+import datetime
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from dashboard.locks import cache_lock
+from dashboard.models import UserProfile
+from dashboard.tasks import flush_api_quota_task
+from dashboard.utils import (
+    charge_api_quota,
+    flush_api_quota,
+    forget_api_quota,
+    has_api_quota,
+    quota_window,
+)
+
+
+class TestQuotaCounters(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'u{i}', password='p') for i in range(3)
+        ]
+        for user in self.users:
+            UserProfile.objects.create(user=user, api_quota=1_000)
+
+    def quota(self, user):
+        return UserProfile.objects.get(user=user).api_quota
+
+    def test_charges_stay_in_cache_until_flushed(self):
+        user = self.users[0]
+        self.assertTrue(has_api_quota(user, 1_000))
+        with CaptureQueriesContext(connection) as queries:
+            charge_api_quota(user, 300)
+            charge_api_quota(user, 200)
+            self.assertFalse(has_api_quota(user, 501))
+            self.assertTrue(has_api_quota(user, 500))
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.quota(user), 1_000)
+
+        self.assertEqual(flush_api_quota(), [user.pk])
+        self.assertEqual(self.quota(user), 500)
+        self.assertEqual(flush_api_quota(), [])
+        self.assertEqual(self.quota(user), 500)
+
+    def test_flush_writes_all_users_in_one_update(self):
+        for tokens, user in enumerate(self.users, 1):
+            charge_api_quota(user, tokens * 100)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_api_quota_task.apply().get(), 3)
+        updates = [q for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual([self.quota(u) for u in self.users], [900, 800, 700])
+
+    def test_profile_edit_reloads_counter_with_pending_charges(self):
+        user = self.users[0]
+        charge_api_quota(user, 400)
+        profile = UserProfile.objects.get(user=user)
+        profile.api_quota = 5_000
+        profile.save()
+        self.assertTrue(has_api_quota(user, 4_600))
+        self.assertFalse(has_api_quota(user, 4_601))
+        flush_api_quota()
+        self.assertEqual(self.quota(user), 4_600)
+
+    def test_flush_never_goes_below_zero(self):
+        user = self.users[0]
+        charge_api_quota(user, 1_500)
+        self.assertFalse(has_api_quota(user))
+        flush_api_quota()
+        self.assertEqual(self.quota(user), 0)
+
+    def test_quota_window_bounds(self):
+        now = datetime.datetime(2026, 2, 14, 15, 30, tzinfo=datetime.timezone.utc)
+        day = datetime.datetime(2026, 2, 14, tzinfo=datetime.timezone.utc)
+        self.assertEqual(
+            quota_window('day', now), (day, day + datetime.timedelta(days=1))
+        )
+        self.assertEqual(
+            quota_window('month', now),
+            (day.replace(day=1), day.replace(month=3, day=1)),
+        )
+
+    def test_first_read_starts_window_without_reset(self):
+        user = self.users[0]
+        self.assertTrue(has_api_quota(user, 1_000))
+        self.assertFalse(has_api_quota(user, 1_001))
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual(profile.api_quota, 1_000)
+        self.assertEqual(profile.quota_window_start, quota_window('month')[0])
+
+    def test_new_window_resets_lazily(self):
+        user, idle = self.users[0], self.users[1]
+        last_month = quota_window('month')[0] - datetime.timedelta(days=1)
+        UserProfile.objects.update(
+            api_quota=10, quota_allowance=5_000, quota_window_start=last_month
+        )
+        cache.clear()
+        self.assertTrue(has_api_quota(user, 5_000))
+        charge_api_quota(user, 1_000)
+        flush_api_quota()
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual(profile.api_quota, 4_000)
+        self.assertEqual(profile.quota_window_start, quota_window('month')[0])
+        self.assertEqual(UserProfile.objects.get(user=idle).api_quota, 10)
+
+    def test_charges_from_an_ended_window_are_dropped(self):
+        user = self.users[0]
+        UserProfile.objects.filter(user=user).update(
+            quota_period='day', quota_allowance=1_000
+        )
+        charge_api_quota(user, 300)
+        # The day ends before the charge is flushed.
+        tomorrow = timezone.now() + datetime.timedelta(days=1)
+        with patch('django.utils.timezone.now', return_value=tomorrow):
+            cache.delete(f'quota:{user.pk}')
+            self.assertTrue(has_api_quota(user, 1_000))
+            flush_api_quota()
+        self.assertEqual(self.quota(user), 1_000)
+
+    def test_flush_and_reload_during_a_charge(self):
+        user = self.users[0]
+        charge_api_quota(user, 100)
+        incr = cache.incr
+        interleaved = []
+
+        def incr_then_flush(key, delta=1, **kwargs):
+            value = incr(key, delta, **kwargs)
+            if key.endswith(':used') and not interleaved:
+                interleaved.append(key)
+                flush_api_quota()
+                forget_api_quota(user.pk)
+                self.assertTrue(has_api_quota(user, 700))
+                self.assertFalse(has_api_quota(user, 701))
+            return value
+
+        with patch.object(cache, 'incr', side_effect=incr_then_flush):
+            charge_api_quota(user, 200)
+        self.assertTrue(interleaved)
+        self.assertEqual(self.quota(user), 700)
+        self.assertEqual(flush_api_quota(), [])
+        self.assertEqual(self.quota(user), 700)
+        forget_api_quota(user.pk)
+        self.assertTrue(has_api_quota(user, 700))
+        self.assertFalse(has_api_quota(user, 701))
+
+    def test_flush_skips_users_being_loaded(self):
+        user, other = self.users[0], self.users[1]
+        charge_api_quota(user, 100)
+        charge_api_quota(other, 200)
+        with cache_lock(f'quota:load:{user.pk}', 30):
+            self.assertEqual(flush_api_quota(), [other.pk])
+        self.assertEqual(self.quota(user), 1_000)
+        self.assertEqual(flush_api_quota(), [user.pk])
+        self.assertEqual(self.quota(user), 900)
+        self.assertEqual(self.quota(other), 800)
@@ -0,0 +1,52 @@
+import os
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+
+from dashboard import ai_service, rate_limit
+from dashboard.models import AIProviderSettings
+
+
+@pytest.fixture
+def limited_provider():
+    cache.clear()
+    rate_limit.clear_limits_cache()
+    return AIProviderSettings.objects.create(
+        provider_name="google",
+        api_key="k",
+        default_model="gemini-2.5-flash",
+        requests_per_minute=60,
+        burst=2,
+    )
+
+
+def test_bucket_allows_burst_then_refuses(limited_provider):
+    assert rate_limit.acquire("google", "m", block=False)
+    assert rate_limit.acquire("google", "m", block=False)
+    assert not rate_limit.acquire("google", "m", block=False)
+    assert rate_limit.acquire("google", "other", block=False)
+    with pytest.raises(rate_limit.RateLimitExceeded):
+        rate_limit.acquire("google", "m", timeout=0.1)
+
+
+def test_unlimited_provider_is_not_throttled():
+    rate_limit.clear_limits_cache()
+    assert all(rate_limit.acquire("google", "m", block=False) for _ in range(10))
+
+
+def test_call_gemini_acquires_before_calling(limited_provider, monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    model_instance = mock.Mock()
+    model_instance.generate_content.return_value = mock.Mock(text="hi")
+    monkeypatch.setattr(
+        ai_service.genai, "GenerativeModel", lambda *a, **k: model_instance
+    )
+    monkeypatch.setattr(rate_limit.time, "sleep", mock.Mock())
+    for prompt in ("a", "b"):
+        ai_service.call_gemini(prompt, cache_ttl=0)
+
+    with pytest.raises(rate_limit.RateLimitExceeded):
+        with mock.patch.object(rate_limit, "_try_acquire", return_value=60):
+            ai_service.call_gemini("c", cache_ttl=0)
+    assert model_instance.generate_content.call_count == 2
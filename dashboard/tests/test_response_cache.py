@@ -0,0 +1,36 @@
+import os
+from unittest import mock
+
+from dashboard import ai_service
+from dashboard.ai_cache import ResponseCache, response_cache
+
+
+def test_identical_prompts_hit_cache(monkeypatch):
+    os.environ["GOOGLE_API_KEY"] = "dummy"
+    model_instance = mock.Mock()
+    model_instance.generate_content.return_value = mock.Mock(text="hi")
+    monkeypatch.setattr(
+        ai_service.genai, "GenerativeModel", lambda *a, **k: model_instance
+    )
+
+    assert ai_service.call_gemini("hello") == "hi"
+    assert ai_service.call_gemini("hello") == "hi"
+    assert ai_service.call_gemini("hello", system_instruction="terse") == "hi"
+    assert ai_service.call_gemini("hello", cache_ttl=0) == "hi"
+
+    assert model_instance.generate_content.call_count == 3
+    assert response_cache.stats == {"local_hits": 1, "remote_hits": 0, "misses": 2}
+
+
+def test_local_miss_falls_back_to_shared_cache():
+    writer = ResponseCache()
+    reader = ResponseCache(local_size=1)
+    key = ResponseCache.make_key("m", "p")
+    writer.set(key, "v", 60)
+
+    assert reader.get(key) == "v"
+    assert reader.get(key) == "v"
+    assert reader.stats == {"local_hits": 1, "remote_hits": 1, "misses": 0}
+
+    reader.set(ResponseCache.make_key("m", "other"), "w", 60)
+    assert len(reader._local) == 1
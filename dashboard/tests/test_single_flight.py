@@ -0,0 +1,58 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from dashboard.ai_cache import get_or_compute
+
+
+class TestSingleFlight(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"v": 1}
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(get_or_compute("k", compute, 60))
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"v": 1}] * 4)
+
+    def test_waiter_takes_over_when_leader_fails(self):
+        cache.add("k:lock", 1, 60)
+        compute = mock.Mock(return_value="fresh")
+
+        def release():
+            time.sleep(0.05)
+            cache.delete("k:lock")
+
+        threading.Thread(target=release).start()
+        self.assertEqual(get_or_compute("k", compute, 60), "fresh")
+        compute.assert_called_once()
+
+    def test_lock_outlives_the_slowest_gemini_call(self):
+        from dashboard.ai_service import call_budget
+
+        # Three 10 s attempts, each after up to 30 s of rate limiting, plus
+        # 1 + 2 s of backoff.
+        self.assertEqual(call_budget(), 123)
+        with mock.patch("dashboard.ai_cache.cache.add", return_value=True) as add:
+            get_or_compute("k", lambda: "v", 60)
+        add.assert_called_once_with("k:lock", 1, 123)
@@ -0,0 +1,50 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from dashboard import ai
+from dashboard.ai_cache import get_stale_while_revalidate, set_with_soft_ttl
+
+
+class TestStaleWhileRevalidate(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fresh_entry_is_served_without_refresh(self):
+        set_with_soft_ttl("k", "cached", 60, 600)
+        compute, refresh = mock.Mock(), mock.Mock()
+        value = get_stale_while_revalidate(
+            "k", compute, refresh, soft_ttl=60, hard_ttl=600
+        )
+        self.assertEqual(value, "cached")
+        compute.assert_not_called()
+        refresh.assert_not_called()
+
+    def test_stale_entry_is_served_and_refreshed_once(self):
+        set_with_soft_ttl("k", "stale", 0, 600)
+        time.sleep(0.01)
+        compute, refresh = mock.Mock(), mock.Mock()
+        for _ in range(2):
+            value = get_stale_while_revalidate(
+                "k", compute, refresh, soft_ttl=60, hard_ttl=600
+            )
+            self.assertEqual(value, "stale")
+        compute.assert_not_called()
+        refresh.assert_called_once()
+
+    def test_miss_blocks_on_compute(self):
+        refresh = mock.Mock()
+        value = get_stale_while_revalidate(
+            "k", lambda: "new", refresh, soft_ttl=60, hard_ttl=600
+        )
+        self.assertEqual(value, "new")
+        refresh.assert_not_called()
+
+    def test_stale_greeting_schedules_background_refresh(self):
+        set_with_soft_ttl("ai_greeting:Bob", "Hi", 0, 600)
+        time.sleep(0.01)
+        with mock.patch("dashboard.tasks.refresh_greeting_task.delay") as delay:
+            self.assertEqual(ai.generate_greeting("Bob"), "Hi")
+        delay.assert_called_once_with("Bob")
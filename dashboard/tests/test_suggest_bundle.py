@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from dashboard.models import Container, UserProfile
+from dashboard.providers import Completion
+from dashboard.utils import flush_api_quota
+
+
+class TestSuggestBundle(APITestCase):
+    def setUp(self):
+        os.environ['GOOGLE_API_KEY'] = 'dummy'
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='pass')
+        self.container = Container.objects.create(name='C', owner=self.owner)
+        self.container.members.add(self.owner)
+        UserProfile.objects.create(user=self.owner, api_quota=10_000)
+        self.client.login(username='owner', password='pass')
+
+    @patch('dashboard.tasks.call_gemini')
+    def test_bundle_uses_one_call_and_fills_action_caches(self, mock_call):
+        mock_call.return_value = (
+            '{"questions": ["q"], "personas": ["p"], "function": {"name": "f"}}'
+        )
+        url = reverse('container-suggest-bundle', args=[self.container.id])
+        resp = self.client.post(url, {'prompt': 'do x'}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.data,
+            {
+                "questions": {"suggestions": ["q"]},
+                "personas": {"suggestions": ["p"]},
+                "function": {"name": "f"},
+            },
+        )
+        mock_call.assert_called_once()
+        self.assertEqual(
+            mock_call.call_args.kwargs['generation_config'],
+            {"response_mime_type": "application/json"},
+        )
+        mock_call.call_args.kwargs['on_completion'](Completion('{}', 40, 10))
+        flush_api_quota()
+        self.assertEqual(UserProfile.objects.get(user=self.owner).api_quota, 9_950)
+
+        resp = self.client.post(
+            reverse('container-suggest-personas', args=[self.container.id])
+        )
+        self.assertEqual(resp.data, {"suggestions": ["p"]})
+        resp = self.client.post(url, {}, format='json')
+        self.assertEqual(set(resp.data), {"questions", "personas"})
+        mock_call.assert_called_once()
+
+    @patch('dashboard.tasks.call_gemini')
+    def test_concurrent_miss_waits_for_the_call_in_flight(self, mock_call):
+        base = f"gemini:{self.container.id}"
+        bundle_key = f"{base}:suggest_bundle"
+        cache.add(f"{bundle_key}:lock", 1, 60)
+        entries = {
+            f"{base}:suggest_questions": {"suggestions": ["q"]},
+            f"{base}:suggest_personas": {"suggestions": ["p"]},
+        }
+
+        def finish_leader():
+            time.sleep(0.05)
+            cache.set(bundle_key, entries, 60)
+            cache.delete(f"{bundle_key}:lock")
+
+        threading.Thread(target=finish_leader).start()
+        url = reverse('container-suggest-bundle', args=[self.container.id])
+        resp = self.client.post(url, {}, format='json')
+        self.assertEqual(
+            resp.data,
+            {"questions": {"suggestions": ["q"]}, "personas": {"suggestions": ["p"]}},
+        )
+        mock_call.assert_not_called()
+        self.assertEqual(UserProfile.objects.get(user=self.owner).api_quota, 10_000)
+
+    @patch('dashboard.api_views.refresh_bundle_task.delay')
+    @patch('dashboard.tasks.call_gemini')
+    def test_stale_entries_are_served_and_refreshed_once(self, mock_call, mock_delay):
+        base = f"gemini:{self.container.id}"
+        stale = {"fresh_until": time.time() - 1}
+        cache.set(f"{base}:suggest_questions", {**stale, "value": {"suggestions": ["q"]}})
+        cache.set(f"{base}:suggest_personas", {**stale, "value": {"suggestions": ["p"]}})
+
+        url = reverse('container-suggest-bundle', args=[self.container.id])
+        for _ in range(2):
+            resp = self.client.post(url, {}, format='json')
+            self.assertEqual(resp.data["personas"], {"suggestions": ["p"]})
+        mock_call.assert_not_called()
+        mock_delay.assert_called_once()
+        user_id, keys, prompt = mock_delay.call_args.args
+        self.assertEqual(user_id, self.owner.id)
+        self.assertEqual(set(keys), {"questions", "personas"})
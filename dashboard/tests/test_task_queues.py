@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from dashboard import tasks
+from dashboard.task_queues import configure_worker
+
+
+class TestTaskQueues(SimpleTestCase):
+    def test_tasks_are_routed_with_queue_limits(self):
+        expected = {
+            tasks.chat_task: 'chat',
+            tasks.gemini_suggestion_task: 'suggestions',
+            tasks.refresh_suggestion_task: 'background',
+            tasks.refresh_bundle_task: 'background',
+            tasks.refresh_greeting_task: 'background',
+            tasks.flush_api_quota_task: 'background',
+        }
+        for task, queue in expected.items():
+            config = settings.AI_TASK_QUEUES[queue]
+            self.assertEqual(task.queue, queue)
+            self.assertEqual(task.soft_time_limit, config['soft_time_limit'])
+            self.assertEqual(task.time_limit, config['time_limit'])
+            self.assertEqual(task.acks_late, config['acks_late'])
+
+    def test_single_queue_worker_gets_queue_settings(self):
+        conf = SimpleNamespace(worker_concurrency=None, worker_prefetch_multiplier=4)
+        self.assertEqual(configure_worker(conf, 'chat'), 'chat')
+        config = settings.AI_TASK_QUEUES['chat']
+        self.assertEqual(conf.worker_concurrency, config['concurrency'])
+        self.assertEqual(conf.worker_prefetch_multiplier, config['prefetch_multiplier'])
+
+    def test_mixed_or_unknown_queues_keep_global_settings(self):
+        conf = SimpleNamespace(worker_concurrency=None, worker_prefetch_multiplier=4)
+        self.assertIsNone(configure_worker(conf, ['chat', 'suggestions']))
+        self.assertIsNone(configure_worker(conf, 'celery'))
+        self.assertIsNone(configure_worker(conf, None))
+        self.assertEqual(
+            vars(conf), {'worker_concurrency': None, 'worker_prefetch_multiplier': 4}
+        )
@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from celery import states
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from google.api_core import exceptions as google_exceptions
+from rest_framework.test import APITestCase
+
+from dashboard import task_retry
+from dashboard.circuit_breaker import CircuitOpenError
+from dashboard.models import Container
+from dashboard.rate_limit import RateLimitExceeded
+from dashboard.tasks import (
+    chat_task,
+    gemini_suggestion_task,
+    refresh_bundle_task,
+    refresh_suggestion_task,
+)
+
+
+class TestRetryPolicies(TestCase):
+    def test_policies_by_error_class(self):
+        self.assertIs(task_retry.policy_for(RateLimitExceeded('x')), task_retry.RATE_LIMITED)
+        self.assertIs(task_retry.policy_for(CircuitOpenError('x')), task_retry.CIRCUIT_OPEN)
+        self.assertIs(
+            task_retry.policy_for(google_exceptions.ServiceUnavailable('x')),
+            task_retry.TRANSIENT,
+        )
+        self.assertIsNone(task_retry.policy_for(ValueError('bad json')))
+
+    def test_countdown_backs_off_and_honours_retry_after(self):
+        policy = task_retry.RetryPolicy(max_retries=5, base=2, cap=60)
+        for retries in range(5):
+            self.assertTrue(2 <= policy.countdown(retries, Exception()) <= 2 * 2**retries)
+        self.assertEqual(policy.countdown(0, RateLimitExceeded('x', retry_after=9)), 9)
+
+    @patch.object(task_retry, 'RETRY_BUDGET_PER_MINUTE', 1)
+    def test_budget_limits_retries(self):
+        task = SimpleNamespace(request=SimpleNamespace(retries=0, id='t1'))
+        self.assertIsNotNone(task_retry.retry_countdown(task, TimeoutError()))
+        self.assertIsNone(task_retry.retry_countdown(task, TimeoutError()))
+
+
+class TestTaskRetries(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='u', password='p')
+        self.container = Container.objects.create(name='C', owner=self.user)
+
+    @patch('dashboard.tasks.call_gemini')
+    def test_suggestion_task_retries_transient_errors(self, mock_call):
+        mock_call.side_effect = [TimeoutError('slow'), '{"ok": true}']
+        result = gemini_suggestion_task.apply(args=(self.user.id, 'p'))
+        self.assertEqual(result.get(), {'ok': True})
+        self.assertEqual(mock_call.call_count, 2)
+        self.assertEqual(mock_call.call_args.kwargs['acquire_timeout'], 0)
+
+    @patch('dashboard.tasks.call_gemini')
+    def test_refresh_tasks_retry_through_celery(self, mock_call):
+        mock_call.side_effect = [TimeoutError('slow'), '{}', TimeoutError('slow'), '{}']
+        refresh_suggestion_task.apply(args=(self.user.id, 'k', 'p')).get()
+        keys = {'questions': 'q', 'personas': 'p'}
+        refresh_bundle_task.apply(args=(self.user.id, keys, 'p')).get()
+        self.assertEqual(mock_call.call_count, 4)
+        for call in mock_call.call_args_list:
+            self.assertEqual(call.kwargs['max_retries'], 1)
+            self.assertEqual(call.kwargs['acquire_timeout'], 0)
+            self.assertEqual(call.kwargs['cache_ttl'], 0)
+
+    @patch('dashboard.tasks.call_gemini', side_effect=ValueError('bad'))
+    def test_suggestion_task_does_not_retry_other_errors(self, mock_call):
+        result = gemini_suggestion_task.apply(args=(self.user.id, 'p'))
+        self.assertTrue(result.failed())
+        mock_call.assert_called_once()
+
+    @patch('dashboard.tasks.get_channel_layer')
+    @patch('dashboard.ai_service.genai.GenerativeModel')
+    def test_chat_task_retries_before_streaming(self, mock_model, mock_layer):
+        layer = mock_layer.return_value
+        layer.send = AsyncMock()
+        chat = mock_model.return_value.start_chat.return_value
+        chat.send_message.side_effect = [
+            google_exceptions.ServiceUnavailable('down'),
+            iter([SimpleNamespace(text='ok')]),
+        ]
+
+        result = chat_task.apply(
+            args=(self.user.id, self.container.id, 'hi', []),
+            kwargs={'stream_channel': 'chan'},
+            task_id='t1',
+        )
+
+        self.assertEqual(result.get(), {'reply': 'ok'})
+        events = [call.args[1]['type'] for call in layer.send.await_args_list]
+        self.assertEqual(events, ['chat.retrying', 'chat.chunk', 'chat.done'])
+
+
+class TestRetryStatus(APITestCase):
+    @patch('dashboard.task_status.AsyncResult')
+    def test_status_reports_next_attempt(self, mock_async):
+        mock_async.return_value = MagicMock(status=states.RETRY)
+        mock_async.return_value.successful.return_value = False
+        task = SimpleNamespace(request=SimpleNamespace(retries=0, id='abc'))
+        task_retry.retry_countdown(task, TimeoutError())
+        User.objects.create_user(username='u', password='p')
+        self.client.login(username='u', password='p')
+
+        resp = self.client.get(reverse('task-status', args=['abc']))
+
+        self.assertEqual(resp.data['status'], 'RETRY')
+        self.assertEqual(resp.data['attempt'], 2)
+        self.assertIsInstance(resp.data['next_attempt_at'], float)
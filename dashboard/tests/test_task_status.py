@@ -1,14 +1,19 @@
+import asyncio
+import json
+
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
 from rest_framework.test import APITestCase
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 
 class TestTaskStatus(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="u", password="p")
 
-    @patch('dashboard.api_views.AsyncResult')
+    @patch('dashboard.task_status.AsyncResult')
     def test_task_status_endpoint(self, mock_async):
         mock_result = MagicMock()
         mock_result.status = 'SUCCESS'
@@ -20,3 +25,134 @@ class TestTaskStatus(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['status'], 'SUCCESS')
         self.assertEqual(response.data['result'], {'data': 'ok'})
+
+
+class FakePubSub:
+    """Stands in for a Redis pub/sub connection that delivers ``messages``."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.channels = []
+
+    async def subscribe(self, channel):
+        self.channels.append(channel)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        if not self.messages:
+            await asyncio.sleep(timeout)
+            return None
+        return self.messages.pop(0)
+
+    async def aclose(self):
+        pass
+
+
+class TestTaskWait(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="u", password="p")
+        self.url = reverse('task-wait', args=['abc'])
+
+    def fake_redis(self, messages):
+        client = MagicMock(aclose=AsyncMock())
+        client.pubsub.return_value = FakePubSub(messages)
+        return patch('dashboard.task_status.redis.from_url', return_value=client)
+
+    def test_requires_login(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    @patch('dashboard.task_status.task_status')
+    def test_returns_finished_task_at_once(self, mock_status):
+        mock_status.return_value = {'status': 'SUCCESS', 'result': {'reply': 'hi'}}
+        self.client.login(username="u", password="p")
+        with self.fake_redis([]) as from_url:
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response.json(), {'status': 'SUCCESS', 'result': {'reply': 'hi'}}
+        )
+        channel = from_url.return_value.pubsub.return_value.channels[0]
+        self.assertTrue(channel.endswith(b'abc'))
+
+    @patch('dashboard.task_status.task_status')
+    def test_returns_when_task_publishes_a_state(self, mock_status):
+        mock_status.side_effect = [
+            {'status': 'PENDING'},
+            {'status': 'SUCCESS', 'result': {'reply': 'hi'}},
+        ]
+        self.client.login(username="u", password="p")
+        with self.fake_redis([None, {'type': 'message', 'data': b'{}'}]):
+            response = self.client.get(self.url, {'timeout': 5})
+        self.assertEqual(response.json()['status'], 'SUCCESS')
+        self.assertEqual(mock_status.call_count, 2)
+
+    @patch('dashboard.task_status.task_status')
+    def test_times_out_with_current_state(self, mock_status):
+        mock_status.return_value = {'status': 'PENDING'}
+        self.client.login(username="u", password="p")
+        with self.fake_redis([]):
+            response = self.client.get(self.url, {'timeout': 0.05})
+        self.assertEqual(response.json(), {'status': 'PENDING'})
+        self.assertEqual(mock_status.call_count, 1)
+
+
+class TestTaskBatchStatus(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="u", password="p")
+        self.url = reverse('task-batch-status')
+        self.client.login(username="u", password="p")
+        self.stored = {
+            'a': {'status': 'SUCCESS', 'result': {'reply': 'hi'}, 'date_done': 't1'},
+            'b': {'status': 'RETRY', 'result': None, 'date_done': 't2'},
+        }
+        patcher = patch('dashboard.task_status.current_app')
+        backend = patcher.start().backend
+        self.addCleanup(patcher.stop)
+        backend.get_key_for_task.side_effect = lambda task_id: f'meta-{task_id}'
+        backend.mget.side_effect = lambda keys: [
+            json.dumps(self.stored[key[5:]]) if key[5:] in self.stored else None
+            for key in keys
+        ]
+        backend.decode_result.side_effect = json.loads
+        self.backend = backend
+
+    def post(self, **data):
+        return self.client.post(self.url, data, format='json')
+
+    def test_reads_all_tasks_in_one_round_trip(self):
+        cache.set('tasks:retry:b', {'attempt': 2, 'next_attempt_at': 100.0})
+        response = self.post(ids=['a', 'b', 'c'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['tasks'],
+            {
+                'a': {'status': 'SUCCESS', 'result': {'reply': 'hi'}},
+                'b': {'status': 'RETRY', 'attempt': 2, 'next_attempt_at': 100.0},
+                'c': {'status': 'PENDING'},
+            },
+        )
+        self.backend.mget.assert_called_once_with(['meta-a', 'meta-b', 'meta-c'])
+
+    def test_marker_limits_response_to_changed_tasks(self):
+        marker = self.post(ids=['a', 'b', 'c']).data['marker']
+        unchanged = self.post(ids=['a', 'b', 'c'], marker=marker)
+        self.assertEqual(unchanged.data['tasks'], {})
+
+        self.stored['b'] = {
+            'status': 'SUCCESS', 'result': {'reply': 'ok'}, 'date_done': 't3'
+        }
+        response = self.post(ids=['a', 'b', 'c'], marker=marker)
+        self.assertEqual(
+            response.data['tasks'],
+            {'b': {'status': 'SUCCESS', 'result': {'reply': 'ok'}}},
+        )
+        self.assertEqual(
+            self.post(ids=['a', 'b'], marker=response.data['marker']).data['tasks'], {}
+        )
+
+    def test_invalid_marker_reports_every_task(self):
+        response = self.post(ids=['a'], marker='not a marker')
+        self.assertEqual(list(response.data['tasks']), ['a'])
+
+    def test_rejects_bad_ids(self):
+        self.assertEqual(self.post(ids='a').status_code, 400)
+        self.assertEqual(self.post(ids=[str(i) for i in range(101)]).status_code, 400)
@@ -1,5 +1,5 @@
 from rest_framework.throttling import BaseThrottle
-from .models import UserProfile
+from .utils import has_api_quota
 
 
 class UserProfileQuotaThrottle(BaseThrottle):
@@ -9,8 +9,4 @@ class UserProfileQuotaThrottle(BaseThrottle):
         user = getattr(request, "user", None)
         if not user or not user.is_authenticated:
             return True
-        try:
-            profile = UserProfile.objects.get(user=user)
-        except UserProfile.DoesNotExist:
-            return True
-        return profile.api_quota > 0
+        return has_api_quota(user)
@@ -1,11 +1,302 @@
+import contextlib
+import datetime
+import functools
+import math
+import operator
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .locks import LockTimeout, cache_lock
 from .models import UserProfile
 
+# Remaining quota is kept in cache counters so AI requests never query the
+# database for it.  ``quota:<user id>`` names the user's current quota window
+# and, under ``quota:<user id>:<window>``:
+#
+# * ``:used`` counts every token charged in the window,
+# * ``:flushed`` the part of them already subtracted from
+#   ``UserProfile.api_quota`` by flush_api_quota(),
+# * ``:base`` is ``api_quota`` plus ``:flushed`` when the counter was loaded,
+#   which a flush leaves unchanged, so the tokens left are ``base - used``.
+#
+# A charge is a single ``incr`` of ``:used``; what is left to save is always
+# ``used - flushed``.  Loads and flushes of a user hold ``quota:load:<user
+# id>`` so a load never sees a saved charge that is not yet counted as
+# flushed.
+DIRTY_KEY = "quota:dirty"
+FLUSH_BATCH_SIZE = 500
+LOAD_LOCK_TIMEOUT = 30
+# Charge counters outlive the longest window so they can still be flushed.
+PENDING_TTL = 33 * 86400
+
+
+class QuotaExceeded(Exception):
+    """Raised when a request is likely to cost more tokens than the user has left."""
+
+
+def estimate_tokens(*texts):
+    """Return a rough token count for ``texts`` (about four characters per token)."""
+    return sum(math.ceil(len(text) / 4) for text in texts if text)
+
+
+def _window_key(user_id):
+    return f"quota:{user_id}"
+
+
+def _base_key(user_id, window):
+    return f"quota:{user_id}:{window}:base"
+
+
+def _used_key(user_id, window):
+    return f"quota:{user_id}:{window}:used"
+
+
+def _flushed_key(user_id, window):
+    return f"quota:{user_id}:{window}:flushed"
+
+
+def _dirty_flag_key(user_id, window):
+    return f"quota:{user_id}:{window}:dirty"
+
+
+def _load_lock_key(user_id):
+    return f"quota:load:{user_id}"
+
+
+def quota_window(period, now=None):
+    """Return the ``(start, end)`` of the ``period`` quota window holding ``now``."""
+    now = timezone.localtime(now)
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "day":
+        return start, start + datetime.timedelta(days=1)
+    start = start.replace(day=1)
+    return start, (start + datetime.timedelta(days=32)).replace(day=1)
+
+
+def _load_quota(user_id):
+    """Load the user's counter for the current window and return the window.
+
+    A profile last used in an earlier window is reset to its allowance by
+    one conditional UPDATE, so users who never come back cost nothing.  A
+    profile with no window yet keeps its quota and starts the current one.
+    Returns ``None`` for users without a profile.
+    """
+    with cache_lock(_load_lock_key(user_id), LOAD_LOCK_TIMEOUT):
+        while True:
+            profile = (
+                UserProfile.objects.filter(user_id=user_id)
+                .values("api_quota", "quota_period", "quota_window_start")
+                .first()
+            )
+            if profile is None:
+                return None
+            start, end = quota_window(profile["quota_period"])
+            previous = profile["quota_window_start"]
+            if previous is not None and previous >= start:
+                break
+            # Only the first reader in the window wins; the others re-read.
+            UserProfile.objects.filter(
+                user_id=user_id, quota_window_start=previous
+            ).update(
+                api_quota=F("api_quota" if previous is None else "quota_allowance"),
+                quota_window_start=start,
+            )
+        window = int(start.timestamp())
+        ttl = max(int(end.timestamp() - time.time()), 1)
+        flushed = cache.get(_flushed_key(user_id, window)) or 0
+        # ``add`` keeps a counter another process loaded meanwhile.
+        cache.add(_base_key(user_id, window), profile["api_quota"] + flushed, ttl)
+        cache.set(_window_key(user_id), window, ttl)
+        return window
+
+
+def _current_window(user_id):
+    window = cache.get(_window_key(user_id))
+    if window is None:
+        window = _load_quota(user_id)
+    return window
+
+
+def _remaining_quota(user_id):
+    """Return the tokens the user has left, or ``None`` without a profile."""
+    window = _current_window(user_id)
+    if window is None:
+        return None
+    keys = [_base_key(user_id, window), _used_key(user_id, window)]
+    counters = cache.get_many(keys)
+    if keys[0] not in counters:
+        # Evicted on its own; load it again.
+        cache.delete(_window_key(user_id))
+        window = _load_quota(user_id)
+        if window is None:
+            return None
+        keys = [_base_key(user_id, window), _used_key(user_id, window)]
+        counters = cache.get_many(keys)
+    return counters.get(keys[0], 0) - counters.get(keys[1], 0)
 
-def decrement_api_quota(user):
+
+def forget_api_quota(user_id):
+    """Drop the cached counter so it is reloaded from ``UserProfile``."""
+    window = cache.get(_window_key(user_id))
+    cache.delete_many([_window_key(user_id), _base_key(user_id, window)])
+
+
+def _mark_dirty(entries):
+    with cache_lock(f"{DIRTY_KEY}:lock", 5):
+        cache.set(DIRTY_KEY, set(cache.get(DIRTY_KEY) or ()) | set(entries), None)
+
+
+def _take_dirty():
+    with cache_lock(f"{DIRTY_KEY}:lock", 5):
+        entries = set(cache.get(DIRTY_KEY) or ())
+        cache.delete(DIRTY_KEY)
+    return sorted(entries)
+
+
+def _unflushed(entries):
+    """Return ``{entry: tokens}`` for the charges of ``entries`` not yet saved."""
+    keys = {entry: (_used_key(*entry), _flushed_key(*entry)) for entry in entries}
+    counters = cache.get_many([key for pair in keys.values() for key in pair])
+    charges = {}
+    for entry, (used_key, flushed_key) in keys.items():
+        tokens = counters.get(used_key, 0) - counters.get(flushed_key, 0)
+        if tokens > 0:
+            charges[entry] = tokens
+    return charges
+
+
+def flush_api_quota():
+    """Save pending quota charges to ``UserProfile`` and return the users saved.
+
+    Each batch is one UPDATE; a charge is counted as flushed only after its
+    UPDATE commits, so charges are never lost or applied twice.  Users whose
+    counter is being loaded are skipped until the next run, and charges for
+    a window the profile has since left are dropped.
+    """
+    dirty = _take_dirty()
+    flushed = []
     try:
-        profile = UserProfile.objects.get(user=user)
-    except UserProfile.DoesNotExist:
+        for start in range(0, len(dirty), FLUSH_BATCH_SIZE):
+            batch = dirty[start : start + FLUSH_BATCH_SIZE]
+            with contextlib.ExitStack() as locks:
+                held = []
+                for entry in batch:
+                    try:
+                        locks.enter_context(
+                            cache_lock(
+                                _load_lock_key(entry[0]), LOAD_LOCK_TIMEOUT, wait=0
+                            )
+                        )
+                    except LockTimeout:
+                        continue
+                    held.append(entry)
+                # Charges made from here on mark their entry dirty again.
+                cache.delete_many([_dirty_flag_key(*entry) for entry in held])
+                charges = _unflushed(held)
+                if not charges:
+                    continue
+                matches = [
+                    Q(
+                        user_id=user_id,
+                        quota_window_start=datetime.datetime.fromtimestamp(
+                            window, datetime.timezone.utc
+                        ),
+                    )
+                    for user_id, window in charges
+                ]
+                with transaction.atomic():
+                    profiles = UserProfile.objects.filter(
+                        functools.reduce(operator.or_, matches)
+                    )
+                    profiles.update(
+                        api_quota=Greatest(
+                            F("api_quota")
+                            - Case(
+                                *(
+                                    When(match, then=Value(tokens))
+                                    for match, tokens in zip(matches, charges.values())
+                                ),
+                                default=Value(0),
+                                output_field=BigIntegerField(),
+                            ),
+                            0,
+                        )
+                    )
+                for entry, tokens in charges.items():
+                    cache.add(_flushed_key(*entry), 0, PENDING_TTL)
+                    cache.incr(_flushed_key(*entry), tokens)
+            flushed.extend(user_id for user_id, _ in charges)
+    finally:
+        # Users charged while this ran, skipped, or in batches that failed
+        # stay dirty.
+        retry = list(_unflushed(dirty))
+        if retry:
+            cache.set_many({_dirty_flag_key(*entry): 1 for entry in retry}, PENDING_TTL)
+            _mark_dirty(retry)
+    return flushed
+
+
+def history_texts(history):
+    """Return the message texts of a client-supplied chat ``history``."""
+    return [item.get("text", "") for item in history]
+
+
+def has_api_quota(user, tokens=1):
+    """Return ``True`` unless the user's profile has fewer than ``tokens`` left."""
+    remaining = _remaining_quota(user.pk)
+    return remaining is None or remaining >= tokens
+
+
+def check_api_quota(user, *prompt_texts):
+    """Raise :class:`QuotaExceeded` unless the user can afford the prompt.
+
+    The estimate covers the prompt texts plus ``AI_QUOTA_RESPONSE_ESTIMATE``
+    tokens for the reply.
+    """
+    needed = estimate_tokens(*prompt_texts) + settings.AI_QUOTA_RESPONSE_ESTIMATE
+    if not has_api_quota(user, needed):
+        raise QuotaExceeded(
+            f"API quota exhausted: this request needs about {needed} tokens"
+        )
+
+
+def usage_tokens(completion, *prompt_texts):
+    """Return the tokens to charge for ``completion``.
+
+    Uses the usage reported by the provider, falling back to an estimate
+    from the prompt and reply text when none was reported.
+    """
+    reported = completion.prompt_tokens + completion.response_tokens
+    return reported or estimate_tokens(*prompt_texts, completion.text)
+
+
+def charge_api_quota(user, tokens):
+    """Subtract ``tokens`` from the user's quota.
+
+    Only the cached counters change; :func:`flush_api_quota` saves the
+    charge to ``UserProfile`` later.
+    """
+    if tokens <= 0:
         return
-    if profile.api_quota > 0:
-        profile.api_quota -= 1
-        profile.save()
+    window = _current_window(user.pk)
+    if window is None:
+        return
+    used_key = _used_key(user.pk, window)
+    cache.add(used_key, 0, PENDING_TTL)
+    cache.incr(used_key, tokens)
+    # Only the first charge since the last flush marks the entry dirty.
+    if cache.add(_dirty_flag_key(user.pk, window), 1, PENDING_TTL):
+        _mark_dirty([(user.pk, window)])
+
+
+def quota_charger(user, *prompt_texts):
+    """Return an ``on_completion`` callback charging ``user`` for each AI call."""
+    return lambda completion: charge_api_quota(
+        user, usage_tokens(completion, *prompt_texts)
+    )
@@ -1,6 +1,8 @@
-from django.http import HttpRequest, HttpResponse
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, redirect
 
+from . import metrics
 from .ai import generate_greeting
 from .models import Container
 
@@ -45,3 +47,13 @@ def containers_list_view(request: HttpRequest) -> HttpResponse:
     containers = Container.objects.all()
     context = {"containers": containers}
     return render(request, 'dashboard/containers_list.html', context)
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Expose AI call metrics in the Prometheus text format to local scrapers."""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,8 @@
+"""Gunicorn configuration loaded automatically from the working directory."""
+
+
+def post_fork(server, worker):
+    """Rebuild the Gemini model registry in each freshly forked worker."""
+    from dashboard.ai_service import warm_up
+
+    warm_up()
@@ -13,19 +13,24 @@ import logging
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
-# Import your routing here, e.g. from myapp import routing
+from channels.security.websocket import AllowedHostsOriginValidator
 
 logger = logging.getLogger(__name__)
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portal.settings')
 
+# Django must be set up before importing consumers that touch the ORM.
+django_asgi_app = get_asgi_application()
+
+from dashboard import routing  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    # "websocket": AuthMiddlewareStack(
-    #     URLRouter(
-    #         # myapp.routing.websocket_urlpatterns
-    #     )
-    # ),
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(
+        AuthMiddlewareStack(
+            URLRouter(routing.websocket_urlpatterns)
+        )
+    ),
 })
 
 logger.info("ASGI application configured")
@@ -1,6 +1,7 @@
 import os
 import logging
 from celery import Celery
+from celery.signals import celeryd_init, worker_process_init
 
 logger = logging.getLogger(__name__)
 
@@ -11,4 +12,23 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 logger.info("Celery app configured")
 
+
+@celeryd_init.connect
+def configure_queue_worker(conf=None, options=None, **kwargs):
+    """Use the concurrency and prefetch of the one AI queue a worker serves."""
+    from dashboard.task_queues import configure_worker
+
+    queue = configure_worker(conf, (options or {}).get("queues"))
+    if queue:
+        logger.info("Worker configured for the %s queue", queue)
+
+
+@worker_process_init.connect
+def warm_up_ai_models(**kwargs):
+    """Rebuild the Gemini model registry in each freshly forked worker."""
+    from dashboard.ai_service import warm_up
+
+    warm_up()
+
+
 __all__ = ('app',)
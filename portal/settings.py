@@ -168,6 +168,41 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Cache shared by all web and worker processes. Point CACHE_URL at Redis in
+# production so locks and cached AI results are visible fleet-wide.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Soft and hard TTLs (seconds) for cached AI output. Past the soft TTL the stale
+# value is served immediately while a Celery task refreshes it; only entries
+# past the hard TTL make a request wait for Gemini.
+AI_SUGGESTION_SOFT_TTL = env.int('AI_SUGGESTION_SOFT_TTL', default=300)
+AI_SUGGESTION_HARD_TTL = env.int('AI_SUGGESTION_HARD_TTL', default=86400)
+AI_GREETING_SOFT_TTL = env.int('AI_GREETING_SOFT_TTL', default=3600)
+AI_GREETING_HARD_TTL = env.int('AI_GREETING_HARD_TTL', default=604800)
+
+# Reply tokens assumed when checking a request against the user's token quota
+# before calling the model.
+AI_QUOTA_RESPONSE_ESTIMATE = env.int('AI_QUOTA_RESPONSE_ESTIMATE', default=512)
+
+# Token budget for the chat history sent with each message, with per-model
+# overrides ("gemini-2.5-pro=16000;gemini-2.5-flash=8000"). Older turns are
+# replaced by a cached rolling summary of up to AI_CHAT_SUMMARY_TOKENS tokens
+# written by AI_CHAT_SUMMARY_MODEL.
+AI_CHAT_HISTORY_TOKENS = env.int('AI_CHAT_HISTORY_TOKENS', default=4000)
+AI_CHAT_HISTORY_TOKENS_BY_MODEL = env.dict(
+    'AI_CHAT_HISTORY_TOKENS_BY_MODEL', cast={'value': int}, default={}
+)
+AI_CHAT_SUMMARY_TOKENS = env.int('AI_CHAT_SUMMARY_TOKENS', default=400)
+AI_CHAT_SUMMARY_MODEL = env.str('AI_CHAT_SUMMARY_MODEL', default='gemini-2.5-flash')
+AI_CHAT_SUMMARY_TTL = env.int('AI_CHAT_SUMMARY_TTL', default=86400)
+# Seconds during which a repeated chat submission reuses the first chat task
+AI_CHAT_IDEMPOTENCY_TTL = env.int('AI_CHAT_IDEMPOTENCY_TTL', default=120)
+
+# Addresses allowed to scrape /metrics/ (Prometheus text format)
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+
 # Channels settings for WebSockets
 CHANNEL_LAYERS = {
     "default": {
@@ -184,6 +219,65 @@ CELERY_RESULT_BACKEND = env.str('REDIS_URL')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Tasks without a queue of their own run with the background jobs.
+CELERY_TASK_DEFAULT_QUEUE = 'background'
+CELERY_BEAT_SCHEDULE = {
+    'flush-api-quota': {
+        'task': 'dashboard.tasks.flush_api_quota_task',
+        'schedule': env.int('AI_QUOTA_FLUSH_SECONDS', default=30),
+    },
+    'dispatch-chat-tasks': {
+        'task': 'dashboard.tasks.dispatch_chat_tasks_task',
+        'schedule': 60,
+    },
+}
+
+# Limits for the AI task queues (see dashboard.task_queues).  Run one worker
+# per queue, e.g. ``celery -A portal worker -Q chat``, so each gets its own
+# concurrency and prefetch multiplier.
+AI_TASK_QUEUES = {
+    'chat': {
+        'concurrency': env.int('CELERY_CHAT_CONCURRENCY', default=16),
+        'prefetch_multiplier': env.int('CELERY_CHAT_PREFETCH_MULTIPLIER', default=1),
+        'soft_time_limit': env.int('CELERY_CHAT_SOFT_TIME_LIMIT', default=120),
+        'time_limit': env.int('CELERY_CHAT_TIME_LIMIT', default=150),
+        # Redelivering a chat that already streamed would show the reply twice.
+        'acks_late': env.bool('CELERY_CHAT_ACKS_LATE', default=False),
+    },
+    'suggestions': {
+        'concurrency': env.int('CELERY_SUGGESTIONS_CONCURRENCY', default=8),
+        'prefetch_multiplier': env.int(
+            'CELERY_SUGGESTIONS_PREFETCH_MULTIPLIER', default=4
+        ),
+        'soft_time_limit': env.int('CELERY_SUGGESTIONS_SOFT_TIME_LIMIT', default=30),
+        'time_limit': env.int('CELERY_SUGGESTIONS_TIME_LIMIT', default=45),
+        'acks_late': env.bool('CELERY_SUGGESTIONS_ACKS_LATE', default=True),
+    },
+    'background': {
+        'concurrency': env.int('CELERY_BACKGROUND_CONCURRENCY', default=2),
+        'prefetch_multiplier': env.int(
+            'CELERY_BACKGROUND_PREFETCH_MULTIPLIER', default=4
+        ),
+        'soft_time_limit': env.int('CELERY_BACKGROUND_SOFT_TIME_LIMIT', default=120),
+        'time_limit': env.int('CELERY_BACKGROUND_TIME_LIMIT', default=180),
+        'acks_late': env.bool('CELERY_BACKGROUND_ACKS_LATE', default=True),
+    },
+}
+
+# Fair-share chat dispatch (see dashboard.fair_share): caps on chat tasks in
+# flight overall, per user and per container, on the tasks a user may have
+# waiting, and per-username weights.
+AI_CHAT_MAX_IN_FLIGHT = env.int(
+    'AI_CHAT_MAX_IN_FLIGHT', default=2 * AI_TASK_QUEUES['chat']['concurrency']
+)
+AI_CHAT_MAX_IN_FLIGHT_PER_USER = env.int('AI_CHAT_MAX_IN_FLIGHT_PER_USER', default=4)
+AI_CHAT_MAX_IN_FLIGHT_PER_CONTAINER = env.int(
+    'AI_CHAT_MAX_IN_FLIGHT_PER_CONTAINER', default=8
+)
+AI_CHAT_MAX_QUEUED_PER_USER = env.int('AI_CHAT_MAX_QUEUED_PER_USER', default=20)
+AI_CHAT_FAIR_SHARE_WEIGHTS = env.dict(
+    'AI_CHAT_FAIR_SHARE_WEIGHTS', cast={'value': int}, default={}
+)
 
 # Microsoft Authentication Settings
 MS_CLIENT_ID = env.str('MS_CLIENT_ID', default=None)
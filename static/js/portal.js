@@ -42,6 +42,7 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentRunningFunction = null;
     
     const chatHistories = {}; // Key: containerId
+    const conversationIds = {}; // Key: containerId, value: server-side conversation id
 
 
     // --- Header Elements ---
@@ -462,8 +463,9 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!container) return [];
         
         try {
-            const response = await api(`/api/containers/${container.id}/suggest_${suggestionType}/`, { method: 'POST' });
-            return response.suggestions || [];
+            // One bundled call warms both the question and persona caches.
+            const response = await api(`/api/containers/${container.id}/suggest_bundle/`, { method: 'POST' });
+            return response[suggestionType]?.suggestions || [];
         } catch (error) {
             console.error(`Error generating ${suggestionType}:`, error);
             alert(`Sorry, I couldn't generate suggestions. Please try again.`);
@@ -489,6 +491,58 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
     // --- Chat Logic ---
+    // Streams the reply over the container's WebSocket, calling onChunk with the
+    // text received so far. Resolves with the full reply.
+    const streamChat = (containerId, payload, onChunk) => new Promise((resolve, reject) => {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/containers/${containerId}/chat/`);
+        let text = '';
+        let queued = false;
+        let settled = false;
+        const finish = (fn, value) => {
+            if (settled) return;
+            settled = true;
+            socket.close();
+            fn(value);
+        };
+        socket.addEventListener('open', () => socket.send(JSON.stringify(payload)));
+        socket.addEventListener('message', (e) => {
+            const event = JSON.parse(e.data);
+            if (event.type === 'queued') {
+                queued = true;
+                conversationIds[containerId] = event.conversation;
+            } else if (event.type === 'chunk') {
+                text += event.text;
+                onChunk(text);
+            } else if (event.type === 'done') {
+                finish(resolve, event.reply);
+            } else if (event.type === 'error') {
+                finish(reject, new Error(event.error));
+            }
+        });
+        // Only a connection that failed before the task was queued can safely
+        // be retried over HTTP; anything later would run the chat twice.
+        const lost = () => finish(reject, Object.assign(new Error('WebSocket closed'), { fallback: !queued }));
+        socket.addEventListener('error', lost);
+        socket.addEventListener('close', lost);
+    });
+
+    // Fallback for servers without WebSocket support: queue the task over HTTP
+    // and long-poll its status; each request returns as soon as the task
+    // stores a new state.
+    const pollChat = async (containerId, payload) => {
+        const { task_id, conversation } = await api(`/api/containers/${containerId}/chat/`, {
+            method: 'POST',
+            body: JSON.stringify(payload)
+        });
+        conversationIds[containerId] = conversation;
+        for (;;) {
+            const task = await api(`/api/tasks/${task_id}/wait/`);
+            if (task.status === 'SUCCESS') return task.result.reply;
+            if (task.status === 'FAILURE') throw new Error('Chat task failed');
+        }
+    };
+
     const handleSendMessage = async (containerId, message) => {
         const container = containers.find(c => c.id === containerId);
         if(!container) return;
@@ -500,24 +554,44 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         const thinkingIndicator = addMessageToUI('', 'bot', true);
+        const prompt = message || "Describe the attached file.";
+        // The server keeps the history of a known conversation; a new one is
+        // seeded with any local history (without the current user message).
+        // A retry of this message reuses the key, so the server queues it once.
+        const conversation = conversationIds[containerId];
+        const payload = conversation
+            ? { message: prompt, conversation }
+            : { message: prompt, history: chatHistories[containerId].slice(0, -1) };
+        payload.idempotency_key = crypto.randomUUID();
+        let streamingMessage = null;
+        const onChunk = (text) => {
+            if (!streamingMessage) {
+                thinkingIndicator.remove();
+                streamingMessage = addMessageToUI('', 'bot');
+            }
+            streamingMessage.innerHTML = markdownToHtml(text);
+            chatMessagesContainer.scrollTop = chatMessagesContainer.scrollHeight;
+        };
 
         try {
-            const response = await api(`/api/containers/${containerId}/chat/`, {
-                method: 'POST',
-                body: JSON.stringify({
-                    message: message || "Describe the attached file.",
-                    history: chatHistories[containerId].slice(0, -1) // Send history *without* the current user message
-                })
-            });
-            const botResponseText = response.reply;
+            let botResponseText;
+            try {
+                botResponseText = await streamChat(containerId, payload, onChunk);
+            } catch (error) {
+                if (!error.fallback) throw error;
+                console.warn("Streaming unavailable, polling instead:", error);
+                botResponseText = await pollChat(containerId, payload);
+            }
             chatHistories[containerId].push({ role: 'model', text: botResponseText });
-            
+
             thinkingIndicator.remove();
+            streamingMessage?.remove();
             addMessageToUI(botResponseText, 'bot');
 
         } catch (error) {
             console.error("API Error:", error);
             thinkingIndicator.remove();
+            streamingMessage?.remove();
             addMessageToUI("Sorry, I encountered an error communicating with the AI. Please check the server logs.", 'bot');
         }
     };